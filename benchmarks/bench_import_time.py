@@ -0,0 +1,54 @@
+# cold start cost of loading datasources - every sample runs in a fresh interpreter
+# run from the project root: python -m benchmarks.bench_import_time --sources bestbuy
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# interpreter startup is measured separately so only the datasource loading is compared
+SNIPPET = """
+import time
+start = time.perf_counter()
+from src.datasources.registry import SourceRegistry
+loaded = SourceRegistry.load({sources!r})
+assert set(loaded) == set({sources!r}), f"could not load {{set({sources!r}) - set(loaded)}}"
+print(time.perf_counter() - start)
+"""
+
+
+def sample(sources: list[str]) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(sources=sources)],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    from src.datasources.registry import MANIFEST
+
+    parser = argparse.ArgumentParser(description="Measure datasource import time for a watchlist vs loading every source")
+    parser.add_argument("--sources", default="bestbuy", help="comma separated sources the watchlist uses")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = {
+        "watchlist": [s.strip() for s in args.sources.split(",") if s.strip()],
+        "all": sorted(MANIFEST),
+    }
+
+    for name, sources in cases.items():
+        try:
+            times = [sample(sources) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"  {name:<10} failed: {e.stderr.strip().splitlines()[-1]}")
+            continue
+
+        print(f"  {name:<10} {statistics.median(times) * 1000:8.1f}ms median  {min(times) * 1000:8.1f}ms min  ({', '.join(sources)})")
+
+
+if __name__ == "__main__":
+    main()
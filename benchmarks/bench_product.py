@@ -0,0 +1,102 @@
+# Product construction, pickling, binary encoding and memory per instance
+# compares the slotted frozen Product against the plain dataclass it replaced
+# run from the project root: python -m benchmarks.bench_product --count 100000
+import argparse
+import gc
+import pickle
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from src.schema import Product
+
+
+# the old schema.Product, kept here as the baseline
+@dataclass
+class DictProduct:
+    identifier: str
+    product_name: str
+    in_stock: bool
+    on_sale: bool
+    sale_price: float
+    regular_price: float
+    product_url: str
+    retailer_name: str
+    retailer_logo: str
+
+    @property
+    def dollar_savings(self) -> float:
+        if not self.on_sale:
+            return 0.0
+        return self.regular_price - self.sale_price
+
+    @property
+    def percent_savings(self) -> float:
+        if not self.on_sale or self.regular_price == 0:
+            return 0.0
+        return round(self.dollar_savings / self.regular_price * 100, 1)
+
+
+# strings are shared between instances (as they mostly are for real products) so only the objects are measured
+NAME = "Lenovo Legion Go 2 handheld"
+URL = "https://www.bestbuy.com/site/6643145.p"
+RETAILER = "Best Buy"
+LOGO = "https://upload.wikimedia.org/wikipedia/commons/f/f5/Best_Buy_Logo.svg"
+IDENTIFIERS = [str(6_000_000 + i) for i in range(1_000_000)]
+
+
+def build(cls, n):
+    return [cls(IDENTIFIERS[i], NAME, True, i % 3 == 0, 899.99 - i % 100, 999.99, URL, RETAILER, LOGO) for i in range(n)]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def bytes_per_instance(cls, n):
+    gc.collect()
+    tracemalloc.start()
+    products = build(cls, n)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del products
+    return size / n
+
+
+def bench(cls, n):
+    rows = {}
+
+    rows["construct"], products = timed(lambda: build(cls, n))
+    rows["savings x10"], _ = timed(lambda: [p.percent_savings + p.dollar_savings for _ in range(10) for p in products])
+    rows["pickle dumps"], blob = timed(lambda: pickle.dumps(products, protocol=pickle.HIGHEST_PROTOCOL))
+    rows["pickle loads"], _ = timed(lambda: pickle.loads(blob))
+
+    if hasattr(cls, "encode"):
+        rows["encode"], encoded = timed(lambda: [p.encode() for p in products])
+        rows["decode"], _ = timed(lambda: [cls.decode(b) for b in encoded])
+        extra = f", encoded {sum(map(len, encoded)) / n:.0f} B/product"
+    else:
+        extra = ""
+
+    del products
+    memory = bytes_per_instance(cls, n)
+
+    print(f"{cls.__name__}: {memory:.0f} B/instance, pickled {len(blob) / n:.0f} B/product{extra}")
+    for name, elapsed in rows.items():
+        print(f"  {name:<14} {elapsed * 1000:9.1f}ms  {elapsed / n * 1e9:8.0f}ns per product")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Product representation")
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{args.count} products")
+    for cls in (DictProduct, Product):
+        bench(cls, args.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# offline replay of the recorded payloads in src/data and the synthetic pages in benchmarks/fixtures/synthetic
+# no network, no browser, no ntfy. every fixture goes through its datasource's real fetch_product with only
+# fetch_raw swapped for the fixture (retry policy, payload digest, parse), then the parsed products go through
+# the result pipeline (snapshot diff, notification rendering, outbox, price history)
+# reports throughput, p50 / p99 latency and peak memory per stage and fails when a stage regressed
+# against the stored baseline (benchmarks/baseline.json, machine specific so not committed)
+# run from the project root: python -m benchmarks.bench_replay [--update-baseline]
+import argparse
+import dataclasses
+import functools
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+# every fixture is replayed over and over, so the fetch cache would call all but the first one unchanged and
+# skip the parse. rate limits and retry backoff would only time sleeps. all read when src is imported
+os.environ.update(FETCH_CACHE="0", RATE_LIMIT="0", RETRY_BASE_DELAY="0")
+
+from src import db  # noqa: E402
+
+# the retry budget / circuit breaker rows fetch_product writes go to a throwaway db, so the bench neither
+# touches state/notifier.db nor skips fixtures because a real run left a breaker open. must be set before the
+# rest of src is imported, the default db paths are bound then
+_STATE_DIR = tempfile.TemporaryDirectory(prefix="bench-replay-")
+db.DB_FILE = Path(_STATE_DIR.name) / "notifier.db"
+
+from src.datasources.registry import SourceRegistry  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / "src" / "data"
+SYNTHETIC_DIR = Path(__file__).resolve().parent / "fixtures" / "synthetic"  # see make_synthetic_fixtures.py
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_TOLERANCE = 0.25  # allowed slowdown / growth before a stage counts as regressed
+COMMIT_EVERY = 50  # pipeline commits once per this many handled products, like a sweep batch
+
+
+class _Response:
+    """the parts of requests.Response that bestbuy's fetch_product reads"""
+    ok = True
+    status_code = 200
+    reason = "OK"
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.content)
+
+
+# stand ins for each source's fetch_raw: identifier -> what the real one returns for that fixture
+# (async for the browser sources, like the real ones)
+def _bestbuy_raw(payloads: dict, identifier: str):
+    return _Response(payloads[identifier].encode("utf-8"))
+
+
+def _amazon_raw(payloads: dict, identifier: str):
+    return json.loads(payloads[identifier])  # the sidecar hands back amazon-buddy's decoded output
+
+
+async def _lenovo_raw(payloads: dict, identifier: str):
+    return SimpleNamespace(success=True, html=payloads[identifier], error_message=None)  # crawl4ai CrawlResult
+
+
+async def _bhvideo_raw(payloads: dict, identifier: str):
+    from src.datasources.bhvideo import _extract_page
+    return _extract_page(payloads[identifier])  # what _fetch_page does with the crawled html, None if challenged
+
+
+REPLAYS = {  # source name -> (fixture suffix, fake fetch_raw, identifier for a fixture stem)
+    "bestbuy": (".json", _bestbuy_raw, "{}"),
+    "amazon": (".json", _amazon_raw, "{}"),
+    "lenovo": (".html", _lenovo_raw, "https://www.lenovo.com/us/en/p/{}"),
+    "bhvideo": (".html", _bhvideo_raw, "https://www.bhphotovideo.com/c/product/{}"),
+}
+
+
+@dataclasses.dataclass
+class Stats:
+    calls: int
+    throughput: float  # calls per second
+    p50_us: float
+    p99_us: float
+    peak_kb: float
+
+    def regressions(self, base: "Stats", tolerance: float) -> list[str]:
+        found = []
+        if self.throughput < base.throughput * (1 - tolerance):
+            found.append(f"throughput {self.throughput:,.0f}/s vs {base.throughput:,.0f}/s (-{tolerance:.0%} allowed)")
+        # tail latency is noisy on a busy machine, so it gets twice the slack
+        for name, slack in (("p50_us", tolerance), ("p99_us", tolerance * 2), ("peak_kb", tolerance)):
+            now, before = getattr(self, name), getattr(base, name)
+            if now > before * (1 + slack):
+                found.append(f"{name} {now:,.1f} vs {before:,.1f} (+{slack:.0%} allowed)")
+        return found
+
+
+def measure(fn, inputs: list, iterations: int) -> Stats:
+    """time fn over inputs round robin, then one untimed pass under tracemalloc for the peak memory"""
+    for value in inputs:  # warm up regex / json / sqlite caches so the first run isnt always the slowest
+        fn(value)
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter_ns()
+        fn(inputs[i % len(inputs)])
+        latencies.append(time.perf_counter_ns() - t)
+    elapsed = time.perf_counter() - start
+
+    # tracing slows everything down, so memory gets its own pass
+    tracemalloc.start()
+    for value in inputs:
+        fn(value)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return Stats(iterations, iterations / elapsed, cuts[49] / 1000, cuts[98] / 1000, peak / 1024)
+
+
+def load_fixtures(name: str) -> list[tuple[str, str]]:
+    """(stem, text) for name's recorded fixtures, then its synthetic ones"""
+    suffix = REPLAYS[name][0]
+    paths = [path for folder in (FIXTURES_DIR, SYNTHETIC_DIR) for path in sorted((folder / name).glob(f"*{suffix}"))]
+    return [(path.stem, path.read_text(encoding="utf-8")) for path in paths]
+
+
+def bench_source(name: str, iterations: int):
+    """Stats for fetch_product over name's fixtures plus the products they parsed into, None if it cant be imported"""
+    _, fake_raw, identifier_format = REPLAYS[name]
+    try:
+        source = SourceRegistry.get(name)
+    except (ImportError, KeyError) as e:
+        print(f"{name}: skipped, datasource could not be loaded ({e})")
+        return None, []
+
+    fixtures = load_fixtures(name)
+    if not fixtures:
+        print(f"{name}: skipped, no fixtures in {FIXTURES_DIR / name} or {SYNTHETIC_DIR / name}")
+        return None, []
+
+    payloads = {identifier_format.format(stem): raw for stem, raw in fixtures}
+    # the instance attribute shadows the real fetch_raw, everything around it is the shipped code path
+    source.fetch_raw = functools.partial(fake_raw, payloads)
+    source.retry_attempts = 1  # a blocked fixture stays blocked, retrying would just time the same page twice
+
+    identifiers = list(payloads)
+    products = [source.fetch_product(identifier) for identifier in identifiers]
+    blocked = sum(p is None for p in products)
+    print(f"{name}: {len(fixtures)} fixture(s), {blocked} blocked")
+
+    stats = measure(source.fetch_product, identifiers, iterations)
+    return stats, [(name, p) for p in products if p is not None]
+
+
+def bench_pipeline(products: list, iterations: int) -> Stats:
+    """ResultProcessor.handle over the replayed products, alternating prices so transitions keep firing"""
+    from src.notify_dispatcher import NotificationDispatcher
+    from src.outbox import Outbox
+    from src.pipeline import ResultProcessor
+    from src.price_history import PriceHistory
+    from src.scheduler import Job
+    from src.state_store import StateStore
+    from src.watchlist import compile_watchlist
+
+    # every product watched twice: once with a max price it meets, once in stock only
+    raw_watchlist = []
+    for name, product in products:
+        price = product.sale_price or product.regular_price or 1.0
+        raw_watchlist.append({"identifiers": {name: product.identifier}, "user_max_price": price * 2,
+                              "ntfy_topic": "https://ntfy.sh/bench-replay"})
+        raw_watchlist.append({"identifiers": {name: product.identifier}, "user_max_price": None,
+                              "ntfy_topic": "https://ntfy.sh/bench-replay-stock"})
+    watchlist = compile_watchlist(raw_watchlist)
+
+    inputs = []
+    for name, product in products:
+        for drop in (0.0, 1.0):
+            variant = product if not drop or product.sale_price is None else \
+                dataclasses.replace(product, sale_price=product.sale_price - drop, on_sale=True)
+            identifier = product.identifier
+            inputs.append((Job(name, (identifier,)), {identifier: variant}))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = Path(tmp) / "notifier.db"
+        outbox = Outbox(db_file)  # messages are queued but nothing sends them
+        processor = ResultProcessor(watchlist, StateStore(db_file), PriceHistory(Path(tmp) / "history"),
+                                    NotificationDispatcher(outbox, sender=None))
+        handled = 0
+
+        def step(args):
+            nonlocal handled
+            processor.handle(*args)
+            handled += 1
+            if handled % COMMIT_EVERY == 0:
+                processor.commit()
+
+        stats = measure(step, inputs, iterations)
+        processor.commit()
+        processor.state_store._conn.close()
+        outbox._conn.close()
+
+    return stats
+
+
+def print_table(results: dict[str, Stats], baseline: dict[str, Stats]):
+    width = max(map(len, results), default=10)
+    print(f"\n{'stage':<{width}} {'calls':>7} {'per sec':>10} {'p50 us':>9} {'p99 us':>9} {'peak KB':>9}  vs baseline")
+    for stage, stats in results.items():
+        base = baseline.get(stage)
+        delta = f"{(base.p50_us and stats.p50_us / base.p50_us - 1) * 100:+.0f}% p50" if base else "-"
+        print(f"{stage:<{width}} {stats.calls:>7} {stats.throughput:>10,.0f} {stats.p50_us:>9,.1f} "
+              f"{stats.p99_us:>9,.1f} {stats.peak_kb:>9,.1f}  {delta}")
+
+
+def read_baseline(path: Path) -> dict[str, Stats]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    return {stage: Stats(**values) for stage, values in data.items()}
+
+
+def write_baseline(path: Path, results: dict[str, Stats]):
+    path.write_text(json.dumps({stage: dataclasses.asdict(s) for stage, s in results.items()}, indent=2) + "\n",
+                    encoding="utf-8")
+    print(f"\nBaseline written to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the fixtures through fetch_product + pipeline")
+    parser.add_argument("--sources", nargs="*", default=list(REPLAYS), choices=list(REPLAYS))
+    parser.add_argument("--iterations", type=int, default=2000, help="timed calls per stage")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # blocked fixtures would log a warning on every replay
+
+    results = {}
+    products = []
+    for name in args.sources:
+        stats, parsed = bench_source(name, args.iterations)
+        if stats is not None:
+            results[name] = stats
+            products.extend(parsed)
+
+    if products:
+        # the pipeline works on whatever the sources produced, so a partial run is its own stage
+        names = sorted({name for name, _ in products})
+        stage = "pipeline" if names == sorted(REPLAYS) else f"pipeline:{'+'.join(names)}"
+        results[stage] = bench_pipeline(products, args.iterations)
+
+    baseline = read_baseline(args.baseline)
+    print_table(results, baseline)
+
+    if args.update_baseline or not baseline:
+        write_baseline(args.baseline, results)
+        return 0
+
+    regressed = False
+    for stage, stats in results.items():
+        if stage not in baseline:
+            continue
+        for problem in stats.regressions(baseline[stage], args.tolerance):
+            print(f"REGRESSION {stage}: {problem}")
+            regressed = True
+
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
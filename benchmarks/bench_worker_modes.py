@@ -0,0 +1,78 @@
+# compare spawn-per-identifier against the long lived worker pool
+# run from the project root: python -m benchmarks.bench_worker_modes --identifiers 200
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from logging.handlers import QueueListener
+
+from src.datasources.registry import SourceRegistry
+from src.log_handler import init_child_logger
+from src.metrics import get_metrics
+from src.scheduler import Job, SpawnExecutor, SweepScheduler
+from src.worker_pool import fetch_identifiers, make_pool
+
+NULL_SOURCE_MODULE = "benchmarks.null_source"
+
+
+# same per process setup as main._process_identifier, but against the null datasource
+def _spawn_fetch(log_queue, src_name, identifiers):
+    logger = init_child_logger(log_queue, f"bench.{src_name}.{','.join(identifiers)}")
+    SourceRegistry.set_logger(logger)
+    SourceRegistry.declare("null", NULL_SOURCE_MODULE)
+
+    return SourceRegistry.get(src_name).fetch_products(identifiers), get_metrics().snapshot()
+
+
+def run(mode, n, workers, max_tasks_per_child):
+    log_queue = multiprocessing.get_context("spawn").Queue()
+    listener = QueueListener(log_queue, logging.NullHandler())
+    listener.start()
+
+    jobs = [Job("null", (str(i),)) for i in range(n)]
+    results = []
+
+    start = time.perf_counter()
+
+    if mode == "spawn":
+        executor = SpawnExecutor()
+        submit = lambda job: executor.submit(_spawn_fetch, log_queue, job.src_name, job.identifiers)  # noqa: E731
+    else:
+        executor = make_pool(log_queue, {"null": NULL_SOURCE_MODULE}, workers, max_tasks_per_child)
+        submit = lambda job: executor.submit(fetch_identifiers, job.src_name, job.identifiers)  # noqa: E731
+
+    try:
+        SweepScheduler({}, workers, workers).run(jobs, submit, lambda job, result: results.extend(result[0].values()))
+    finally:
+        executor.shutdown()
+        listener.stop()
+
+    elapsed = time.perf_counter() - start
+    assert len(results) == n and all(p is not None for p in results)
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare spawn-per-identifier against the worker pool")
+    parser.add_argument("--identifiers", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-tasks-per-child", type=int, default=50)
+    parser.add_argument("--imports", default="",
+                        help="comma separated modules the null datasource imports, EG: requests,crawl4ai")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated network latency per fetch (seconds)")
+    args = parser.parse_args()
+
+    os.environ["BENCH_NULL_SOURCE_IMPORTS"] = args.imports
+    os.environ["BENCH_NULL_SOURCE_LATENCY"] = str(args.latency)
+
+    print(f"{args.identifiers} identifiers, {args.workers} workers, imports={args.imports or '-'}, latency={args.latency}s")
+
+    for mode in ("spawn", "pool"):
+        elapsed = run(mode, args.identifiers, args.workers, args.max_tasks_per_child)
+        print(f"  {mode:<6} {elapsed:8.3f}s total  {elapsed / args.identifiers * 1000:8.2f}ms per identifier")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# writes the synthetic lenovo / b&h pages in benchmarks/fixtures/synthetic - there are no recorded pages for
+# the browser sources, so these are shaped like the real ones instead: json-ld, a price widget, the injected
+# x-scraper-data tag the in page scripts leave behind, and a few hundred KB of tracking scripts, menus and
+# specs around them so parse times are in the right ballpark. seeded, so reruns give the same files
+# run from the project root: python -m benchmarks.make_synthetic_fixtures
+import json
+import random
+from pathlib import Path
+
+SYNTHETIC_DIR = Path(__file__).resolve().parent / "fixtures" / "synthetic"
+SEED = 7
+
+WORDS = "handheld gaming display battery storage memory graphics warranty shipping returns accessories controller".split()
+
+TRACKING = "\n".join(f'<script src="https://www.googletagmanager.com/gtm.js?id=GTM-{i}" async></script>' for i in range(6))
+BIG_JS = "<script>window.__INITIAL_STATE__ = " + json.dumps(
+    {"items": [{"id": i, "name": f"item {i}", "price": i * 1.5} for i in range(3000)]}) + ";</script>"
+BREADCRUMBS = json.dumps({"@context": "https://schema.org", "@type": "BreadcrumbList", "itemListElement": []})
+
+CHALLENGE = """<!DOCTYPE html><html lang="en-US"><head><title>Just a moment...</title>
+<meta http-equiv="refresh" content="390"><script src="https://challenges.cloudflare.com/turnstile/v0/api.js" async defer></script></head>
+<body><div class="main-wrapper" role="main"><div class="main-content"><h1 class="zone-name-title h1">www.bhphotovideo.com</h1>
+<h2 class="h2" id="challenge-running">Checking if the site connection is secure</h2><noscript>Enable JavaScript and cookies to continue</noscript></div></div>
+<script type="text/x-scraper-data">{"product":null,"pricing":""}</script></body></html>
+"""
+
+
+def filler(rng: random.Random, blocks: int, tag: str = "div") -> str:
+    """menu / listing markup that parsers have to skip over"""
+    out = []
+    for i in range(blocks):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30)))
+        out.append(f'<{tag} class="c-{i % 17}" data-track="t{i}"><a href="/us/en/p/item-{i}">{text}</a>'
+                   f'<span>${rng.randint(10, 999)}.99</span></{tag}>')
+    return "\n".join(out)
+
+
+def lenovo_page(rng: random.Random) -> str:
+    """product page after the in page script ran (injected data tag at the end of <body>)"""
+    product_ld = {"@context": "https://schema.org", "@type": "Product", "name": "Legion Go 2 (8.8\" AMD) Handheld - Eclipse Black",
+                  "sku": "83N0000AUS", "offers": {"@type": "Offer", "price": "1099.99", "priceCurrency": "USD",
+                                                  "availability": "https://schema.org/InStock"}}
+    main_text = ("Legion Go 2 (8.8\" AMD)\nHandheld\n$1,099.99\nEst Value $1,349.99\n18% off\nAdd to cart\nFree shipping\n"
+                 + "Tech specs and more product information. " * 40)
+    injected = json.dumps({"name": product_ld["name"], "price": "1099.99",
+                           "availability": "https://schema.org/InStock", "mainText": main_text})
+    return f"""<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>Legion Go 2 | Lenovo US</title>
+{TRACKING}
+<script type="application/ld+json">{BREADCRUMBS}</script>
+<script type="application/ld+json">{json.dumps(product_ld)}</script>
+{BIG_JS}
+</head><body><header>{filler(rng, 150, "li")}</header>
+<main><h1>Legion Go 2 (8.8" AMD)</h1><div class="price-widget">$1,099.99 <span>Est Value $1,349.99</span> <span>18% off</span></div>
+{filler(rng, 400)}</main><footer>{filler(rng, 120, "li")}</footer>
+<script type="text/x-scraper-data">{injected}</script>
+</body></html>"""
+
+
+def bhvideo_pages(rng: random.Random) -> dict[str, str]:
+    """the same product page with and without the injected data tag, plus a cloudflare challenge"""
+    product_ld = {"@context": "https://schema.org", "@type": "Product", "name": "Lenovo Legion Go 2 Handheld Gaming PC (1TB)",
+                  "sku": "1920305-REG", "offers": {"@type": "Offer", "price": "1,099.99", "priceCurrency": "USD",
+                                                   "availability": "http://schema.org/InStock"}}
+    pricing = ('<div data-selenium="pricingContainer" class="pricingContainer_x"><div data-selenium="pricingPrice">$1,099.99</div>'
+               '<div class="strike_x">Reg. Price <span>$1,349.99</span></div><div>Save $250.00</div><div>Was: $1,349.99</div></div>')
+    organization = json.dumps({"@context": "https://schema.org", "@type": "Organization", "name": "B&H Photo Video"})
+    head = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><title>Lenovo Legion Go 2 | B&amp;H Photo</title>
+{TRACKING}
+<script type="application/ld+json">{organization}</script>
+<script type="application/ld+json">{BREADCRUMBS}</script>
+{BIG_JS}
+</head><body><nav>{filler(rng, 300, "li")}</nav>"""
+    body = f"""
+<script type="application/ld+json">{json.dumps(product_ld)}</script>
+<section>{pricing}</section>
+<section class="specs">{filler(rng, 900)}</section><footer>{filler(rng, 200, "li")}</footer>"""
+    injected = json.dumps({"product": product_ld, "pricing": pricing}).replace("<", "\\u003c")
+
+    return {
+        "legion-go-2-on-sale.html": head + body + "\n</body></html>",
+        "legion-go-2-on-sale-injected.html": head + body + f'\n<script type="text/x-scraper-data">{injected}</script></body></html>',
+        "cloudflare-challenge.html": CHALLENGE,
+    }
+
+
+def main():
+    rng = random.Random(SEED)
+    pages = {"lenovo": {"legion-go-2-on-sale.html": lenovo_page(rng)}, "bhvideo": bhvideo_pages(rng)}
+
+    for source, files in pages.items():
+        folder = SYNTHETIC_DIR / source
+        folder.mkdir(parents=True, exist_ok=True)
+        for name, html in files.items():
+            (folder / name).write_text(html, encoding="utf-8")
+            print(f"wrote {folder / name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+# local stand in for every retailer and ntfy, for load testing whole sweeps on one machine
+# serves synthetic products built from the fixtures in src/data and benchmarks/fixtures/synthetic with
+# configurable latency, server errors, 429s (random and per route rate limits) and cloudflare style challenge pages
+#
+#   python -m benchmarks.mock_server --products 1000 --write-watchlist state/mock_watchlist.json
+#   then run the notifier with the printed *_BASE_URL variables + WATCHLIST_FILE=state/mock_watchlist.json
+#
+# routes (prefix = the matching *_BASE_URL):
+#   /bestbuy/v1/products/<sku>.json, /bestbuy/v1/products(sku in(<sku>,...))   products api, etags on single skus
+#   /amazon/asin/<asin>        what amazon-buddy prints for an asin (used by the node sidecar)
+#   /lenovo/<path>, /bhvideo/<path>   product pages, or a challenge page
+#   /ntfy/<topic>              accepts POSTed notifications
+#   /_stats                    request counts per route and status as json
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / "src" / "data"
+SYNTHETIC_DIR = Path(__file__).resolve().parent / "fixtures" / "synthetic"  # see make_synthetic_fixtures.py
+
+BATCH_RE = re.compile(r"^/v1/products\(sku in\(([^)]*)\)\)$")
+SINGLE_RE = re.compile(r"^/v1/products/([^/]+)\.json$")
+
+ROUTES = ("bestbuy", "amazon", "lenovo", "bhvideo", "ntfy")
+PAGE_ROUTES = frozenset({"lenovo", "bhvideo"})  # the only ones that get challenge pages
+
+
+def _seed(identifier: str) -> int:
+    return int.from_bytes(hashlib.blake2b(identifier.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class Catalog:
+    """deterministic synthetic product state per identifier, changing every price_period seconds"""
+
+    def __init__(self, price_period: float):
+        self.price_period = price_period
+
+        self.bestbuy = [json.loads(p.read_text(encoding="utf-8")) for p in sorted((FIXTURES_DIR / "bestbuy").glob("*.json"))]
+        self.amazon = [json.loads(p.read_text(encoding="utf-8"))[0] for p in sorted((FIXTURES_DIR / "amazon").glob("*.json"))]
+        self.pages = {
+            "lenovo": (SYNTHETIC_DIR / "lenovo" / "legion-go-2-on-sale.html").read_bytes(),
+            "bhvideo": (SYNTHETIC_DIR / "bhvideo" / "legion-go-2-on-sale.html").read_bytes(),
+        }
+        self.challenge = (SYNTHETIC_DIR / "bhvideo" / "cloudflare-challenge.html").read_bytes()
+
+    def state(self, identifier: str):
+        """(regular price, sale price or None, in stock) right now"""
+        seed = _seed(identifier)
+        epoch = int((time.time() + seed % 997) / self.price_period) if self.price_period > 0 else 0
+        regular = 49.99 + seed % 950
+        on_sale = (seed + epoch) % 3 == 0
+        in_stock = (seed + epoch) % 7 != 0
+        return regular, round(regular * 0.85, 2) if on_sale else None, in_stock
+
+    def bestbuy_product(self, sku: str, show=None) -> dict:
+        regular, sale, in_stock = self.state(f"bestbuy:{sku}")
+        product = dict(self.bestbuy[_seed(sku) % len(self.bestbuy)])
+        product.update(
+            sku=int(sku) if sku.isdigit() else sku,
+            name=f"Mock {sku} {product['name']}",
+            regularPrice=regular,
+            salePrice=sale if sale is not None else regular,
+            onSale=sale is not None,
+            orderable="Available" if in_stock else "SoldOut",
+            url=f"https://www.bestbuy.com/site/mock/{sku}.p",
+        )
+        return {k: product.get(k) for k in show} if show else product
+
+    def amazon_result(self, asin: str) -> list:
+        regular, sale, in_stock = self.state(f"amazon:{asin}")
+        product = dict(self.amazon[_seed(asin) % len(self.amazon)])
+        product.update(
+            asin=asin,
+            title=f"Mock {asin} {product['title']}",
+            url=f"https://www.amazon.com/dp/{asin}",
+            item_available=in_stock,
+            price={
+                **product.get("price", {}),
+                "discounted": sale is not None,
+                "current_price": sale if sale is not None else regular,
+                "before_price": regular,
+                "savings_amount": round(regular - sale, 2) if sale is not None else 0,
+                "savings_percent": 15 if sale is not None else 0,
+            },
+        )
+        return [product]
+
+
+class Faults:
+    def __init__(self, args):
+        self.latency = args.latency_ms / 1000
+        self.jitter = args.jitter_ms / 1000
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.challenge_rate = args.challenge_rate
+        self.retry_after = args.retry_after
+        self.rps = args.rps
+        self.random = random.Random(args.seed)
+
+        self._lock = threading.Lock()
+        self._recent: dict[str, deque] = {route: deque() for route in ROUTES}
+
+    def over_limit(self, route: str) -> bool:
+        """more than rps requests on route within the last second"""
+        if not self.rps:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            recent = self._recent[route]
+            while recent and recent[0] <= now - 1:
+                recent.popleft()
+            if len(recent) >= self.rps:
+                return True
+            recent.append(now)
+            return False
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.random.uniform(self.latency - self.jitter, self.latency + self.jitter)))
+
+    def roll(self, rate: float) -> bool:
+        return rate > 0 and self.random.random() < rate
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, catalog: Catalog, faults: Faults):
+        super().__init__(address, MockHandler)
+        self.catalog = catalog
+        self.faults = faults
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.started = time.time()
+
+    def count(self, route: str, status: int):
+        with self.stats_lock:
+            self.stats[f"{route} {status}"] += 1
+
+    def summary(self) -> dict:
+        with self.stats_lock:
+            counts = dict(sorted(self.stats.items()))
+        elapsed = time.time() - self.started
+        return {"uptime_s": round(elapsed, 1), "requests": sum(counts.values()), "by_route_status": counts}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep alive, like the real endpoints
+    server: MockServer
+
+    def log_message(self, format, *args):
+        pass  # thousands of requests per sweep, /_stats has the counts
+
+    def _reply(self, route: str, status: int, body: bytes = b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+        self.server.count(route, status)
+
+    def _json(self, route: str, data, headers=None):
+        self._reply(route, 200, json.dumps(data).encode("utf-8"), headers=headers)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))  # drain so the connection can be reused
+        self._handle()
+
+    def _handle(self):
+        parts = urlsplit(self.path)
+        route, _, rest = unquote(parts.path).lstrip("/").partition("/")
+        rest = "/" + rest
+        query = parse_qs(parts.query)
+
+        if route == "_stats":
+            return self._json(route, self.server.summary())
+        if route not in ROUTES:
+            return self._reply("unknown", 404, b'{"error": "no such route"}')
+
+        faults = self.server.faults
+        faults.delay()
+
+        if faults.over_limit(route) or faults.roll(faults.rate_limit_rate):
+            return self._reply(route, 429, b'{"error": "Too Many Requests"}', headers={"Retry-After": str(faults.retry_after)})
+        if faults.roll(faults.error_rate):
+            return self._reply(route, 500, b'{"error": "Internal Server Error"}')
+        if route in PAGE_ROUTES and faults.roll(faults.challenge_rate):
+            return self._reply(route, 403, self.server.catalog.challenge, "text/html; charset=utf-8",
+                               headers={"cf-mitigated": "challenge"})
+
+        getattr(self, f"_{route}")(rest, query)
+
+    def _bestbuy(self, path, query):
+        catalog = self.server.catalog
+        show = query["show"][0].split(",") if "show" in query else None
+
+        if m := BATCH_RE.match(path):
+            skus = [s.strip() for s in m.group(1).split(",") if s.strip()]
+            products = [catalog.bestbuy_product(sku, show) for sku in skus]
+            return self._json("bestbuy", {"from": 1, "to": len(products), "total": len(products), "products": products})
+
+        if m := SINGLE_RE.match(path):
+            body = json.dumps(catalog.bestbuy_product(m.group(1), show)).encode("utf-8")
+            etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._reply("bestbuy", 304, headers={"ETag": etag})
+            return self._reply("bestbuy", 200, body, headers={"ETag": etag})
+
+        self._reply("bestbuy", 404, b'{"error": "not found"}')
+
+    def _amazon(self, path, query):
+        if not path.startswith("/asin/"):
+            return self._reply("amazon", 404, b'{"error": "not found"}')
+        self._json("amazon", self.server.catalog.amazon_result(path[len("/asin/"):]))
+
+    def _lenovo(self, path, query):
+        self._reply("lenovo", 200, self.server.catalog.pages["lenovo"], "text/html; charset=utf-8")
+
+    def _bhvideo(self, path, query):
+        self._reply("bhvideo", 200, self.server.catalog.pages["bhvideo"], "text/html; charset=utf-8")
+
+    def _ntfy(self, path, query):
+        if self.command != "POST":
+            return self._reply("ntfy", 405, b'{"error": "method not allowed"}')
+        self._json("ntfy", {"id": f"{time.time_ns():x}", "time": int(time.time()), "event": "message", "topic": path.strip("/")})
+
+
+def mock_identifiers(source: str, i: int) -> str:
+    if source == "bestbuy":
+        return str(9_000_000 + i)
+    if source == "amazon":
+        return f"BM{i:08d}"
+    if source == "lenovo":
+        return f"https://www.lenovo.com/us/en/p/mock/{i}"
+    return f"https://www.bhphotovideo.com/c/product/{i}-REG/mock.html"
+
+
+def write_watchlist(path: Path, count: int, sources, topics: int):
+    """one item per synthetic product, watched on every given source, half of them with a max price"""
+    products = []
+    for i in range(count):
+        item = {
+            "name": f"mock-{i}",
+            "identifiers": {source: mock_identifiers(source, i) for source in sources},
+            "ntfy_topic": f"https://ntfy.sh/mock-{i % topics}",
+        }
+        if i % 2:
+            item["user_max_price"] = 49.99 + _seed(str(i)) % 950
+        products.append(item)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"products": products}, indent=1) + "\n", encoding="utf-8")
+    print(f"Wrote {count} product(s) x {len(sources)} source(s) to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand in for the retailers and ntfy")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=50, help="mean added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=25, help="+/- spread around the mean latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--rps", type=int, default=0, help="per route requests per second before 429s (0 = unlimited)")
+    parser.add_argument("--retry-after", type=int, default=5, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--challenge-rate", type=float, default=0.0, help="fraction of page loads that get a challenge")
+    parser.add_argument("--price-period", type=float, default=300, help="seconds between synthetic price / stock changes")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--products", type=int, default=1000, help="synthetic products for --write-watchlist")
+    parser.add_argument("--sources", nargs="*", default=["bestbuy", "amazon"], choices=[r for r in ROUTES if r != "ntfy"])
+    parser.add_argument("--topics", type=int, default=10, help="ntfy topics the products are spread over")
+    parser.add_argument("--write-watchlist", type=Path, help="write a watchlist for the synthetic products and serve")
+    args = parser.parse_args()
+
+    if args.write_watchlist:
+        write_watchlist(args.write_watchlist, args.products, args.sources, args.topics)
+
+    server = MockServer((args.host, args.port), Catalog(args.price_period), Faults(args))
+    base = f"http://{args.host}:{server.server_port}"
+    print(f"Mock server on {base}, point the notifier at it with:")
+    print(f"  BESTBUY_BASE_URL={base}/bestbuy/v1")
+    print(f"  AMAZON_BASE_URL={base}/amazon")
+    print(f"  LENOVO_BASE_URL={base}/lenovo")
+    print(f"  BHVIDEO_BASE_URL={base}/bhvideo")
+    print(f"  NTFY_BASE_URL={base}/ntfy")
+    if args.write_watchlist:
+        print(f"  WATCHLIST_FILE={args.write_watchlist}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
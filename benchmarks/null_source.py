@@ -0,0 +1,43 @@
+# datasource that never touches the network - used to measure per check overhead of the worker modes
+# extra modules to import (to mimic a heavy datasource) can be listed in BENCH_NULL_SOURCE_IMPORTS
+import importlib
+import logging
+import os
+import time
+
+from src.datasources.base import DataSource
+from src.datasources.registry import SourceRegistry
+from src.schema import Product
+
+for _module in filter(None, os.getenv("BENCH_NULL_SOURCE_IMPORTS", "").split(",")):
+    importlib.import_module(_module.strip())
+
+
+class NullSource(DataSource):
+    source_name = "null"
+
+    def __init__(self, logger: logging.Logger = None):
+        super().__init__(logger)
+
+    def fetch_raw(self, identifier: str) -> dict:
+        time.sleep(float(os.getenv("BENCH_NULL_SOURCE_LATENCY", "0")))
+        return {"sku": identifier, "name": f"null product {identifier}", "price": 99.99}
+
+    def parse(self, raw_data: dict) -> Product:
+        return Product(
+            identifier=raw_data["sku"],
+            product_name=raw_data["name"],
+            in_stock=True,
+            on_sale=False,
+            sale_price=raw_data["price"],
+            regular_price=raw_data["price"],
+            product_url="",
+            retailer_name="Null",
+            retailer_logo="",
+        )
+
+    def fetch_product(self, identifier: str):
+        return self.parse(self.fetch_raw(identifier))
+
+
+SourceRegistry.register(NullSource)
@@ -1,26 +1,39 @@
+import argparse
+import asyncio
 import os
+import signal
 import sys
+import time
 from dotenv import load_dotenv
 from pathlib import Path
-import importlib
 import multiprocessing
-import logging
-from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueListener
 
-from src.send_ntfy import post_ntfy
-from src.ntfy_templates import on_sale, below_max_price, in_stock
-from src.log_handler import init_logger
+from src.notify_dispatcher import NotificationDispatcher
+from src.outbox import Outbox, OutboxSender
+from src.log_handler import init_logger, init_child_logger
+from src.metrics import MetricsExporter, get_metrics, summarize
 from src.datasources.registry import SourceRegistry
+from src.state_store import StateStore
+from src.price_history import PriceHistory
+from src.pipeline import ResultProcessor
+from src.scheduler import Job, SpawnExecutor, SweepScheduler, plan_jobs
+from src.async_runner import AsyncJobRunner, run_async_sweep
+from src.daemon import PollDaemon
+from src.poll_scheduler import AdaptivePollScheduler
+from src.watchlist import WatchlistFile
+from src.worker_pool import DEFAULT_MAX_TASKS_PER_CHILD, fetch_identifiers, make_pool
 
 load_dotenv()
 
 PROJECT_ROOT = Path(__file__).resolve().parent
-DATASOURCE_PATH = PROJECT_ROOT / "src" / "datasources"
 
 # ensure project root is on sys.path
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
+# built in watchlist, used when there is no watchlist file (see src/watchlist.py)
 WATCHLIST = [
     {  # lenovo legion go 2 1TB
         "identifiers": {
@@ -42,147 +55,236 @@ WATCHLIST = [
     },
 ]
 
+# max number of identifiers in flight per source - browser based sources are the expensive ones
+SOURCE_CONCURRENCY = {
+    "bestbuy": 8,
+    "amazon": 4,
+    "lenovo": 2,
+    "bhvideo": 2,
+}
+DEFAULT_SOURCE_CONCURRENCY = 2
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", sum(SOURCE_CONCURRENCY.values())))
+NTFY_DRAIN_TIMEOUT = float(os.getenv("NTFY_DRAIN_TIMEOUT", 60))  # how long a sweep waits for the outbox before exiting
+OUTBOX_RETENTION_DAYS = 7
+MAX_TASKS_PER_CHILD = int(os.getenv("MAX_TASKS_PER_CHILD", DEFAULT_MAX_TASKS_PER_CHILD))
+
+# spawn = fresh process per identifier, pool = long lived workers that reuse their datasources
+# async = one process, one event loop, all fetches in flight concurrently
+WORKER_MODES = ("pool", "spawn", "async")
+
+
+# worker func - imports only the datasource it needs and fetches the product(s)
+# notification logic runs back in the main process as each result arrives
+def _process_identifier(log_queue, src_name, identifiers):
+    pid = os.getpid()
+    job_name = ",".join(identifiers)
+    logger = init_child_logger(log_queue, f"bestbuy-notifier.{src_name}.{job_name}")
+
+    logger.info(f"[PID {pid}] Child process started for {src_name}:{job_name}")
 
-# auto import all modules inside 'src/datasources' to trigger source registry
-def import_datasources(logger):
+    if str(PROJECT_ROOT) not in sys.path:
+        sys.path.insert(0, str(PROJECT_ROOT))
+
+    # re register datasource in this child process
     SourceRegistry.set_logger(logger)
 
-    for file in os.listdir(DATASOURCE_PATH):
-        if file.endswith("py") and "_" not in file and file not in ["__init__.py", "base.py", "implementation-test.py", "registry.py"]:
-            module_name = f"src.datasources.{file.split('.')[0]}"
-            importlib.import_module(module_name)
-            logger.info(f"Registered datasource: {file.split('.')[0]}")
+    try:
+        data_fetcher = SourceRegistry.get(src_name)
 
+    except (ImportError, KeyError) as e:
+        logger.error(f"[PID {pid}] Could not load datasource '{src_name}': {e}")
+        return {}, get_metrics().snapshot()
 
-# create child logger that sends all records to parent via queue system
-def _init_child_logger(log_queue: multiprocessing.Queue, name: str) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.handlers.clear()
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(QueueHandler(log_queue))
-    logger.propagate = False
+    logger.info(f"[PID {pid}] Processing: {src_name} | {job_name}")
+    logger.info("-" * 60)
 
-    return logger
+    # fetch product data
+    products = data_fetcher.fetch_products(identifiers)
 
+    logger.info(f"[PID {pid}] Child process finished for {src_name}:{job_name}")
 
-# worker func - re imports the datasource, fetches product and sends noti
-def _process_identifier(log_queue, src_name, identifier, user_max_price, ntfy_topic):
-    pid = os.getpid()
-    logger = _init_child_logger(log_queue, f"bestbuy-notifier.{src_name}.{identifier}")
+    # timings recorded in this process go back to the parent with the products
+    return products, get_metrics().snapshot()
 
-    logger.info(f"[PID {pid}] Child process started for {src_name}:{identifier}")
 
-    if str(PROJECT_ROOT) not in sys.path:
-        sys.path.insert(0, str(PROJECT_ROOT))
+# run the sweep's jobs in worker processes (fresh per job or a long lived pool)
+# in pool mode, sources with a process wide runtime (browsers, node sidecar) are fetched on threads in this
+# process instead, so there is one browser pool / sidecar for the whole sweep rather than one per worker
+def _run_in_processes(jobs, sources, mode, max_tasks_per_child, on_result, logger):
+    main_pid = os.getpid()
 
-    # re register datasource in this child process
-    SourceRegistry.set_logger(logger)
+    # set up log queue + listener
+    # listener runs in main process and drains queue into existing file handler(s)
+    # spawn context queue so it can be handed to both forked and spawned workers
+    log_queue = multiprocessing.get_context("spawn").Queue()
+    listener = QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
+    listener.start()
 
-    try:
-        importlib.import_module(f"src.datasources.{src_name}")
+    scheduler = SweepScheduler(SOURCE_CONCURRENCY, DEFAULT_SOURCE_CONCURRENCY, MAX_WORKERS, logger)
+    metrics = get_metrics()
+    executors = []
 
-    except ModuleNotFoundError:
-        logger.error(f"[PID {pid}] Could not import datasource module for '{src_name}'")
-        return
+    if mode == "spawn":
+        executor = SpawnExecutor()
+        executors.append(executor)
 
-    if src_name not in SourceRegistry.all():
-        logger.error(f"[PID {pid}] Datasource '{src_name}' did not register after import")
-        return
+        def submit(job: Job):
+            logger.info(f"[PID {main_pid}] Spawning '{job.name}'")
+            return executor.submit(_process_identifier, log_queue, job.src_name, job.identifiers, name=job.name)
 
-    logger.info(f"[PID {pid}] Processing: {src_name} | {identifier}")
-    logger.info("-" * 60)
+    else:
+        local = {name for name, src in sources.items() if src.shared_runtime}
+        pooled = [job for job in jobs if job.src_name not in local]
+
+        if pooled:
+            manifest = {job.src_name: SourceRegistry.manifest[job.src_name] for job in pooled}
+            executor = make_pool(log_queue, manifest, min(MAX_WORKERS, len(pooled)), max_tasks_per_child)
+            executors.append(executor)
+            logger.info(f"[PID {main_pid}] Started worker pool (max tasks per child: {max_tasks_per_child or 'unlimited'})")
+
+        if local:
+            # metrics land in this process' registry directly, so there are no samples to hand back
+            threads = ThreadPoolExecutor(max_workers=sum(scheduler.limit_for(name) for name in local),
+                                         thread_name_prefix="fetch")
+            executors.append(threads)
+            logger.info(f"[PID {main_pid}] Fetching {sorted(local)} in the main process")
+
+        def submit(job: Job):
+            logger.info(f"[PID {main_pid}] Queued '{job.name}'")
+            if job.src_name in local:
+                return threads.submit(lambda: (sources[job.src_name].fetch_products(job.identifiers), None))
+            return executor.submit(fetch_identifiers, job.src_name, job.identifiers)
+
+    # workers return (products, metrics recorded while fetching them)
+    def collect(job: Job, result):
+        products, samples = result
+        metrics.merge(samples)
+        on_result(job, products)
 
-    # fetch product data
-    data_fetcher = SourceRegistry.get(src_name)
-    product = data_fetcher.fetch_product(identifier)
+    try:
+        scheduler.run(jobs, submit, collect)
 
-    if product is None:
-        logger.warning(f"[PID {pid}] fetch_product returned None, skipping")
-        return
+    finally:
+        for executor in executors:
+            executor.shutdown()
+        listener.stop()
 
-    logger.info(f"[PID {pid}] Fetched: {product.product_name} | Retailer: {product.retailer_name}")
 
-    if not product.in_stock:
-        logger.info(f"[PID {pid}] Out of stock, skipping")
-        return
+def main(logger, mode: str = "pool", max_tasks_per_child: int = MAX_TASKS_PER_CHILD):
+    main_pid = os.getpid()
+    started = time.perf_counter()
+    exporter = MetricsExporter(logger=logger)
+    exporter.start()
+
+    watchlist = WatchlistFile(fallback=WATCHLIST, known_sources=SourceRegistry.names(), logger=logger).load()
+
+    # only the datasources the watchlist actually uses get imported
+    sources = SourceRegistry.load(watchlist.sources())
+    logger.info(f"[PID {main_pid}] Loaded datasources: {list(sources.keys())}")
+
+    # flatten every identifier of every watchlist item into one global queue
+    # batch capable sources (bestbuy) get chunked multi identifier jobs
+    jobs = plan_jobs(watchlist.keys(sources), {name: src.batch_size for name, src in sources.items()})
 
-    # check if data meets user reqs
-    if user_max_price is not None:
-        if product.on_sale and product.sale_price <= user_max_price:
-            on_sale_body = on_sale(product, user_max_price)
-            post_ntfy(on_sale_body, product.product_url, product.retailer_name, product.retailer_logo, ntfy_topic)
-            logger.info(f"[PID {pid}] Sent ON SALE notification for {identifier}")
+    # notifications are collected for the whole sweep, coalesced per product and written to the durable outbox
+    # the sender thread starts right away so messages left over from previous runs go out during the sweep
+    outbox = Outbox()
+    sender = OutboxSender(outbox, logger=logger)
+    sender.start()
 
-        elif product.regular_price <= user_max_price:
-            below_max_price_body = below_max_price(product, user_max_price)
-            post_ntfy(below_max_price_body, product.product_url, product.retailer_name, product.retailer_logo, ntfy_topic)
-            logger.info(f"[PID {pid}] Sent BELOW MAX PRICE notification for {identifier}")
+    state_store = StateStore()
+    processor = ResultProcessor(watchlist, state_store, PriceHistory(),
+                                NotificationDispatcher(outbox, sender, logger=logger), logger)
 
+    try:
+        if mode == "async":
+            asyncio.run(run_async_sweep(jobs, sources, SOURCE_CONCURRENCY, DEFAULT_SOURCE_CONCURRENCY, MAX_WORKERS, processor.handle, logger))
         else:
-            logger.info(f"[PID {pid}] Price ${product.regular_price} exceeds max ${user_max_price}, skipping")
+            _run_in_processes(jobs, sources, mode, max_tasks_per_child, processor.handle, logger)
 
-    else:
-        in_stock_body = in_stock(product)
-        post_ntfy(in_stock_body, product.product_url, product.retailer_name, product.retailer_logo, ntfy_topic)
-        logger.info(f"[PID {pid}] Sent IN STOCK notification for {identifier}")
+        logger.info(f"[PID {main_pid}] Sweep complete")
 
-    logger.info(f"[PID {pid}] Child process finished for {src_name}:{identifier}")
+    finally:
+        processor.commit()
+        state_store.close()
+        _close_outbox(outbox, sender, logger)
 
+        logger.info(f"[PID {main_pid}] Sweep summary: {summarize(get_metrics().snapshot(), time.perf_counter() - started)}")
+        exporter.stop()
 
-def main(logger):
+
+# resident mode - poll every identifier on its own adaptive schedule until SIGTERM / ctrl+c
+# the watchlist file is reloaded whenever it changes
+def run_daemon(logger):
     main_pid = os.getpid()
-    sources = SourceRegistry.all()
-    logger.info(f"[PID {main_pid}] Available datasources: {list(sources.keys())}")
+    watchlist_file = WatchlistFile(fallback=WATCHLIST, known_sources=SourceRegistry.names(), logger=logger)
+    watchlist = watchlist_file.load()
 
-    # set up log queue + listener
-    # listener runs in main process and drains queue into existing file handler(s)
-    log_queue = multiprocessing.Queue()
-    listener = QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
-    listener.start()
+    sources = SourceRegistry.load(watchlist.sources())
+    logger.info(f"[PID {main_pid}] Loaded datasources: {list(sources.keys())}")
+    outbox = Outbox()
+    sender = OutboxSender(outbox, logger=logger)
+    sender.start()
+
+    state_store = StateStore()
+    processor = ResultProcessor(watchlist, state_store, PriceHistory(),
+                                NotificationDispatcher(outbox, sender, logger=logger), logger)
+    runner = AsyncJobRunner(sources, SOURCE_CONCURRENCY, DEFAULT_SOURCE_CONCURRENCY, MAX_WORKERS)
+    daemon = PollDaemon(sources, processor, AdaptivePollScheduler(), runner, watchlist_file, logger=logger)
+
+    async def serve():
+        stop = asyncio.Event()
+
+        def on_signal(sig):
+            logger.info(f"[PID {main_pid}] Received {sig.name}, shutting down")
+            stop.set()
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, on_signal, sig)
+
+        await daemon.run(stop)
+
+    exporter = MetricsExporter(logger=logger)
+    exporter.start()
+    logger.info(f"[PID {main_pid}] Daemon started")
 
     try:
-        for idx, item in enumerate(WATCHLIST):
-            logger.info("")
-            logger.info(f"[PID {main_pid}] WATCHLIST item {idx + 1}/{len(WATCHLIST)}")
-
-            processes: list[multiprocessing.Process] = []
-
-            for src_name, identifier in item["identifiers"].items():
-                if src_name not in sources:
-                    logger.debug(f"No datasource for '{src_name}', skipping")
-                    continue
-
-                p = multiprocessing.Process(
-                    target=_process_identifier,
-                    args=(
-                        log_queue,
-                        src_name,
-                        identifier,
-                        item["user_max_price"],
-                        item["ntfy_topic"],
-                    ),
-                    name=f"{src_name}-{identifier}",
-                )
-                processes.append(p)
-                p.start()
-                logger.info(f"[PID {main_pid}] Spawned '{p.name}' (PID {p.pid})")
-
-            logger.info(f"[PID {main_pid}] Waiting for {len(processes)} process(es)...")
-
-            # wait for all identifier processes to finish before moving to next watchlist item
-            for p in processes:
-                p.join()
-                status = "OK" if p.exitcode == 0 else f"FAILED (exit code {p.exitcode})"
-                logger.info(f"[PID {main_pid}] Process '{p.name}' (PID {p.pid}) joined — {status}")
-
-            logger.info(f"[PID {main_pid}] All processes for WATCHLIST item {idx + 1} complete")
+        asyncio.run(serve())
 
     finally:
-        listener.stop()
+        state_store.close()
+        _close_outbox(outbox, sender, logger)
+        exporter.stop()
+        logger.info(f"[PID {main_pid}] Daemon stopped")
+
+
+def _close_outbox(outbox, sender, logger):
+    if not sender.drain(NTFY_DRAIN_TIMEOUT):
+        logger.warning(f"{outbox.pending_count()} ntfy message(s) still pending, will retry next run")
+    sender.stop()
+    outbox.prune(time.time() - OUTBOX_RETENTION_DAYS * 86400)
+    outbox.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check watchlist products and send ntfy alerts")
+    parser.add_argument("--mode", choices=WORKER_MODES, default=os.getenv("WORKER_MODE", "pool"),
+                        help="pool: long lived worker processes, spawn: one fresh process per identifier, "
+                             "async: single process event loop")
+    parser.add_argument("--max-tasks-per-child", type=int, default=MAX_TASKS_PER_CHILD,
+                        help="recycle pool workers after this many identifiers (0 = never)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and poll each identifier on an adaptive schedule (always async)")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
     logger = init_logger()
 
-    import_datasources(logger)
-    main(logger)
+    SourceRegistry.set_logger(logger)
+    if args.daemon:
+        run_daemon(logger)
+    else:
+        main(logger, args.mode, args.max_tasks_per_child)
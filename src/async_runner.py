@@ -0,0 +1,60 @@
+# single event loop execution - every job runs as a task in one process, bounded by per source semaphores
+# native async sources (browser based) are awaited directly, blocking ones run in the loop's thread pool
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .scheduler import Job
+
+
+class AsyncJobRunner:
+    def __init__(self, sources: dict, limits: dict[str, int], default_limit: int, max_in_flight: int):
+        """sources maps source name -> DataSource instance"""
+        self.sources = sources
+        self.limits = limits
+        self.default_limit = default_limit
+        self.max_in_flight = max_in_flight
+
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._per_source: dict[str, asyncio.Semaphore] = {}
+
+    def install_executor(self):
+        # blocking fetch_product calls (asyncio.to_thread) land in this pool
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="fetch")
+        )
+
+    async def run(self, job: Job):
+        """returns (job, products, error) - never raises"""
+        if job.src_name not in self._per_source:
+            self._per_source[job.src_name] = asyncio.Semaphore(self.limits.get(job.src_name, self.default_limit))
+
+        async with self._per_source[job.src_name], self._in_flight:
+            try:
+                return job, await self.sources[job.src_name].afetch_products(job.identifiers), None
+            except Exception as e:
+                return job, None, e
+
+
+async def run_async_sweep(jobs, sources: dict, limits: dict[str, int], default_limit: int, max_in_flight: int,
+                          on_result, logger: logging.Logger = None):
+    """on_result(job, products) is called on the loop thread as soon as each job finishes"""
+    logger = logger or logging.getLogger(__name__)
+
+    runner = AsyncJobRunner(sources, limits, default_limit, max_in_flight)
+    runner.install_executor()
+
+    logger.info(f"Async sweep queued {len(jobs)} job(s), max {max_in_flight} in flight")
+
+    for next_done in asyncio.as_completed([runner.run(job) for job in jobs]):
+        job, products, error = await next_done
+
+        if error is not None:
+            logger.error(f"Job {job.name} failed: {error}")
+            continue
+
+        # one bad result must not cost the rest of the sweep
+        try:
+            on_result(job, products)
+        except Exception as e:
+            logger.error(f"Handling result of job {job.name} failed: {type(e).__name__}: {e}")
@@ -0,0 +1,64 @@
+# remembers which browser mode (headless / headed) last got through a site's bot protection, per domain
+# so a site that blocks headless browsers goes straight to headed instead of paying for a doomed crawl first
+# entries expire so a site that stops blocking is moved back to the cheaper headless mode
+import os
+import threading
+import time
+
+from . import db
+
+CRAWL_MODE_TTL = float(os.getenv("CRAWL_MODE_TTL", 6 * 3600))  # seconds a remembered mode is trusted
+
+HEADLESS = "headless"
+HEADED = "headed"
+
+
+class CrawlModeCache:
+    def __init__(self, path=db.DB_FILE, ttl: float = CRAWL_MODE_TTL):
+        self.ttl = ttl
+        self._conn = db.connect(path)
+        self._lock = threading.Lock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_mode (
+                key TEXT PRIMARY KEY,
+                mode TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def get(self, key: str) -> str:
+        """last mode that worked for key, None if unknown or expired"""
+        with self._lock:
+            row = self._conn.execute("SELECT mode, updated_at FROM crawl_mode WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def set(self, key: str, mode: str):
+        """remember mode for key. confirming the mode it already has keeps the original timestamp, otherwise a
+        site polled more often than the ttl would stay on headed forever and never be probed headless again"""
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO crawl_mode VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET mode = excluded.mode, updated_at = excluded.updated_at
+                WHERE crawl_mode.mode != excluded.mode OR excluded.updated_at - crawl_mode.updated_at > ?
+            """, (key, mode, time.time(), self.ttl))
+
+    def forget(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM crawl_mode WHERE key = ?", (key,))
+
+
+_cache: CrawlModeCache = None
+_cache_pid: int = None
+_cache_lock = threading.Lock()
+
+
+def get_crawl_mode_cache() -> CrawlModeCache:
+    global _cache, _cache_pid
+
+    # sqlite connections must not cross a fork, so each process opens its own
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache, _cache_pid = CrawlModeCache(), os.getpid()
+        return _cache
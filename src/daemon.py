@@ -0,0 +1,171 @@
+# resident polling loop - every (source, identifier) is polled on its own adaptive schedule
+# instead of sweeping the whole watchlist at once. runs on one event loop (see async_runner) so
+# sources, http pools, browsers and snapshots stay warm for as long as the process lives
+import asyncio
+import logging
+import os
+import time
+
+from .async_runner import AsyncJobRunner
+from .datasources.registry import SourceRegistry
+from .metrics import diff, get_metrics, summarize
+from .pipeline import ResultProcessor
+from .poll_scheduler import AdaptivePollScheduler
+from .scheduler import plan_jobs
+from .watchlist import Watchlist, WatchlistFile
+
+COMMIT_INTERVAL = 30  # seconds between persisting snapshots / history and flushing notifications
+WATCHLIST_CHECK_INTERVAL = 5  # seconds between watchlist file mtime checks
+DAEMON_DRAIN_TIMEOUT = float(os.getenv("DAEMON_DRAIN_TIMEOUT", 60))  # how long shutdown waits for in flight polls
+SUMMARY_INTERVAL = float(os.getenv("METRICS_SUMMARY_INTERVAL", 600))  # seconds between summaries in the log
+
+
+class PollDaemon:
+    def __init__(self, sources: dict, processor: ResultProcessor, poll_scheduler: AdaptivePollScheduler,
+                 runner: AsyncJobRunner, watchlist_file: WatchlistFile = None, commit_interval: float = COMMIT_INTERVAL,
+                 drain_timeout: float = DAEMON_DRAIN_TIMEOUT, logger: logging.Logger = None):
+        self.sources = sources
+        self.processor = processor
+        self.poll_scheduler = poll_scheduler
+        self.runner = runner
+        self.watchlist_file = watchlist_file
+        self.commit_interval = commit_interval
+        self.drain_timeout = drain_timeout
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._tasks: set[asyncio.Task] = set()
+        self._summary_base = get_metrics().snapshot()
+        self._summary_at = time.monotonic()
+
+    def reload(self, watchlist: Watchlist):
+        """
+        swap in a new watchlist - only identifiers that changed are touched: new ones are polled right away,
+        dropped ones stop being polled and ones whose items were edited are checked against their last snapshot
+        and polled again now
+        """
+        # sources new to this watchlist are imported now, the runner shares this dict
+        self.sources.update(SourceRegistry.load(watchlist.sources() - self.sources.keys()))
+        self._align_batched()
+
+        changes = watchlist.diff(self.processor.watchlist)
+
+        # polls already in flight are matched against the new watchlist when they finish
+        old_watchlist, self.processor.watchlist = self.processor.watchlist, watchlist
+        # edited requirements are checked against the last snapshot now, the re-poll is likely to be unchanged
+        self.processor.recheck(changes.changed, old_watchlist)
+
+        for key in changes.removed:
+            self.poll_scheduler.remove(key)
+        for key in changes.added:
+            if key[0] in self.sources:
+                self.poll_scheduler.add(key, due=time.time())
+        for key in changes.changed:
+            self.poll_scheduler.reschedule(key)
+
+        self.logger.info(f"Watchlist reloaded: {len(watchlist)} item(s), {len(changes.added)} identifier(s) added, "
+                         f"{len(changes.removed)} dropped, {len(changes.changed)} changed")
+
+    def _align_batched(self):
+        # due keys are only batched with keys that come due in the same tick, so bulk lookup sources poll on a grid
+        self.poll_scheduler.align(name for name, src in self.sources.items() if src.batch_size > 1)
+
+    def _dispatch_due(self):
+        due = self.poll_scheduler.pop_due()
+        if not due:
+            return
+
+        for job in plan_jobs(due, {name: src.batch_size for name, src in self.sources.items()}):
+            self.logger.info(f"Polling '{job.name}'")
+            self._tasks.add(asyncio.create_task(self.runner.run(job)))
+
+    def _handle(self, task: asyncio.Task):
+        job, products, error = task.result()
+
+        if error is not None:
+            self.logger.error(f"Job {job.name} failed: {error}")
+            products = {}
+
+        try:
+            outcomes = self.processor.handle(job, products)
+        except Exception as e:
+            # one malformed product must not stop the daemon, its keys are rescheduled like failed polls
+            self.logger.error(f"Handling result of job {job.name} failed: {type(e).__name__}: {e}")
+            outcomes = [((job.src_name, identifier), None, None) for identifier in job.identifiers]
+
+        for key, previous, result in outcomes:
+            self.poll_scheduler.record(key, previous, result, self.processor.watchlist.user_max_price(key))
+
+    async def _drain(self):
+        if not self._tasks:
+            return
+
+        self.logger.info(f"Waiting up to {self.drain_timeout:.0f}s for {len(self._tasks)} in flight poll(s)")
+        done, pending = await asyncio.wait(self._tasks, timeout=self.drain_timeout)
+        for task in done:
+            self._handle(task)
+
+        if pending:
+            self.logger.warning(f"Cancelling {len(pending)} poll(s) that did not finish in time")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        self._tasks.clear()
+
+    def log_summary(self):
+        """what happened since the last summary"""
+        metrics = get_metrics()
+        current = metrics.snapshot()
+        elapsed = time.monotonic() - self._summary_at
+        self.logger.info(f"Daemon summary: {summarize(diff(current, self._summary_base), elapsed)}")
+
+        metrics.reset_slowest()
+        self._summary_base, self._summary_at = current, time.monotonic()
+
+    async def run(self, stop: asyncio.Event):
+        """poll until stop is set, then finish in flight polls and commit everything"""
+        self.runner.install_executor()
+        self._align_batched()
+
+        for key in self.processor.watchlist.keys(self.sources):
+            self.poll_scheduler.add(key)
+
+        self.logger.info(f"Daemon polling {len(self.poll_scheduler)} identifier(s)")
+
+        stop_waiter = asyncio.create_task(stop.wait())
+        last_commit = last_watchlist_check = time.monotonic()
+
+        try:
+            while not stop.is_set():
+                if self.watchlist_file is not None and time.monotonic() - last_watchlist_check >= WATCHLIST_CHECK_INTERVAL:
+                    last_watchlist_check = time.monotonic()
+                    if (watchlist := self.watchlist_file.reload_if_changed()) is not None:
+                        self.reload(watchlist)
+
+                self._dispatch_due()
+
+                # sleep until the next poll is due, a poll finishes, it is time to commit or we are stopped
+                timeout = min(self.commit_interval, WATCHLIST_CHECK_INTERVAL)
+                if (next_due := self.poll_scheduler.next_due_at()) is not None:
+                    timeout = min(max(next_due - time.time(), 0), timeout)
+
+                done, _ = await asyncio.wait({*self._tasks, stop_waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done - {stop_waiter}:
+                    self._tasks.discard(task)
+                    self._handle(task)
+
+                if time.monotonic() - last_commit >= self.commit_interval:
+                    self.processor.commit()
+                    last_commit = time.monotonic()
+
+                if time.monotonic() - self._summary_at >= SUMMARY_INTERVAL:
+                    self.log_summary()
+
+            self.logger.info("Daemon stopping")
+
+        finally:
+            stop_waiter.cancel()
+            await self._drain()
+            self.processor.commit()
+            self.log_summary()
@@ -1,38 +1,42 @@
 import subprocess
-import logging
-import time
 import json
+import logging
 from pathlib import Path
 
 try:
-    from .base import DataSource
+    from .base import DataSource, NOT_MODIFIED
 except ImportError:
-    from base import DataSource
+    from base import DataSource, NOT_MODIFIED
 from ..schema import Product
+from ..fetch_cache import payload_digest
+from ..retry import CircuitOpenError
 from .registry import SourceRegistry
+from .amazon_sidecar import SidecarError, get_sidecar
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 AMAZON_BUDDY_CLI = str(PROJECT_ROOT / "node_modules" / "amazon-buddy" / "bin" / "cli.js")
 
 
+def _retry_result(data):
+    # amazon-buddy sometimes comes back empty when amazon served it a captcha page
+    return "empty result" if not data else None
+
+
 class AmazonSource(DataSource):
     source_name = "amazon"
+    rate_limit = 1  # amazon starts serving captchas well before anything like an api limit
+    burst = 2
+    shared_runtime = True  # node sidecar
 
     def __init__(self, logger: logging.Logger = None):
         super().__init__(logger)
 
-    def fetch_raw(self, identifier: str) -> subprocess.CompletedProcess:
-        cmd = ["node",
-               AMAZON_BUDDY_CLI,
-               "asin",
-               f"{identifier}",
-               "--random-ua"]
-
-        self.logger.debug(f"Amazon-buddy GET request: {' '.join(cmd)}")
-
-        res = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8")
+    # asin lookup through the long running amazon-buddy sidecar (no node cold start per asin)
+    # raises SidecarError / TimeoutError on failure
+    def fetch_raw(self, identifier: str) -> list:
+        self.logger.debug(f"Amazon-buddy sidecar request: {identifier}")
 
-        return res
+        return get_sidecar(self.logger).asin(identifier)
 
     # assume input is stdout (errors shouldve been handled before this point)
     def parse(self, res) -> Product:
@@ -50,46 +54,39 @@ class AmazonSource(DataSource):
 
 
     def fetch_product(self, identifier: str):
-        # exponential backoff params
-        retries = 0
-        delay = 2
-        exp = 0
-
         try:
-            for i in range(retries):
-                self.logger.debug(f"Fetching product data for product: {identifier} (attempt: {i})")
-
-                try:
-                    response = self.fetch_raw(identifier)
-                except subprocess.TimeoutExpired:
-                    self.logger.warning(f"[{identifier}] Subprocess timed out (attempt {i})")
-                    if i >= retries - 1:
-                        return None
-                    sleep_time = (delay ** exp) / 2
-                    time.sleep(sleep_time)
-                    exp += 1
-                    continue
-
-                if response.stderr or response.stdout.startswith("Error:"):
-                    if i >= retries - 1:  # if max retries reached log and move on
-                        self.logger.warning(f"[{identifier}] amazon-buddy error: stderr={response.stderr.strip()}, stdout={response.stdout.strip()}")
-                        return None
-
-                    else:  # exp backoff wait
-                        sleep_time = (delay ** exp) / 2
-                        time.sleep(sleep_time)
-                        exp += 1
-
-                else:  # if response
-                    break
-
-            # parse the JSON output — amazon-buddy returns a JSON array
-            data = json.loads(response.stdout)
+            self.logger.debug(f"Fetching product data for product: {identifier}")
+            try:
+                data = self.call_with_retry(self.fetch_raw, identifier, retry_if=_retry_result,
+                                            retry_on=(TimeoutError, SidecarError))
+            except TimeoutError:
+                self.logger.warning(f"[{identifier}] Sidecar request timed out")
+                return None
+            except SidecarError as e:
+                self.logger.warning(f"[{identifier}] amazon-buddy error: {e}")
+                return None
+
+            # amazon-buddy returns a JSON array
             if isinstance(data, list) and len(data) > 0:
                 data = data[0]
+
+            if not data:
+                self.logger.warning(f"[{identifier}] amazon-buddy returned no result")
+                return None
+
+            digest = payload_digest(json.dumps(data, sort_keys=True))
+            if self.is_unchanged(identifier, digest):
+                self.logger.debug(f"[{identifier}] Payload unchanged, skipping parse")
+                return NOT_MODIFIED
+
             product = self.parse(data)
+            self.remember_payload(identifier, digest)
             return product
 
+        except CircuitOpenError as e:
+            self.logger.debug(f"[{identifier}] {e}")
+            return None
+
         except Exception as e:
             self.logger.error(f"[{identifier}] Failed to fetch/parse: {e}")
             return None
@@ -0,0 +1,91 @@
+// long running amazon-buddy sidecar, started once by amazon_sidecar.py instead of one node process per asin
+// protocol is line delimited json over stdin/stdout:
+//   request:  {"id": 1, "asin": "B0FQFB8FMG"}   or   {"id": 2, "ping": true}
+//   response: {"id": 1, "ok": true, "result": [...]}   or   {"id": 1, "ok": false, "error": "..."}
+// requests are handled concurrently (up to AMAZON_SIDECAR_CONCURRENCY at once), responses can arrive out of order
+// with AMAZON_BASE_URL set, lookups go to GET <base>/asin/<asin> on a stand in (benchmarks/mock_server.py)
+// which answers with what amazon-buddy would have returned, instead of scraping amazon
+const path = require('path');
+const readline = require('readline');
+
+// stdout is reserved for protocol messages, anything amazon-buddy logs goes to stderr
+console.log = console.error;
+console.info = console.error;
+
+const BASE_URL = (process.env.AMAZON_BASE_URL || '').replace(/\/+$/, '');
+const AmazonScraper = BASE_URL ? null : require(path.join(__dirname, '..', '..', 'node_modules', 'amazon-buddy'));
+
+const MAX_CONCURRENCY = parseInt(process.env.AMAZON_SIDECAR_CONCURRENCY || '4', 10);
+
+let active = 0;
+const queue = [];
+
+function send(msg) {
+    process.stdout.write(JSON.stringify(msg) + '\n');
+}
+
+async function lookup(asin) {
+    if (!BASE_URL) {
+        const data = await AmazonScraper.asin({ asin, randomUa: true });
+        return data.result;
+    }
+
+    const res = await fetch(`${BASE_URL}/asin/${encodeURIComponent(asin)}`);
+    if (!res.ok) {
+        throw new Error(`HTTP ${res.status} ${res.statusText} from ${BASE_URL}`);
+    }
+    return res.json();
+}
+
+async function handle(req) {
+    if (req.ping) {
+        send({ id: req.id, ok: true, result: 'pong' });
+        return;
+    }
+
+    try {
+        send({ id: req.id, ok: true, result: await lookup(req.asin) });
+    } catch (err) {
+        send({ id: req.id, ok: false, error: String((err && err.message) || err) });
+    }
+}
+
+function drain() {
+    while (active < MAX_CONCURRENCY && queue.length) {
+        const req = queue.shift();
+        active++;
+        handle(req).finally(() => {
+            active--;
+            drain();
+        });
+    }
+}
+
+const rl = readline.createInterface({ input: process.stdin });
+
+rl.on('line', (line) => {
+    if (!line.trim()) return;
+
+    let req;
+    try {
+        req = JSON.parse(line);
+    } catch (err) {
+        send({ id: null, ok: false, error: `invalid request: ${err.message}` });
+        return;
+    }
+
+    // pings skip the queue so health checks still answer while scrapes are in flight
+    if (req.ping) {
+        handle(req);
+        return;
+    }
+
+    queue.push(req);
+    drain();
+});
+
+// python closed our stdin - finish what is in flight then exit
+rl.on('close', () => {
+    const wait = () => (active || queue.length ? setTimeout(wait, 100) : process.exit(0));
+    wait();
+});
@@ -0,0 +1,190 @@
+# python side of the long running amazon-buddy node sidecar (see amazon_sidecar.js)
+# one node process per python process, spoken to with line delimited json over its stdin/stdout
+# many asin lookups can be in flight at once, responses are matched back to callers by request id
+import atexit
+import itertools
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+SIDECAR_JS = str(Path(__file__).resolve().parent / "amazon_sidecar.js")
+
+REQUEST_TIMEOUT = float(os.getenv("AMAZON_SIDECAR_TIMEOUT", 60))
+PING_TIMEOUT = 5
+HEALTH_CHECK_INTERVAL = 30  # ping the sidecar before use if it has been idle this long (seconds)
+
+
+class SidecarError(RuntimeError):
+    pass
+
+
+class NodeSidecar:
+    def __init__(self, script: str = SIDECAR_JS, logger: logging.Logger = None):
+        self.script = script
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.restarts = 0
+        self._proc: subprocess.Popen = None
+        self._pending: dict[int, Future] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()  # guards process lifecycle and stdin writes
+        self._last_ok = 0.0
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            ["node", self.script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,  # line buffered
+        )
+        self._last_ok = time.monotonic()
+
+        threading.Thread(target=self._read_stdout, args=(self._proc,), name="amazon-sidecar-stdout", daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self._proc,), name="amazon-sidecar-stderr", daemon=True).start()
+
+        self.logger.debug(f"Started amazon-buddy sidecar (PID {self._proc.pid})")
+
+    def _read_stdout(self, proc: subprocess.Popen):
+        for line in proc.stdout:
+            try:
+                msg = json.loads(line)
+            except json.JSONDecodeError:
+                self.logger.debug(f"Sidecar sent non json line: {line.strip()}")
+                continue
+
+            with self._lock:
+                future = self._pending.pop(msg.get("id"), None)
+                self._last_ok = time.monotonic()
+
+            if future is None:
+                continue
+            if msg.get("ok"):
+                future.set_result(msg.get("result"))
+            else:
+                future.set_exception(SidecarError(msg.get("error") or "unknown sidecar error"))
+
+        # stdout closed - the sidecar is gone, fail everything still waiting on it
+        with self._lock:
+            if self._proc is proc:
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {}
+
+        for future in pending.values():
+            future.set_exception(SidecarError(f"Sidecar exited with code {proc.wait()}"))
+
+    def _read_stderr(self, proc: subprocess.Popen):
+        for line in proc.stderr:
+            if line.strip():
+                self.logger.debug(f"amazon-buddy: {line.rstrip()}")
+
+    # caller holds self._lock
+    def _kill(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(SidecarError("Sidecar was restarted"))
+
+        try:
+            proc.kill()
+            proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+    def _send(self, payload: dict) -> Future:
+        future = Future()
+
+        with self._lock:
+            if self._proc is None or self._proc.poll() is not None:
+                if self._proc is not None:
+                    self.logger.warning(f"Sidecar died (exit code {self._proc.returncode}), restarting")
+                    self.restarts += 1
+                self._start()
+
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+
+            try:
+                self._proc.stdin.write(json.dumps({"id": request_id, **payload}) + "\n")
+                self._proc.stdin.flush()
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                self._kill()
+                raise SidecarError(f"Failed to write to sidecar: {e}") from e
+
+        return future
+
+    def _wait(self, future: Future, timeout: float):
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            with self._lock:
+                for request_id, f in list(self._pending.items()):
+                    if f is future:
+                        del self._pending[request_id]
+            raise
+
+    def ping(self, timeout: float = PING_TIMEOUT) -> bool:
+        try:
+            return self._wait(self._send({"ping": True}), timeout) == "pong"
+        except (SidecarError, TimeoutError):
+            return False
+
+    def ensure_healthy(self):
+        with self._lock:
+            idle = time.monotonic() - self._last_ok
+            running = self._proc is not None and self._proc.poll() is None
+
+        if not running or idle < HEALTH_CHECK_INTERVAL:
+            return  # nothing to check, or _send will (re)start it
+
+        if not self.ping():
+            self.logger.warning("Sidecar failed health check, restarting")
+            with self._lock:
+                self._kill()
+                self.restarts += 1
+
+    def asin(self, asin: str, timeout: float = REQUEST_TIMEOUT):
+        """Look up one asin, returns the amazon-buddy result list"""
+        self.ensure_healthy()
+        return self._wait(self._send({"asin": asin}), timeout)
+
+    def close(self):
+        with self._lock:
+            proc, self._proc = self._proc, None
+        if proc is None:
+            return
+
+        try:
+            proc.stdin.close()  # sidecar finishes in flight requests then exits
+            proc.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            proc.kill()
+
+
+_sidecar: NodeSidecar = None
+_sidecar_pid: int = None
+_sidecar_lock = threading.Lock()
+
+
+def get_sidecar(logger: logging.Logger = None) -> NodeSidecar:
+    global _sidecar, _sidecar_pid
+
+    # pipes cant be shared with forked children, so each process gets its own sidecar
+    with _sidecar_lock:
+        if _sidecar is None or _sidecar_pid != os.getpid():
+            _sidecar, _sidecar_pid = NodeSidecar(logger=logger), os.getpid()
+            atexit.register(_sidecar.close)
+
+        return _sidecar
@@ -1,10 +1,206 @@
 # defines methods and class structure for data sources (bestbuy amazon. etc.)
 from abc import ABC, abstractmethod
+import asyncio
+import functools
+import inspect
 import logging
+import os
+import time
+from contextvars import ContextVar
+
+from ..fetch_cache import get_fetch_cache
+from ..metrics import get_metrics
+from ..rate_limit import get_rate_limiter
+from ..retry import CircuitOpenError, get_retry_policy, retry_after
+
+FETCH_CACHE_ENABLED = os.getenv("FETCH_CACHE", "1") != "0"
+
+
+class _NotModified:
+    def __repr__(self):
+        return "NOT_MODIFIED"
+
+    def __reduce__(self):  # unpickles to the same singleton in the parent process
+        return "NOT_MODIFIED"
+
+
+# returned by fetch_product(s) in place of a Product when the payload is identical to the last one seen
+NOT_MODIFIED = _NotModified()
+
+
+class FetchResults(dict):
+    """
+    identifier -> Product / NOT_MODIFIED / None, as returned by fetch_products / afetch_products
+    payloads holds identifier -> (digest, etag, last_modified) for the fetch cache. they are only stored
+    once the result is committed (ResultProcessor.commit), a payload marked as seen before its snapshot
+    is saved would turn the next fetch into NOT_MODIFIED and lose the change if the sweep dies in between
+    """
+
+    def __init__(self, results=(), payloads: dict = None):
+        super().__init__(results)
+        self.payloads = payloads or {}
+
+
+_pending_payloads: ContextVar = ContextVar("pending_payloads", default=None)
+
+
+def _collect_payloads(fn):
+    """fetch_products / afetch_products return FetchResults with the payloads remembered while they ran"""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, identifiers):
+            if _pending_payloads.get() is not None:  # nested (EG: afetch_products -> fetch_products)
+                return await fn(self, identifiers)
+            pending = {}
+            token = _pending_payloads.set(pending)
+            try:
+                results = await fn(self, identifiers)
+            finally:
+                _pending_payloads.reset(token)
+            return FetchResults(results, pending)
+    else:
+        @functools.wraps(fn)
+        def wrapper(self, identifiers):
+            if _pending_payloads.get() is not None:
+                return fn(self, identifiers)
+            pending = {}
+            token = _pending_payloads.set(pending)
+            try:
+                results = fn(self, identifiers)
+            finally:
+                _pending_payloads.reset(token)
+            return FetchResults(results, pending)
+
+    return wrapper
+
+
+# strategy methods that get timed on every source (method name -> metric stage)
+INSTRUMENTED = {
+    "fetch_product": "fetch",
+    "afetch_product": "fetch",
+    "fetch_raw": "fetch_raw",
+    "fetch_raw_batch": "fetch_raw",
+    "parse": "parse",
+}
+
+_current_fetch: ContextVar = ContextVar("current_fetch", default=None)
+
+
+def _raw_outcome(result) -> str:
+    """outcome of a fetch_raw call from what it returned (requests Response, crawl4ai CrawlResult, ...)"""
+    if result is None:
+        return "blocked"  # challenge page / nothing usable on the page
+    status = getattr(result, "status_code", None)
+    if status == 304:
+        return "not_modified"
+    if status is not None and status >= 400:
+        return "http_error"
+    if getattr(result, "success", True) is False:
+        return "http_error"
+    return "ok"
+
+
+class _Stage:
+    """times one strategy call. failures of fetch_raw / parse are remembered on the fetch they happen in,
+    so a fetch that ends in None is labelled blocked / http_error / parse_error instead of just failed"""
+
+    def __init__(self, source: str, stage: str, identifier=None):
+        self.source = source
+        self.stage = stage
+        self.identifier = identifier
+        self.failure = None
+        self._token = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        if self.stage == "fetch":
+            self._token = _current_fetch.set(self)
+        return self
+
+    def finish(self, result=None, error: BaseException = None):
+        elapsed = time.perf_counter() - self.start
+        if self._token is not None:
+            _current_fetch.reset(self._token)
+
+        if self.stage == "parse":
+            outcome = "parse_error" if error is not None else "ok"
+        elif self.stage == "fetch_raw":
+            outcome = "error" if error is not None else _raw_outcome(result)
+        elif error is None and result is NOT_MODIFIED:
+            outcome = "not_modified"
+        elif error is None and result is not None:
+            outcome = "ok"
+        else:
+            outcome = self.failure or "error"
+
+        if self.stage != "fetch" and outcome not in ("ok", "not_modified"):
+            _mark_fetch(outcome)
+
+        metrics = get_metrics()
+        metrics.observe(f"{self.stage}_seconds", elapsed, source=self.source, outcome=outcome)
+        if self.stage == "fetch":
+            metrics.note_slow(elapsed, f"{self.source}:{self.identifier}")
+
+
+def _instrument(fn, stage: str):
+    def begin(self, args):
+        # fetch_product of browser sources runs afetch_product on its own loop, only the outer call counts
+        if stage == "fetch" and _current_fetch.get() is not None:
+            return None
+        return _Stage(self.source_name, stage, args[0] if args else None).__enter__()
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            if (timer := begin(self, args)) is None:
+                return await fn(self, *args, **kwargs)
+            try:
+                result = await fn(self, *args, **kwargs)
+            except BaseException as e:
+                timer.finish(error=e)
+                raise
+            timer.finish(result)
+            return result
+    else:
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            if (timer := begin(self, args)) is None:
+                return fn(self, *args, **kwargs)
+            try:
+                result = fn(self, *args, **kwargs)
+            except BaseException as e:
+                timer.finish(error=e)
+                raise
+            timer.finish(result)
+            return result
+
+    return wrapper
+
+
+def _mark_fetch(outcome: str):
+    if fetch := _current_fetch.get():
+        fetch.failure = outcome
 
 
 class DataSource(ABC):
     source_name: str  # class variable
+    batch_size: int = 1  # max identifiers per fetch_products call, > 1 if the source has a bulk lookup
+    retry_attempts: int = None  # attempts per fetch, None = RETRY_ATTEMPTS
+    rate_limit: float = 0  # requests per second across all workers, 0 = unlimited (<NAME>_RPS overrides it)
+    burst: int = 1  # requests that may go out back to back after a quiet spell (<NAME>_BURST)
+    # True if the source keeps a process wide runtime (warm browser pool, node sidecar). pool mode then fetches
+    # it on threads in the main process, so a sweep starts one of those instead of one per worker
+    shared_runtime: bool = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every source gets timers around its strategy methods without having to call into metrics itself
+        for name, stage in INSTRUMENTED.items():
+            if name in cls.__dict__:
+                setattr(cls, name, _instrument(cls.__dict__[name], stage))
+        for name in ("fetch_products", "afetch_products"):
+            if name in cls.__dict__:
+                setattr(cls, name, _collect_payloads(cls.__dict__[name]))
 
     def __init__(self, logger: logging.Logger = None):
         # either use provided logger or create null logger
@@ -25,6 +221,90 @@ class DataSource(ABC):
     def fetch_product(self, identifier: str):
         pass
 
+    # fetch many products at once - returns {identifier: Product or None}
+    # sources with a bulk api override this, everything else falls back to one fetch per identifier
+    @_collect_payloads
+    def fetch_products(self, identifiers) -> dict:
+        return {identifier: self.fetch_product(identifier) for identifier in identifiers}
+
+    # async variants for the single event loop mode
+    # blocking sources fall back to a worker thread, browser based ones override afetch_product natively
+    async def afetch_product(self, identifier: str):
+        return await asyncio.to_thread(self.fetch_product, identifier)
+
+    @_collect_payloads
+    async def afetch_products(self, identifiers) -> dict:
+        if self.batch_size > 1:  # one blocking bulk call covers the whole batch
+            return await asyncio.to_thread(self.fetch_products, identifiers)
+
+        results = await asyncio.gather(*(self.afetch_product(identifier) for identifier in identifiers))
+        return dict(zip(identifiers, results))
+
+    # fetch cache helpers - keyed by (source_name, identifier)
+    def conditional_headers(self, identifier) -> dict:
+        if not FETCH_CACHE_ENABLED:
+            return {}
+        return get_fetch_cache().conditional_headers(self.source_name, identifier)
+
+    def is_unchanged(self, identifier, digest: str) -> bool:
+        if not FETCH_CACHE_ENABLED:
+            return False
+        return get_fetch_cache().is_unchanged(self.source_name, identifier, digest)
+
+    # only call once the payload parsed fine, otherwise a broken payload would be skipped forever
+    # inside fetch_products the payload travels back with the results and is stored with the snapshot,
+    # a direct fetch_product call (EG: a module's __main__) stores it straight away
+    def remember_payload(self, identifier, digest: str, etag: str = None, last_modified: str = None):
+        if not FETCH_CACHE_ENABLED:
+            return
+        if (pending := _pending_payloads.get()) is not None:
+            pending[identifier] = (digest, etag, last_modified)
+        else:
+            get_fetch_cache().store(self.source_name, identifier, digest, etag, last_modified)
+
+    # every attempt waits for this source's token bucket (rate_limit.py), a Retry-After pauses it for all workers
+    def _rate_limited(self, fn):
+        if (bucket := get_rate_limiter(self.source_name, self.rate_limit, self.burst)) is None:
+            return fn
+
+        def paused(result):
+            if (seconds := retry_after(result)) is not None:
+                self.logger.info(f"{self.source_name} sent Retry-After {seconds:g}s, pausing requests")
+                bucket.pause(seconds)
+            return result
+
+        if inspect.iscoroutinefunction(fn):
+            async def limited(*args):
+                await bucket.aacquire()
+                result = await fn(*args)
+                if retry_after(result) is not None:  # pausing writes to sqlite, keep it off the loop
+                    await asyncio.to_thread(paused, result)
+                return result
+        else:
+            def limited(*args):
+                bucket.acquire()
+                return paused(fn(*args))
+        return limited
+
+    # fetch_raw & co through this source's retry policy (backoff, retry budget, circuit breaker - see retry.py)
+    # and rate limit. retry_if(result) -> reason to retry or None, retry_on = exception types worth retrying
+    # raises CircuitOpenError without calling fn while the source is being skipped
+    def call_with_retry(self, fn, *args, retry_if=None, retry_on: tuple = ()):
+        try:
+            return get_retry_policy(self.source_name, self.retry_attempts).call(
+                self._rate_limited(fn), *args, retry_if=retry_if, retry_on=retry_on, logger=self.logger)
+        except CircuitOpenError:
+            _mark_fetch("circuit_open")
+            raise
+
+    async def acall_with_retry(self, fn, *args, retry_if=None, retry_on: tuple = ()):
+        try:
+            return await get_retry_policy(self.source_name, self.retry_attempts).acall(
+                self._rate_limited(fn), *args, retry_if=retry_if, retry_on=retry_on, logger=self.logger)
+        except CircuitOpenError:
+            _mark_fetch("circuit_open")
+            raise
+
 
     def can_handle(self, retailer_name):
         return self.source_name == retailer_name
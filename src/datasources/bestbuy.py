@@ -1,54 +1,77 @@
 from dotenv import load_dotenv
 import os
-import requests
+import json
 import logging
-import time
+
+import requests
 
 try:
-    from .base import DataSource
+    from .base import DataSource, NOT_MODIFIED
 except ImportError:
-    from base import DataSource
+    from base import DataSource, NOT_MODIFIED
 from ..schema import Product
+from ..fetch_cache import payload_digest
+from .. import http_client
+from ..endpoints import base_url
+from ..retry import CircuitOpenError, retry_http
 from .registry import SourceRegistry
 
 load_dotenv()
 
+API_URL = base_url("BESTBUY", "https://api.bestbuy.com/v1")  # BESTBUY_BASE_URL to use a stand in
+
 FIELDS_ARR = ["sku", "orderable", "name", "onSale", "regularPrice", "salePrice", "url"]
 FIELDS = ','.join(FIELDS_ARR)
 
+BATCH_SIZE = 100  # max pageSize the products api allows
+RATE_LIMIT = 5  # calls per second the api allows per key
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/121.0.0.0 Safari/537.36"
+    ),
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
+    "Referer": "https://www.bestbuy.com/",
+    "Origin": "https://www.bestbuy.com",
+    "Cache-Control": "no-cache, no-store, max-age=0",
+    "Pragma": "no-cache",
+}
+
 
 class BestbuySource(DataSource):
     source_name = "bestbuy"
+    batch_size = BATCH_SIZE
+    rate_limit = RATE_LIMIT
+    burst = RATE_LIMIT
 
     def __init__(self, logger: logging.Logger = None):
         super().__init__(logger)
 
     def fetch_raw(self, identifier: str) -> dict:
-        headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/121.0.0.0 Safari/537.36"
-            ),
-            "Accept": "application/json, text/plain, */*",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Connection": "keep-alive",
-            "Referer": "https://www.bestbuy.com/",
-            "Origin": "https://www.bestbuy.com",
-            "Cache-Control": "no-cache, no-store, max-age=0",
-            "Pragma": "no-cache",
-        }
-
-        url = f"https://api.bestbuy.com/v1/products/{identifier}.json?show={FIELDS}&apiKey={os.getenv('BESTBUY_API')}"
+        url = f"{API_URL}/products/{identifier}.json?show={FIELDS}&apiKey={os.getenv('BESTBUY_API')}"
 
         self.logger.debug(f"GET request from URL: {url}")
 
-        return requests.get(url, headers=headers)
+        # conditional request - api answers 304 if nothing changed since the last stored response
+        return http_client.get(url, headers={**HEADERS, **self.conditional_headers(identifier)})
+
+    # one request for up to BATCH_SIZE skus via the sku in(...) filter
+    def fetch_raw_batch(self, identifiers) -> dict:
+        skus = ",".join(identifiers)
+        url = f"{API_URL}/products(sku in({skus}))?format=json&show={FIELDS}&pageSize={BATCH_SIZE}&apiKey={os.getenv('BESTBUY_API')}"
+
+        self.logger.debug(f"GET request from URL: {url}")
+
+        return http_client.get(url, headers=HEADERS)
 
     def parse(self, res: dict) -> dict:
         return Product(
-            identifier=res["sku"],
+            identifier=str(res["sku"]),  # the api returns skus as numbers
             product_name=" ".join(res["name"].split()[:5]),  # product name truncated to 5 words
             in_stock=True if res["orderable"] == "Available" else False,
             on_sale=res["onSale"],
@@ -60,36 +83,80 @@ class BestbuySource(DataSource):
         )
 
     def fetch_product(self, identifier: str):
-        # exponential backoff params
-        retries = 0
-        delay = 2
-        exp = 0
-
         try:
-            for i in range(retries):
-                self.logger.debug(f"Fetching product data for product: {identifier} (attempt: {i})")
-                response = self.fetch_raw(identifier)
+            self.logger.debug(f"Fetching product data for product: {identifier}")
+            response = self.call_with_retry(self.fetch_raw, identifier,
+                                            retry_if=retry_http, retry_on=(requests.RequestException,))
 
-                if not response.ok:
-                    if i >= retries - 1:  # if max retries reached, log error and return None
-                        self.logger.warning(f"[{identifier}] HTTP {response.status_code}: {response.reason}")
-                        return None
+            if not response.ok:
+                self.logger.warning(f"[{identifier}] HTTP {response.status_code}: {response.reason}")
+                return None
 
-                    else:  # otherwise continue with exponential backoff
-                        sleep_time = (delay ** exp) / 2
-                        time.sleep(sleep_time)
-                        exp += 1
+            if response.status_code == 304:
+                self.logger.debug(f"[{identifier}] Not modified (304)")
+                return NOT_MODIFIED
 
-                else:  # if response==200
-                    break
+            digest = payload_digest(response.content)
+            if self.is_unchanged(identifier, digest):
+                self.logger.debug(f"[{identifier}] Payload unchanged, skipping parse")
+                return NOT_MODIFIED
 
             product = self.parse(response.json())
+            self.remember_payload(identifier, digest, response.headers.get("ETag"), response.headers.get("Last-Modified"))
             return product
 
+        except CircuitOpenError as e:
+            self.logger.debug(f"[{identifier}] {e}")
+            return None
+
         except Exception as e:
             self.logger.error(f"[{identifier}] Failed to fetch/parse: {e}")
             return None
 
+    def fetch_products(self, identifiers) -> dict:
+        products = {identifier: None for identifier in identifiers}
+
+        # skus go straight into the query string so only allow plain numbers through
+        skus = [identifier for identifier in identifiers if identifier.isdigit()]
+        if invalid := [identifier for identifier in identifiers if not identifier.isdigit()]:
+            self.logger.warning(f"Skipping invalid sku(s): {invalid}")
+
+        for i in range(0, len(skus), BATCH_SIZE):
+            chunk = skus[i:i + BATCH_SIZE]
+            self.logger.debug(f"Fetching product data for {len(chunk)} product(s): {chunk}")
+
+            try:
+                response = self.call_with_retry(self.fetch_raw_batch, chunk,
+                                                retry_if=retry_http, retry_on=(requests.RequestException,))
+
+                if not response.ok:
+                    self.logger.warning(f"[batch of {len(chunk)}] HTTP {response.status_code}: {response.reason}")
+                    continue
+
+                # one response covers many skus, so change detection is per product rather than via etag
+                for res in response.json().get("products", []):
+                    sku = str(res["sku"])
+                    digest = payload_digest(json.dumps(res, sort_keys=True))
+
+                    if self.is_unchanged(sku, digest):
+                        products[sku] = NOT_MODIFIED
+                        continue
+
+                    products[sku] = self.parse(res)
+                    self.remember_payload(sku, digest)
+
+            except CircuitOpenError as e:
+                self.logger.warning(f"[batch of {len(chunk)}] {e}, skipping the remaining batches")
+                break
+
+            except Exception as e:
+                self.logger.error(f"[batch of {len(chunk)}] Failed to fetch/parse: {e}")
+
+        for identifier in skus:
+            if products[identifier] is None:
+                self.logger.warning(f"[{identifier}] Not returned by batch lookup")
+
+        return products
 
 
 # manually register datasource to registry
@@ -1,32 +1,45 @@
 import asyncio
+import atexit
 import json
 import logging
 import os
 import platform
 import re
 import sys
-import time
+import threading
+from dataclasses import dataclass
 from pathlib import Path
+from urllib.parse import urlsplit
 
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
+from crawl4ai import BrowserConfig
 
 try:
-    from .base import DataSource
+    from .base import DataSource, NOT_MODIFIED
 except ImportError:
-    from base import DataSource
+    from base import DataSource, NOT_MODIFIED
 from ..schema import Product
+from ..crawl_mode_cache import HEADED, HEADLESS, get_crawl_mode_cache
+from ..endpoints import base_url, hosts, rebase
+from ..fetch_cache import payload_digest
+from ..retry import CircuitOpenError
 from .registry import SourceRegistry
+from .browser_pool import browser_pool
+from .crawl_profile import CRAWL_ERRORS, CrawlProfile, WAIT_UNTIL_JS
 
 
 
 PROFILE_DIR = Path(__file__).parent / ".browser_profile"
+HEADED_PROFILE_DIR = Path(__file__).parent / ".browser_profile_headed"  # chromium locks a profile dir per browser
+
+BROWSER_PROFILE = "bhvideo"
+HEADED_BROWSER_PROFILE = "bhvideo-headed"
 
 IN_STOCK_SUFFIXES = frozenset({"/InStock", "/LimitedAvailability", "/OnlineOnly", "/BackOrder"})
 
-JSON_LD_RE = re.compile(
-    r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>\s*(.*?)\s*</script>',
-    re.DOTALL | re.IGNORECASE,
-)
+# the page is scanned once, front to back, for just these two markers and the scan stops as soon as
+# both the json-ld Product block and the pricing container have been seen
+MARKER_RE = re.compile(r'application/ld\+json|data-selenium="pricingContainer"', re.IGNORECASE)
+PRICING_WINDOW = 2000  # chars of the pricing container that are kept
 LIST_PRICE_LABEL_RE = re.compile(
     r'(?:list\s+price|msrp|manufacturer[\'s]*\s+(?:suggested\s+)?(?:retail\s+)?price'
     r'|regular\s+price|orig(?:inal)?\s+price|was\s*:?|before\s+discount)'
@@ -35,21 +48,114 @@ LIST_PRICE_LABEL_RE = re.compile(
 )
 DOLLAR_RE = re.compile(r'\$\s*([\d,]+(?:\.\d{1,2})?)')
 
+BASE_URL = base_url("BHVIDEO")  # BHVIDEO_BASE_URL to crawl a stand in instead of bhphotovideo.com
 
-def _extract_product_jsonld(html):
-    for m in JSON_LD_RE.finditer(html):
-        try:
-            data = json.loads(m.group(1))
-        except (json.JSONDecodeError, ValueError):
-            continue
-        for obj in (data if isinstance(data, list) else [data]):
-            if isinstance(obj, dict) and obj.get("@type") == "Product":
-                return obj
+# the cloudflare challenge has to load for the headed fallback to get through it
+CRAWL_PROFILE = CrawlProfile(first_party=("bhphotovideo.com", "bhphoto.com", *hosts(BASE_URL)),
+                             allow=("challenges.cloudflare.com",))
+
+# runs in the page: pulls out the json-ld Product and the start of the pricing container and appends them
+# as one small script tag at the end of <body>, so python never has to scan the multi megabyte page
+_JS = WAIT_UNTIL_JS + r"""
+(async () => {
+    // ready once the product json-ld and the pricing container are there, a cloudflare challenge
+    // page never gets either so stop waiting as soon as one shows up
+    await waitUntil(() => document.title.includes('Just a moment')
+                          || (document.querySelector('script[type="application/ld+json"]')
+                              && document.querySelector('[data-selenium="pricingContainer"]')), %d);
+
+    const out = { product: null, pricing: '' };
+
+    for (const s of document.querySelectorAll('script[type="application/ld+json"]')) {
+        let d;
+        try { d = JSON.parse(s.textContent); } catch (_) { continue; }
+        out.product = (Array.isArray(d) ? d : [d]).find(o => o && o['@type'] === 'Product') ?? null;
+        if (out.product) break;
+    }
+
+    const pricing = document.querySelector('[data-selenium="pricingContainer"]');
+    if (pricing) out.pricing = pricing.outerHTML.slice(0, %d);
+
+    const tag = document.createElement('script');
+    tag.type        = 'text/x-scraper-data';
+    tag.textContent = JSON.stringify(out).replace(/</g, '\\u003c');  // keep '</script>' out of the tag
+    document.body.appendChild(tag);
+})();
+""" % (CRAWL_PROFILE.ready_timeout_ms, PRICING_WINDOW)
+INJECTED_MARKER = 'type="text/x-scraper-data"'
+
+
+@dataclass
+class BHPage:
+    product_ld: dict  # schema.org Product json-ld
+    pricing_html: str  # first PRICING_WINDOW chars of the pricing container, '' if there is none
+
+    # hash of exactly what parse() reads - the rest of the page carries per request noise (nonces, tracking ids)
+    def digest(self) -> str:
+        return payload_digest(json.dumps(self.product_ld, sort_keys=True) + "\n" + self.pricing_html)
+
+
+def _product_from_jsonld(block):
+    try:
+        data = json.loads(block)
+    except (json.JSONDecodeError, ValueError):
+        return None
+    for obj in (data if isinstance(data, list) else [data]):
+        if isinstance(obj, dict) and obj.get("@type") == "Product":
+            return obj
     return None
 
 
-def _find_list_price(html, current_price):
-    for m in LIST_PRICE_LABEL_RE.finditer(html):
+# single forward pass fallback for when the in page script did not run
+def _scan_page(html) -> BHPage:
+    product_ld = None
+    pricing_html = None
+
+    pos = 0
+    while product_ld is None or pricing_html is None:
+        if not (m := MARKER_RE.search(html, pos)):
+            break
+
+        if m.group(0).lower() == "application/ld+json":
+            start = html.find(">", m.end()) + 1
+            end = html.find("</script>", start)
+            if not start or end == -1:
+                break
+            if product_ld is None:
+                product_ld = _product_from_jsonld(html[start:end])
+            pos = end
+
+        else:
+            if pricing_html is None:
+                start = html.rfind("<", 0, m.start())
+                pricing_html = html[start: start + PRICING_WINDOW] if start != -1 else ""
+            pos = m.end()
+
+    # cloudflare chal page wont have jsonld
+    if product_ld is None:
+        return None
+    return BHPage(product_ld, pricing_html or "")
+
+
+# the in page script's output sits at the very end of <body>, so it is found by searching backwards
+def _extract_page(html) -> BHPage:
+    if (idx := html.rfind(INJECTED_MARKER)) == -1:
+        return _scan_page(html)
+
+    start = html.find(">", idx) + 1
+    end = html.find("</script>", start)
+    try:
+        data = json.loads(html[start:end])
+    except (json.JSONDecodeError, ValueError):
+        return _scan_page(html)
+
+    if not isinstance(data.get("product"), dict):
+        return None  # cloudflare chal page
+    return BHPage(data["product"], data.get("pricing") or "")
+
+
+def _find_list_price(pricing_html, current_price):
+    for m in LIST_PRICE_LABEL_RE.finditer(pricing_html):
         try:
             candidate = float(m.group(1).replace(",", ""))
         except ValueError:
@@ -58,82 +164,129 @@ def _find_list_price(html, current_price):
             return candidate
 
     # Fall back to scanning all dollar amounts in the pricing container
-    idx = html.find('data-selenium="pricingContainer"')
-    if idx == -1:
-        return None
-    start = html.rfind("<", 0, idx)
-    if start == -1:
-        return None
-    region = html[start: start + 2000]
-    amounts = [float(m.group(1).replace(",", "")) for m in DOLLAR_RE.finditer(region)]
+    amounts = [float(m.group(1).replace(",", "")) for m in DOLLAR_RE.finditer(pricing_html)]
     if higher := [v for v in amounts if v > current_price * 1.01]:  # walrus operator bomboclaat
         return max(higher)
     return None
 
 
-# start Xvfb virtual framebuffer on headless Linux so headed browser can open
-# returns display object (call .stop() when done) or none
-def _start_virtual_display():
+# one Xvfb virtual framebuffer on headless Linux so the headed browser can open, started the first time
+# a headed browser launches and kept for the life of the process (starting one per crawl cost seconds)
+_display = None
+_display_lock = threading.Lock()
+
+
+def _ensure_virtual_display():
+    global _display
+
     if platform.system() != "Linux" or os.environ.get("DISPLAY"):
-        return None
-    try:
-        from pyvirtualdisplay import Display  # noqa: PLC0415
-        display = Display(visible=False, size=(1280, 720))
-        display.start()
-        return display
-    except Exception:
-        return None
+        return
+    with _display_lock:
+        if _display is not None:
+            return
+        try:
+            from pyvirtualdisplay import Display  # noqa: PLC0415
+            _display = Display(visible=False, size=(1280, 720))
+            _display.start()  # sets DISPLAY for browsers launched from now on
+        except Exception:
+            _display = None
+
+
+def _stop_virtual_display():
+    global _display
+
+    with _display_lock:
+        display, _display = _display, None
+    if display is not None:
+        display.stop()
+
+
+# registered on import, before the browser pool registers its own cleanup, so atexit (last in first out)
+# only stops the display once the headed browser has been closed
+atexit.register(_stop_virtual_display)
+
+
+# each pooled browser needs its own persistent profile dir, slot 0 keeps the original one
+def _profile_dir(slot):
+    return PROFILE_DIR if slot == 0 else PROFILE_DIR.with_name(f"{PROFILE_DIR.name}_{slot}")
 
 
-async def _fetch_html(url, headless):
-    async with AsyncWebCrawler(config=BrowserConfig(
+def _browser_config(slot, headless=True):
+    user_data_dir = _profile_dir(slot) if headless else HEADED_PROFILE_DIR
+    user_data_dir.mkdir(exist_ok=True)
+
+    return BrowserConfig(
         browser_type="chromium",
         headless=headless,
         use_persistent_context=True,
-        user_data_dir=str(PROFILE_DIR),
+        user_data_dir=str(user_data_dir),
         verbose=False,
-    )) as crawler:
-        result = await crawler.arun(url=url, config=CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS,
-            delay_before_return_html=4.0,
-            page_timeout=60_000,
-            verbose=False,
-        ))
+    )
+
+
+def _setup_headed(crawler):
+    _ensure_virtual_display()
+    CRAWL_PROFILE.install(crawler)
+
+
+browser_pool.register(BROWSER_PROFILE, _browser_config, setup=CRAWL_PROFILE.install)
+# chromium locks its profile dir, so there is a single headed browser
+browser_pool.register(HEADED_BROWSER_PROFILE, lambda slot: _browser_config(slot, headless=False), size=1, setup=_setup_headed)
+
+
+async def _fetch_page(url, headless) -> BHPage:
+    url = rebase(url, BASE_URL)
+    if headless:
+        # warm browser from the shared pool
+        result = await browser_pool.arun(BROWSER_PROFILE, url, CRAWL_PROFILE.run_config(_JS))
+    else:
+        # the headed run is there to get through the cloudflare challenge, which navigates away from the
+        # first page (and the in page script with it), so just wait for the real product page to show up
+        run_cfg = CRAWL_PROFILE.run_config(wait_for='css:[data-selenium="pricingContainer"]')
+        result = await browser_pool.arun(HEADED_BROWSER_PROFILE, url, run_cfg)
+
     if not result.success:
         return None
-    html = result.html or ""
 
-    # cloudflare chal page wont have jsonld
-    return html if "application/ld+json" in html else None
+    return _extract_page(result.html or "")
+
+
+def _retry_page(page):
+    return "blocked by cloudflare" if page is None else None
 
 
 class BHVideoSource(DataSource):
     source_name = "bhvideo"
+    retry_attempts = 2  # every attempt already tries headless and headed, so each one costs up to two page loads
+    rate_limit = 0.5  # cloudflare is quick to challenge a burst of page loads
+    burst = 2
+    shared_runtime = True  # browser pool
 
     def __init__(self, logger: logging.Logger = None):
         super().__init__(logger)
 
 
-    async def fetch_raw(self, identifier: str) -> str:
-        PROFILE_DIR.mkdir(exist_ok=True)
+    async def fetch_raw(self, identifier: str) -> BHPage:
+        # start with whichever mode last got through cloudflare for this domain, headless if unknown
+        domain = urlsplit(identifier).hostname or identifier
+        modes = get_crawl_mode_cache()
+        order = [HEADED, HEADLESS] if modes.get(domain) == HEADED else [HEADLESS, HEADED]
 
-        self.logger.debug(f"crawl4ai GET request (headless): {identifier}")
-        html = await _fetch_html(identifier, headless=True)
+        for mode in order:
+            self.logger.debug(f"crawl4ai GET request ({mode}): {identifier}")
+            page = await _fetch_page(identifier, headless=mode == HEADLESS)
 
-        if html is None:
-            self.logger.debug(f"Headless fetch blocked, retrying in headed mode: {identifier}")
-            display = _start_virtual_display()
-            try:
-                html = await _fetch_html(identifier, headless=False)
-            finally:
-                if display:
-                    display.stop()
+            if page is not None:
+                modes.set(domain, mode)
+                return page
 
-        return html
+            self.logger.debug(f"{mode.capitalize()} fetch blocked: {identifier}")
 
+        return None
 
-    def parse(self, raw_data: str, url: str) -> Product:
-        if not (product_ld := _extract_product_jsonld(raw_data)):  # another walrus operator (am i the goat??)
+
+    def parse(self, raw_data: BHPage, url: str) -> Product:
+        if not (product_ld := raw_data.product_ld):  # another walrus operator (am i the goat??)
             self.logger.warning("No schema.org/Product JSON-LD found in HTML")
             raise RuntimeError("No schema.org/Product JSON-LD found. The page structure may have changed.")
 
@@ -152,7 +305,7 @@ class BHVideoSource(DataSource):
         if current_price is None:
             self.logger.warning(f"Could not parse price: {raw!r}")
 
-        list_price = _find_list_price(raw_data, current_price) if current_price is not None else None
+        list_price = _find_list_price(raw_data.pricing_html, current_price) if current_price is not None else None
 
         return Product(
             identifier=url,
@@ -171,27 +324,32 @@ class BHVideoSource(DataSource):
         if hasattr(sys.stdout, "reconfigure"):
             sys.stdout.reconfigure(encoding="utf-8", errors="replace")
 
-        retries = 0
-        delay = 2
-        exp = 0
+        return asyncio.run(self.afetch_product(identifier))
+
 
+    async def afetch_product(self, identifier: str):
         try:
-            for i in range(retries):
-                self.logger.debug(f"Fetching product data for product: {identifier} (attempt: {i})")
+            self.logger.debug(f"Fetching product data for product: {identifier}")
+            page = await self.acall_with_retry(self.fetch_raw, identifier, retry_if=_retry_page,
+                                               retry_on=CRAWL_ERRORS)
 
-                html = asyncio.run(self.fetch_raw(identifier))
+            if page is None:
+                self.logger.warning("Failed to load page: Cloudflare blocked in both headless and headed modes")
+                return None
 
-                if html is not None:
-                    break
+            digest = page.digest()
+            if self.is_unchanged(identifier, digest):
+                self.logger.debug(f"[{identifier}] Payload unchanged, skipping parse")
+                return NOT_MODIFIED
 
-                if i >= retries - 1:
-                    self.logger.warning("Failed to load page: Cloudflare blocked in both headless and headed modes")
-                    return None
+            product = self.parse(page, identifier)
+            self.remember_payload(identifier, digest)
 
-                time.sleep((delay ** exp) / 2)
-                exp += 1
+            return product
 
-            return self.parse(html, identifier)
+        except CircuitOpenError as e:
+            self.logger.debug(f"[{identifier}] {e}")
+            return None
 
         except Exception as e:
             self.logger.error(f"[{identifier}] Failed to fetch/parse: {e}")
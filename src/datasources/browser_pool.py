@@ -0,0 +1,248 @@
+# long lived pool of warm crawl4ai browsers, shared by the browser based datasources
+# each profile (one BrowserConfig shape) keeps up to N browsers alive, crawls borrow one and open a
+# fresh tab in it via crawler.arun(). browsers are recycled after a number of pages or when a
+# browser's own processes use too much memory
+#
+# the browsers live on a dedicated event loop thread, so callers can use them from asyncio.run(),
+# from a long lived event loop or from plain blocking code
+import asyncio
+import atexit
+import logging
+import os
+import platform
+import threading
+from collections import deque
+from pathlib import Path
+
+from crawl4ai import AsyncWebCrawler
+
+from ..metrics import get_metrics
+
+DEFAULT_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", 2))  # warm browsers per profile
+DEFAULT_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", 50))  # pages before a browser is recycled
+DEFAULT_MAX_MEMORY_MB = int(os.getenv("BROWSER_MAX_MEMORY_MB", 1024))  # pss budget per browser process tree
+
+BROWSER_NAMES = ("chrom", "headless_shell", "msedge")  # /proc/<pid>/comm of browser processes
+
+
+# memory is measured per browser from /proc - linux only, elsewhere memory based recycling is disabled
+def _process_tree() -> dict[int, int]:
+    """pid -> parent pid of every process"""
+    parents = {}
+    if platform.system() != "Linux":
+        return parents
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        parents[int(entry.name)] = int(stat[stat.rfind(")") + 2:].split()[1])  # process name can contain spaces
+    return parents
+
+
+def _descendants(root: int, parents: dict[int, int]) -> set[int]:
+    children: dict[int, list[int]] = {}
+    for pid, parent in parents.items():
+        children.setdefault(parent, []).append(pid)
+
+    found, stack = set(), [root]
+    while stack:
+        for child in children.get(stack.pop(), ()):
+            found.add(child)
+            stack.append(child)
+    return found
+
+
+def _is_browser(pid: int) -> bool:
+    try:
+        comm = Path(f"/proc/{pid}/comm").read_text().strip().lower()
+    except OSError:
+        return False
+    return any(name in comm for name in BROWSER_NAMES)
+
+
+def _browser_pid(known: set[int]) -> int:
+    """main process of a browser launched since known (our descendants back then) was taken, None if not found"""
+    if platform.system() != "Linux":
+        return None
+    parents = _process_tree()
+    for pid in sorted(_descendants(os.getpid(), parents) - known):
+        if _is_browser(pid) and not _is_browser(parents.get(pid, 0)):  # renderers / gpu etc are its children
+            return pid
+    return None
+
+
+def _tree_pss_mb(root: int) -> float:
+    """proportional set size of root and everything under it, shared pages are split between the processes
+    sharing them instead of being counted once per renderer like rss"""
+    total_kb = 0
+    for pid in {root} | _descendants(root, _process_tree()):
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue  # exited meanwhile or not ours to read
+    return total_kb / 1024
+
+
+class _Browser:
+    def __init__(self, crawler: AsyncWebCrawler, slot: int, pid: int = None):
+        self.crawler = crawler
+        self.slot = slot
+        self.pid = pid  # browser main process, None if it could not be found (no memory check then)
+        self.pages = 0
+
+
+class _Profile:
+    def __init__(self, factory, size: int, setup=None):
+        self.factory = factory  # slot index -> BrowserConfig
+        self.size = size
+        self.setup = setup  # called with every new crawler before it starts (hooks etc)
+        self.idle: deque[_Browser] = deque()
+        self.free_slots = deque(range(size))
+        self.available: asyncio.Condition = None  # created lazily on the pool loop
+
+
+class BrowserPool:
+    def __init__(self, max_pages: int = DEFAULT_MAX_PAGES, max_memory_mb: int = DEFAULT_MAX_MEMORY_MB,
+                 logger: logging.Logger = None):
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.launches = 0
+        self._profiles: dict[str, _Profile] = {}
+        self._loop: asyncio.AbstractEventLoop = None
+        self._thread: threading.Thread = None
+        self._lock = threading.Lock()
+        self._launching: asyncio.Lock = None  # one launch at a time so each browser's pid is told apart
+
+    def register(self, name: str, factory, size: int = DEFAULT_POOL_SIZE, setup=None):
+        """
+        factory(slot) -> BrowserConfig for the browser in that slot
+        slots let profiles give every browser its own user_data_dir
+        setup(crawler) runs on every new crawler before it starts, in a worker thread so it may block
+        """
+        self._profiles[name] = _Profile(factory, size, setup)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="browser-pool", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            return self._loop
+
+    async def _acquire(self, profile: _Profile, name: str) -> _Browser:
+        if profile.available is None:
+            profile.available = asyncio.Condition()
+
+        async with profile.available:
+            while not profile.idle and not profile.free_slots:
+                await profile.available.wait()
+
+            if profile.idle:
+                return profile.idle.popleft()
+
+            slot = profile.free_slots.popleft()
+
+        # launch outside the lock so other borrowers arent held up by a slow browser start
+        if self._launching is None:
+            self._launching = asyncio.Lock()
+        try:
+            crawler = AsyncWebCrawler(config=profile.factory(slot))
+            if profile.setup is not None:
+                await asyncio.to_thread(profile.setup, crawler)  # may block (EG: starting Xvfb), keep it off the loop
+            async with self._launching:
+                known = _descendants(os.getpid(), _process_tree()) if self.max_memory_mb else None
+                await crawler.start()
+                pid = await asyncio.to_thread(_browser_pid, known) if known is not None else None
+        except Exception:
+            async with profile.available:
+                profile.free_slots.append(slot)
+                profile.available.notify()
+            raise
+
+        self.launches += 1
+        get_metrics().inc("browser_launches_total", profile=name)
+        self.logger.debug(f"Launched browser for profile '{name}' (slot {slot})")
+        return _Browser(crawler, slot, pid)
+
+    async def _release(self, profile: _Profile, name: str, browser: _Browser, broken: bool = False):
+        browser.pages += 1
+
+        recycle = broken or browser.pages >= self.max_pages
+        if not recycle and self.max_memory_mb and browser.pid is not None:
+            pss = await asyncio.to_thread(_tree_pss_mb, browser.pid)
+            if pss > self.max_memory_mb:
+                self.logger.debug(f"Browser memory {pss:.0f}MB over budget {self.max_memory_mb}MB")
+                recycle = True
+
+        if recycle:
+            self.logger.debug(f"Recycling browser for profile '{name}' (slot {browser.slot}) after {browser.pages} page(s)")
+            try:
+                await browser.crawler.close()
+            except Exception as e:
+                self.logger.warning(f"Failed to close browser for profile '{name}': {e}")
+
+        async with profile.available:
+            if recycle:
+                profile.free_slots.append(browser.slot)
+            else:
+                profile.idle.append(browser)
+            profile.available.notify()
+
+    async def _crawl(self, name: str, url: str, config):
+        profile = self._profiles[name]
+        browser = await self._acquire(profile, name)
+
+        try:
+            result = await browser.crawler.arun(url=url, config=config)
+        except Exception:
+            await self._release(profile, name, browser, broken=True)
+            raise
+
+        await self._release(profile, name, browser)
+        return result
+
+    def run(self, name: str, url: str, config):
+        """Blocking crawl of url in a browser borrowed from profile 'name'"""
+        return asyncio.run_coroutine_threadsafe(self._crawl(name, url, config), self._ensure_loop()).result()
+
+    async def arun(self, name: str, url: str, config):
+        """Crawl of url in a browser borrowed from profile 'name', awaitable from any event loop"""
+        future = asyncio.run_coroutine_threadsafe(self._crawl(name, url, config), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    async def _close_all(self):
+        for name, profile in self._profiles.items():
+            while profile.idle:
+                browser = profile.idle.popleft()
+                try:
+                    await browser.crawler.close()
+                except Exception as e:
+                    self.logger.warning(f"Failed to close browser for profile '{name}': {e}")
+                profile.free_slots.append(browser.slot)
+            profile.available = None  # bound to this loop, a new one is made if the pool is reused
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_all(), loop).result(timeout=30)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join(timeout=5)
+
+
+# process wide pool - datasources register their profiles on import
+browser_pool = BrowserPool()
@@ -0,0 +1,107 @@
+# per site crawl settings for the browser based datasources
+#  * requests for images / media / fonts and for any domain that isnt the retailer's own are aborted
+#    before they leave the browser (ads, analytics, tag managers, recommendation widgets...)
+#  * instead of fixed sleeps, pages are returned as soon as the in page script has found what it needs.
+#    the script waits on a readiness condition (with a timeout) and then appends its output as a
+#    <script type="text/x-scraper-data"> tag, which is what crawl4ai's wait_for watches for
+import logging
+import os
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from crawl4ai import CacheMode, CrawlerRunConfig
+from playwright.async_api import Error as PlaywrightError
+
+CRAWL_BLOCK_REQUESTS = os.getenv("CRAWL_BLOCK_REQUESTS", "1") != "0"  # 0 = load everything (debugging)
+READY_TIMEOUT_MS = int(os.getenv("CRAWL_READY_TIMEOUT_MS", 10_000))  # max wait for the page to become ready
+PAGE_TIMEOUT_MS = 60_000
+
+# stylesheets are left alone: innerText (used by the lenovo scan) depends on css visibility
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font"})
+
+# failures worth another crawl: playwright errors (its TimeoutError included), navigation failures crawl4ai
+# re-raises as RuntimeError, timeouts and network errors. parsing bugs (KeyError, TypeError...) are not retried,
+# every retry counts towards the shared circuit breaker
+CRAWL_ERRORS = (PlaywrightError, RuntimeError, TimeoutError, OSError)
+
+INJECTED_SELECTOR = 'script[type="text/x-scraper-data"]'
+
+# defines waitUntil(cond, timeoutMs) for the in page scripts - resolves true once cond() is truthy,
+# false on timeout. polls instead of using a MutationObserver so conditions can look at anything
+WAIT_UNTIL_JS = """
+const waitUntil = (cond, timeoutMs) => new Promise(resolve => {
+    const deadline = Date.now() + timeoutMs;
+    const tick = () => {
+        let ok = false;
+        try { ok = !!cond(); } catch (_) {}
+        if (ok || Date.now() >= deadline) return resolve(ok);
+        setTimeout(tick, 100);
+    };
+    tick();
+});
+"""
+
+
+def _domain_matches(host: str, domains) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+@dataclass(frozen=True)
+class CrawlProfile:
+    first_party: tuple[str, ...]  # retailer domains (subdomains included), everything else is blocked
+    allow: tuple[str, ...] = ()  # third party domains the page cant work without (EG: bot challenges)
+    blocked_resource_types: frozenset = BLOCKED_RESOURCE_TYPES
+    ready_timeout_ms: int = READY_TIMEOUT_MS
+
+    def allows(self, url: str, resource_type: str) -> bool:
+        if resource_type in self.blocked_resource_types:
+            return False
+
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            return True  # data:, blob: etc never hit the network
+
+        host = (parts.hostname or "").lower()
+        return _domain_matches(host, self.first_party) or _domain_matches(host, self.allow)
+
+    def install(self, crawler, logger: logging.Logger = None):
+        """hook request blocking into a crawler, call before crawler.start()"""
+        if not CRAWL_BLOCK_REQUESTS:
+            return
+
+        logger = logger or logging.getLogger(__name__)
+
+        async def route(route):
+            request = route.request
+            if self.allows(request.url, request.resource_type):
+                await route.continue_()
+            else:
+                await route.abort()
+
+        async def on_page_context_created(page, context, **kwargs):
+            # page scoped so persistent contexts dont pile up handlers across crawls
+            await page.route("**/*", route)
+            return page
+
+        crawler.crawler_strategy.set_hook("on_page_context_created", on_page_context_created)
+        logger.debug(f"Request blocking enabled for {', '.join(self.first_party)}")
+
+    def run_config(self, js_code: str = None, wait_for: str = None, **kwargs) -> CrawlerRunConfig:
+        """
+        run config for a page script that appends its results as INJECTED_SELECTOR once ready
+        the page is returned as soon as that tag exists instead of after a fixed delay
+        without a script, wait_for (crawl4ai "css:..." / "js:..." condition) decides when the page is ready
+        """
+        if wait_for is None and js_code is not None:
+            wait_for = f"js:() => document.querySelector('{INJECTED_SELECTOR}') !== null"
+
+        return CrawlerRunConfig(
+            cache_mode=CacheMode.BYPASS,
+            js_code=js_code,
+            wait_for=wait_for,
+            wait_for_timeout=self.ready_timeout_ms + 5_000,  # the page script gives up first
+            delay_before_return_html=0,
+            page_timeout=PAGE_TIMEOUT_MS,
+            verbose=False,
+            **kwargs,
+        )
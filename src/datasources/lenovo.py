@@ -3,15 +3,19 @@ import json
 import re
 import sys
 import logging
-import time
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
+from crawl4ai import BrowserConfig
 
 try:
-    from .base import DataSource
+    from .base import DataSource, NOT_MODIFIED
 except ImportError:
-    from base import DataSource
+    from base import DataSource, NOT_MODIFIED
 from ..schema import Product
+from ..endpoints import base_url, hosts, rebase
+from ..fetch_cache import payload_digest
+from ..retry import CircuitOpenError
 from .registry import SourceRegistry
+from .browser_pool import browser_pool
+from .crawl_profile import CRAWL_ERRORS, CrawlProfile, WAIT_UNTIL_JS
 
 
 IN_STOCK_URIS = frozenset({
@@ -31,13 +35,23 @@ PERCENT_OFF_RE = re.compile(r"\d+\s*%\s*off", re.IGNORECASE)
 
 SCAN_WINDOW = 1000  # product info usually appears within first 400 chars of <main> - restrict around that
 
+BASE_URL = base_url("LENOVO")  # LENOVO_BASE_URL to crawl a stand in instead of lenovo.com
+
+# price widget comes from smartsales.lenovo.com, scripts from the static.pub cdn
+CRAWL_PROFILE = CrawlProfile(first_party=("lenovo.com", *hosts(BASE_URL)), allow=("static.pub",))
+
 INJECTED_RE = re.compile(
     r'<script[^>]+type=["\']text/x-scraper-data["\'][^>]*>([\s\S]*?)</script>',
     re.IGNORECASE,
 )
 
-_JS = """
+_JS = WAIT_UNTIL_JS + """
 (async () => {
+    // wait for the json-ld block and the smartsales.lenovo.com price widget instead of a fixed delay
+    const mainEl = () => document.querySelector('main') || document.body;
+    await waitUntil(() => document.querySelector('script[type="application/ld+json"]')
+                          && /\\$\\s?\\d/.test(mainEl().innerText.slice(0, %d)), %d);
+
     Array.from(document.querySelectorAll('button, [role="button"]')).forEach(btn => {
         const lbl = (btn.getAttribute('aria-label') || btn.textContent || '')
                     .toLowerCase().trim();
@@ -46,9 +60,6 @@ _JS = """
         }
     });
 
-    // wait for popups and smartsales.lenovo.com price widget to render
-    await new Promise(r => setTimeout(r, 1500));
-
     const out = { name: null, price: null, availability: null, mainText: '' };
 
     for (const s of document.querySelectorAll('script[type="application/ld+json"]')) {
@@ -64,15 +75,14 @@ _JS = """
     }
 
     // exclude header/footer/popup text (sometimes returns other product prices)
-    const mainEl = document.querySelector('main');
-    out.mainText = mainEl ? mainEl.innerText : document.body.innerText;
+    out.mainText = mainEl().innerText;
 
     const tag = document.createElement('script');
     tag.type        = 'text/x-scraper-data';
     tag.textContent = JSON.stringify(out);
     document.body.appendChild(tag);
 })();
-"""
+""" % (SCAN_WINDOW, CRAWL_PROFILE.ready_timeout_ms)
 
 
 def _parse_price(value):
@@ -84,34 +94,48 @@ def _parse_price(value):
         return None
 
 
+BROWSER_PROFILE = "lenovo"
+
+
+def _retry_page(response):
+    if not response.success:
+        return "page load failed"
+    html = response.html or ""
+    if "Just a moment" in html:
+        return "challenge page"
+    if not INJECTED_RE.search(html):
+        return "injected data missing"
+    return None
+
+
+def _browser_config(slot):
+    return BrowserConfig(
+        browser_type="undetected",  # avoid bot detection
+        headless=True,
+        verbose=False
+    )
+
+
+browser_pool.register(BROWSER_PROFILE, _browser_config, setup=CRAWL_PROFILE.install)
+
+
 class LenovoSource(DataSource):
     source_name = "lenovo"
+    rate_limit = 1
+    burst = 2
+    shared_runtime = True  # browser pool
 
     def __init__(self, logger: logging.Logger = None):
         super().__init__(logger)
 
 
     async def fetch_raw(self, identifier: str) -> dict:
-        browser_cfg = BrowserConfig(
-            browser_type="undetected",  # avoid bot detection
-            headless=True,
-            verbose=False
-        )
-
-        run_cfg = CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS,
-            js_code=_JS,
-            delay_before_return_html=3.0,
-            page_timeout=60_000,
-            verbose=False,
-        )
+        run_cfg = CRAWL_PROFILE.run_config(_JS)
 
         self.logger.debug(f"crawl4ai GET request: {identifier}")
 
-        async with AsyncWebCrawler(config=browser_cfg) as crawler:
-            result = await crawler.arun(url=identifier, config=run_cfg)
-
-        return result
+        # borrow a warm browser from the shared pool instead of launching one per url
+        return await browser_pool.arun(BROWSER_PROFILE, rebase(identifier, BASE_URL), run_cfg)
 
 
     def parse(self, raw_data, url):
@@ -147,49 +171,37 @@ class LenovoSource(DataSource):
         if hasattr(sys.stdout, "reconfigure"):
             sys.stdout.reconfigure(encoding="utf-8", errors="replace")
 
-        retries = 0
-        delay = 2
-        exp = 0
+        return asyncio.run(self.afetch_product(identifier))
+
 
+    async def afetch_product(self, identifier: str):
         try:
-            m = None
-
-            for i in range(retries):
-                self.logger.debug(f"Fetching product data for product: {identifier} (attempt: {i})")
-
-                response = asyncio.run(self.fetch_raw(identifier))
-
-                if not response.success:
-                    if i >= retries - 1:
-                        self.logger.warning(f"Failed to load page: {response.error_message}")
-                        return None
-                    else:
-                        sleep_time = (delay ** exp) / 2
-                        time.sleep(sleep_time)
-                        exp += 1
-                        continue
-
-                if not (m := INJECTED_RE.search(response.html or "")):  # holy walrus operator
-                    if i >= retries - 1:
-                        self.logger.warning("Injected data not found in html")
-                        return None
-                    else:
-                        sleep_time = (delay ** exp) / 2
-                        time.sleep(sleep_time)
-                        exp += 1
-                        continue
-
-                # success
-                break
-
-            if m is None:
-                self.logger.warning("No valid response after all retries")
+            self.logger.debug(f"Fetching product data for product: {identifier}")
+            response = await self.acall_with_retry(self.fetch_raw, identifier, retry_if=_retry_page,
+                                                   retry_on=CRAWL_ERRORS)
+
+            if not response.success:
+                self.logger.warning(f"Failed to load page: {response.error_message}")
                 return None
 
+            if not (m := INJECTED_RE.search(response.html or "")):  # holy walrus operator
+                self.logger.warning("Injected data not found in html")
+                return None
+
+            digest = payload_digest(m.group(1))
+            if self.is_unchanged(identifier, digest):
+                self.logger.debug(f"[{identifier}] Payload unchanged, skipping parse")
+                return NOT_MODIFIED
+
             product = self.parse(m.group(1), identifier)
+            self.remember_payload(identifier, digest)
 
             return product
 
+        except CircuitOpenError as e:
+            self.logger.debug(f"[{identifier}] {e}")
+            return None
+
         except Exception as e:
             self.logger.error(f"[{identifier}] Failed to fetch/parse: {e}")
             return None
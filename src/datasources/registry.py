@@ -1,7 +1,21 @@
 # for registering all data sources
+# sources are imported lazily - the manifest below maps each source name to the module that registers it
+# and a module is only imported (and its source instantiated) the first time that source is asked for,
+# so a bestbuy only watchlist never pays for crawl4ai / playwright
+import importlib
 import logging
 
+MANIFEST = {
+    "bestbuy": f"{__package__}.bestbuy",
+    "amazon": f"{__package__}.amazon",
+    "lenovo": f"{__package__}.lenovo",
+    "bhvideo": f"{__package__}.bhvideo",
+}
+
+
 class SourceRegistry():
+    manifest: dict = dict(MANIFEST)  # source name -> module path, sources outside src/datasources can be declared
+    classes: dict = {}  # registered (imported) source classes
     sources: dict = {}  # store all instantiated source objs
     logger: logging.Logger = None
 
@@ -9,24 +23,54 @@ class SourceRegistry():
     def set_logger(cls, logger: logging.Logger):
         cls.logger = logger
 
+    @classmethod
+    def declare(cls, source_name: str, module: str):
+        cls.manifest[source_name] = module
+
     @classmethod
     def register(cls, source_cls):
+        # called at the bottom of each datasource module, instantiation waits until the source is needed
+        cls.classes[source_cls.source_name] = source_cls
+
+    @classmethod
+    def names(cls) -> list[str]:  # every source that could be loaded, imported or not
+        return sorted({*cls.manifest, *cls.classes})
+
+    @classmethod
+    def get(cls, source_name):
+        """instantiated source, importing its module first if needed - KeyError for unknown sources"""
+        if source_name in cls.sources:
+            return cls.sources[source_name]
+
+        if source_name not in cls.classes:
+            if source_name not in cls.manifest:
+                raise KeyError(f"Unknown datasource '{source_name}'")
+
+            importlib.import_module(cls.manifest[source_name])
+            if source_name not in cls.classes:
+                raise KeyError(f"Datasource '{source_name}' did not register after importing {cls.manifest[source_name]}")
+
         if cls.logger:  # if logger is NOT None
-            source_logger = cls.logger.getChild(source_cls.source_name)
+            source_logger = cls.logger.getChild(source_name)
         else:
             source_logger = None
 
-        """
-        cls.sources = 'sources' dict inside SourceRegistry class
-        "source_cls.source_name" = name of key for 'sources' dict
-        'inst' = INSTANTIATED source class which is the item of the dict with logger
-        """
-        cls.sources[source_cls.source_name] = source_cls(logger=source_logger)
+        cls.sources[source_name] = cls.classes[source_name](logger=source_logger)
+        return cls.sources[source_name]
 
     @classmethod
-    def get(cls, source_name):
-        return cls.sources[source_name]
+    def load(cls, source_names) -> dict:
+        """instantiate the given sources, ones that cant be imported are logged and left out"""
+        loaded = {}
+        for source_name in source_names:
+            try:
+                loaded[source_name] = cls.get(source_name)
+            except (ImportError, KeyError) as e:
+                if cls.logger:
+                    cls.logger.error(f"Could not load datasource '{source_name}': {e}")
+
+        return loaded
 
     @classmethod
-    def all(cls) -> dict:  # return dict with all registered data source objs
+    def all(cls) -> dict:  # return dict with all instantiated data source objs
         return cls.sources
@@ -0,0 +1,17 @@
+# sqlite helpers for everything the notifier persists between runs (fetch cache, etc.)
+import sqlite3
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STATE_DIR = BASE_DIR / "state"
+STATE_DIR.mkdir(exist_ok=True)
+
+DB_FILE = STATE_DIR / "notifier.db"
+
+
+def connect(path: Path = DB_FILE) -> sqlite3.Connection:
+    # WAL so worker processes can read while another one writes
+    conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # safe with WAL, far fewer fsyncs on sd cards
+    return conn
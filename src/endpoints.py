@@ -0,0 +1,25 @@
+# base url overrides so every retailer and ntfy can be pointed at a local stand in (benchmarks/mock_server.py)
+# <NAME>_BASE_URL unset = the real endpoint. an override swaps the scheme, host and path prefix of the real
+# url and keeps the rest, EG: LENOVO_BASE_URL=http://127.0.0.1:8099/lenovo turns
+# https://www.lenovo.com/us/en/p/abc into http://127.0.0.1:8099/lenovo/us/en/p/abc
+import os
+from urllib.parse import urlsplit
+
+
+def base_url(name: str, default: str = None) -> str:
+    """value of <name>_BASE_URL without a trailing slash, default if unset"""
+    value = os.getenv(f"{name}_BASE_URL") or default
+    return value.rstrip("/") if value else value
+
+
+def rebase(url: str, base: str) -> str:
+    """url moved onto base (path and query kept), url itself if there is no override"""
+    if not base:
+        return url
+    parts = urlsplit(url)
+    return base + parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+def hosts(*bases) -> tuple[str, ...]:
+    """host names of the overrides that are set, for the crawl profiles' first party lists"""
+    return tuple(urlsplit(base).hostname for base in bases if base)
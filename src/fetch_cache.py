@@ -0,0 +1,91 @@
+# per (source, identifier) cache of http validators and payload hashes
+# lets datasources send conditional requests and skip parsing/notifying when nothing changed
+import hashlib
+import os
+import threading
+import time
+
+from . import db
+
+
+def payload_digest(payload) -> str:
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def create_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fetch_cache (
+            source TEXT NOT NULL,
+            identifier TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            digest TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (source, identifier)
+        )
+    """)
+
+
+def store_many(conn, payloads: dict, now: float):
+    """payloads: (source, identifier) -> (digest, etag, last_modified), on the caller's connection / transaction"""
+    conn.executemany(
+        "INSERT OR REPLACE INTO fetch_cache VALUES (?, ?, ?, ?, ?, ?)",
+        [(source, str(identifier), etag, last_modified, digest, now)
+         for (source, identifier), (digest, etag, last_modified) in payloads.items()],
+    )
+
+
+class FetchCache:
+    def __init__(self, path=db.DB_FILE):
+        self._conn = db.connect(path)
+        self._lock = threading.Lock()
+        create_table(self._conn)
+
+    def _row(self, source: str, identifier: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT etag, last_modified, digest FROM fetch_cache WHERE source = ? AND identifier = ?",
+                (source, str(identifier)),
+            ).fetchone()
+
+    def conditional_headers(self, source: str, identifier: str) -> dict:
+        """If-None-Match / If-Modified-Since headers for the last stored response, if any"""
+        row = self._row(source, identifier)
+        headers = {}
+        if row and row[0]:
+            headers["If-None-Match"] = row[0]
+        if row and row[1]:
+            headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def is_unchanged(self, source: str, identifier: str, digest: str) -> bool:
+        row = self._row(source, identifier)
+        return row is not None and row[2] == digest
+
+    def store(self, source: str, identifier: str, digest: str, etag: str = None, last_modified: str = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fetch_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (source, str(identifier), etag, last_modified, digest, time.time()),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM fetch_cache")
+
+
+_cache: FetchCache = None
+_cache_pid: int = None
+_cache_lock = threading.Lock()
+
+
+def get_fetch_cache() -> FetchCache:
+    global _cache, _cache_pid
+
+    # sqlite connections must not cross a fork, so each process opens its own
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache, _cache_pid = FetchCache(), os.getpid()
+        return _cache
@@ -0,0 +1,58 @@
+# shared pooled http client for the datasources and the notifier
+# one requests.Session per process so connections (dns, tcp, tls) are kept alive and reused
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", 10))  # number of hosts to keep connection pools for
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 8))  # max open connections per host, extra requests wait
+
+_session: requests.Session = None
+_session_pid: int = None
+_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session, _session_pid
+
+    # sockets must not be shared with forked children, so each process builds its own session
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE, pool_block=True)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+            _session, _session_pid = session, os.getpid()
+
+        return _session
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def delete(url: str, **kwargs) -> requests.Response:
+    return request("DELETE", url, **kwargs)
+
+
+def close():
+    global _session
+
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
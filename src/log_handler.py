@@ -1,5 +1,5 @@
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, TimedRotatingFileHandler
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -38,3 +38,14 @@ def init_logger(name: str = "bestbuy-notifier"):
     logger.propagate = False
 
     return logger
+
+
+# create child logger that sends all records to parent via queue system
+def init_child_logger(log_queue, name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+
+    return logger
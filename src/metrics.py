@@ -0,0 +1,291 @@
+# in process metrics: counters and latency histograms labelled by source / outcome, plus the slowest fetches
+# worker processes hand their samples back with every result (see worker_pool.fetch_identifiers) and the
+# main process merges them. exported as prometheus text on METRICS_PORT and / or as a json file that is
+# rewritten every METRICS_DUMP_INTERVAL seconds, and summarised in the log after every sweep
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .db import STATE_DIR
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # serve /metrics on localhost, 0 = off
+METRICS_FILE = os.getenv("METRICS_FILE", str(STATE_DIR / "metrics.json"))  # empty = no json dump
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", 60))  # seconds
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # seconds
+SLOWEST = 10  # slowest fetches kept for the summary
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, list] = {}  # key -> [count per bucket (+inf last), sum, count]
+        self.slowest: list[tuple[float, str]] = []  # min heap of (seconds, "source:identifier")
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            i = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+            hist[0][i] += 1
+            hist[1] += seconds
+            hist[2] += 1
+
+    def note_slow(self, seconds: float, what: str):
+        with self._lock:
+            self._push_slow(seconds, what)
+
+    def _push_slow(self, seconds, what):
+        if len(self.slowest) < SLOWEST:
+            heapq.heappush(self.slowest, (seconds, what))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, what))
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self, reset: bool = False) -> dict:
+        """plain (picklable, json-able) copy of everything, reset=True also clears it"""
+        with self._lock:
+            snap = {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, dict(labels), list(h[0]), h[1], h[2]] for (name, labels), h in self.histograms.items()],
+                "slowest": sorted(self.slowest, reverse=True),
+            }
+            if reset:
+                self.counters, self.histograms, self.slowest = {}, {}, []
+        return snap
+
+    def reset_slowest(self):
+        """start a new slowest list, EG: for the next daemon summary period"""
+        with self._lock:
+            self.slowest = []
+
+    def merge(self, snap: dict):
+        """add a snapshot taken in another process"""
+        if not snap:
+            return
+        with self._lock:
+            for name, labels, value in snap["counters"]:
+                key = _key(name, labels)
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, buckets, total, count in snap["histograms"]:
+                hist = self.histograms.setdefault(_key(name, labels), [[0] * (len(BUCKETS) + 1), 0.0, 0])
+                hist[0] = [a + b for a, b in zip(hist[0], buckets)]
+                hist[1] += total
+                hist[2] += count
+            for seconds, what in snap["slowest"]:
+                self._push_slow(seconds, what)
+
+    def prometheus(self) -> str:
+        """prometheus text exposition format"""
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self.histograms.items())
+
+        lines = [f"notifier_{name}{fmt(labels)} {value:g}" for (name, labels), value in counters]
+
+        for (name, labels), (buckets, total, count) in histograms:
+            cumulative = 0
+            for bound, n in zip((*BUCKETS, "+Inf"), buckets):
+                cumulative += n
+                lines.append(f"notifier_{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"notifier_{name}_sum{fmt(labels)} {total:.6f}")
+            lines.append(f"notifier_{name}_count{fmt(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def quantile(buckets: list[int], q: float) -> float:
+    """estimate of quantile q from histogram bucket counts (upper bound of the bucket it falls in)"""
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for bound, n in zip((*BUCKETS, float("inf")), buckets):
+        seen += n
+        if seen >= rank:
+            return bound
+    return float("inf")
+
+
+def _sum(snap: dict, name: str, by: str = None) -> dict:
+    totals = {}
+    for counter, labels, value in snap["counters"]:
+        if counter == name:
+            label = labels.get(by) if by else None
+            totals[label] = totals.get(label, 0) + value
+    return totals
+
+
+def summarize(snap: dict, elapsed: float = None) -> str:
+    """multi line, human readable summary of a snapshot (one sweep or one daemon period)"""
+    lines = []
+
+    results = _sum(snap, "results_total", "result")
+    head = f"{sum(results.values()):.0f} product(s)" + (f" in {elapsed:.1f}s" if elapsed is not None else "")
+    lines.append(head + (": " + ", ".join(f"{n:.0f} {result}" for result, n in sorted(results.items())) if results else ""))
+
+    # per source and stage: whole fetches for per identifier sources, the raw calls for batch ones
+    stages: dict[tuple, list] = {}
+    for name, labels, buckets, total, count in snap["histograms"]:
+        if name in ("fetch_seconds", "fetch_raw_seconds"):
+            entry = stages.setdefault((labels.get("source"), name[:-8]), [[0] * len(buckets), {}])
+            entry[0] = [a + b for a, b in zip(entry[0], buckets)]
+            entry[1][labels.get("outcome")] = entry[1].get(labels.get("outcome"), 0) + count
+
+    for (source, stage), (buckets, outcomes) in sorted(stages.items()):
+        if stage == "fetch_raw" and (source, "fetch") in stages:
+            continue
+        counts = ", ".join(f"{n} {outcome}" for outcome, n in sorted(outcomes.items()))
+        lines.append(f"  {source} {stage}: p50 <= {quantile(buckets, 0.5):g}s, p95 <= {quantile(buckets, 0.95):g}s ({counts})")
+
+    if snap["slowest"]:
+        lines.append("  slowest: " + ", ".join(f"{what} {seconds:.2f}s" for seconds, what in snap["slowest"][:5]))
+
+    retries = _sum(snap, "retries_total", "source")
+    opened = _sum(snap, "circuit_opened_total", "source")
+    throttled = sum(total for name, _, _, total, _ in snap["histograms"] if name == "rate_limit_wait_seconds")
+    launches = _sum(snap, "browser_launches_total")
+    posts = _sum(snap, "ntfy_posts_total", "outcome")
+    per_source = " (" + ", ".join(f"{s} {n:.0f}" for s, n in sorted(retries.items())) + ")" if retries else ""
+    lines.append(f"  retries: {sum(retries.values()):.0f}{per_source}"
+                 + (f" | circuits opened: {', '.join(sorted(opened))}" if opened else "")
+                 + (f" | rate limit waits: {throttled:.1f}s" if throttled else "")
+                 + f" | browser launches: {sum(launches.values()):.0f}"
+                 f" | ntfy posts: {', '.join(f'{n:.0f} {o}' for o, n in sorted(posts.items())) or '0'}")
+
+    return "\n".join(lines)
+
+
+def diff(current: dict, previous: dict) -> dict:
+    """what happened between two snapshots (the slowest list is taken from current as is)"""
+    before_counters = {_key(n, l): v for n, l, v in previous["counters"]}
+    before_hists = {_key(n, l): (b, s, c) for n, l, b, s, c in previous["histograms"]}
+
+    counters = [[n, l, v - before_counters.get(_key(n, l), 0)] for n, l, v in current["counters"]]
+    histograms = []
+    for n, l, b, s, c in current["histograms"]:
+        pb, ps, pc = before_hists.get(_key(n, l), ([0] * len(b), 0.0, 0))
+        histograms.append([n, l, [x - y for x, y in zip(b, pb)], s - ps, c - pc])
+
+    return {
+        "counters": [row for row in counters if row[2]],
+        "histograms": [row for row in histograms if row[4]],
+        "slowest": current["slowest"],
+    }
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsExporter:
+    """serves /metrics and rewrites the json dump in the background, stop() writes one last dump"""
+
+    def __init__(self, port: int = METRICS_PORT, path: str = METRICS_FILE, interval: float = METRICS_DUMP_INTERVAL,
+                 logger: logging.Logger = None):
+        self.port = port
+        self.path = path
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._server: ThreadingHTTPServer = None
+        self._stopping = threading.Event()
+        self._thread: threading.Thread = None
+
+    def start(self):
+        if self.port:
+            try:
+                self._server = ThreadingHTTPServer(("127.0.0.1", self.port), _MetricsHandler)
+            except OSError as e:
+                self.logger.warning(f"Could not serve metrics on port {self.port}: {e}")
+            else:
+                self._server.daemon_threads = True
+                threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+                self.logger.info(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+
+        if self.path:
+            self._thread = threading.Thread(target=self._run, name="metrics-dump", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"written_at": time.time(), **get_metrics().snapshot()}, f)
+            os.replace(tmp, self.path)  # readers never see a half written file
+        except OSError as e:
+            self.logger.warning(f"Could not write metrics to {self.path}: {e}")
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self.dump()
+
+
+_metrics: Metrics = None
+_metrics_pid: int = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    # per process, a forked child starts from an empty registry instead of the parent's numbers
+    global _metrics, _metrics_pid
+    with _metrics_lock:
+        if _metrics is None or _metrics_pid != os.getpid():
+            _metrics, _metrics_pid = Metrics(), os.getpid()
+        return _metrics
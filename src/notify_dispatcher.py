@@ -0,0 +1,81 @@
+# collects every notification produced during a sweep and coalesces the ones for the same product + topic
+# into a single digest message, which is then handed to the durable outbox for delivery
+import logging
+from dataclasses import dataclass
+
+from .metrics import get_metrics
+from .ntfy_templates import digest
+from .outbox import Outbox, OutboxSender, idempotency_key
+
+
+@dataclass
+class Notification:
+    topic: str
+    group: str  # coalescing key - notifications with the same topic + group become one message
+    title: str
+    body: str
+    icon: str
+    product_name: str
+    # identity of the snapshot the transition started from, part of the idempotency key: replaying the same
+    # transition (EG: after a crash before the snapshots were saved) dedupes, the next restock of the product doesnt
+    transition: str = ""
+
+
+class NotificationDispatcher:
+    def __init__(self, outbox: Outbox, sender: OutboxSender = None, logger: logging.Logger = None):
+        self.outbox = outbox
+        self.sender = sender
+        self.logger = logger or logging.getLogger(__name__)
+        self._pending: list[Notification] = []
+
+    def add(self, notification: Notification):
+        self._pending.append(notification)
+
+    def coalesce(self) -> list[Notification]:
+        groups: dict[tuple[str, str], list[Notification]] = {}
+        for n in self._pending:
+            groups.setdefault((n.topic, n.group), []).append(n)
+
+        merged = []
+        for items in groups.values():
+            if len(items) == 1:
+                merged.append(items[0])
+                continue
+
+            first = items[0]
+            merged.append(Notification(
+                topic=first.topic,
+                group=first.group,
+                title=f"{first.product_name} Alert ({len(items)} retailers)",
+                body=digest([n.body for n in items]),
+                icon=first.icon,
+                product_name=first.product_name,
+                transition="|".join(sorted(n.transition for n in items)),
+            ))
+
+        return merged
+
+    def flush(self) -> int:
+        """Write everything collected so far to the outbox and wake the sender, returns number queued"""
+        metrics = get_metrics()
+        with metrics.timer("dispatch_seconds"):
+            messages = self.coalesce()
+            self._pending.clear()
+
+            queued = 0
+            for n in messages:
+                key = idempotency_key(n.topic, n.group, n.body, n.transition)
+                if self.outbox.enqueue(key, n.topic, n.title, n.body, n.icon):
+                    queued += 1
+                else:
+                    self.logger.debug(f"Duplicate ntfy message '{n.title}' already in outbox")
+
+        metrics.inc("ntfy_queued_total", queued)
+        metrics.inc("ntfy_duplicates_total", len(messages) - queued)
+
+        if queued:
+            self.logger.info(f"Queued {queued} ntfy message(s) in outbox")
+            if self.sender is not None:
+                self.sender.wake()
+
+        return queued
@@ -1,10 +1,22 @@
+# prices can be missing (EG: a page without a parseable price), show that instead of failing the render
+def money(value) -> str:
+    return f"${value:.2f}" if value is not None else "unknown"
+
+
+def current_price(product):
+    """price the product sells for right now, None if the source didnt give one"""
+    if product.on_sale and product.sale_price is not None:
+        return product.sale_price
+    return product.regular_price if product.regular_price is not None else product.sale_price
+
+
 def on_sale(product, desired_price: float):
     target_discount = (desired_price - product.sale_price) / desired_price * 100
 
     return f"""### "{product.product_name}" is in stock and on sale!
 
-**💰 Sale Price:** ${product.sale_price:.2f}  
-**🏷️ Original Price:** ${product.regular_price:.2f}  
+**💰 Sale Price:** {money(product.sale_price)}  
+**🏷️ Original Price:** {money(product.regular_price)}  
 **🎯 Your Target Price:** ${desired_price:.2f}  
 
 **💵 Sale savings:** ${product.dollar_savings:.2f} ({product.percent_savings:.1f}%)  
@@ -14,14 +26,15 @@ def on_sale(product, desired_price: float):
 
 
 def below_max_price(product, desired_price: float):
-    target_discount = (desired_price - product.regular_price) / desired_price * 100
+    price = current_price(product)
+    target_discount = (desired_price - price) / desired_price * 100
 
     return f"""### "{product.product_name}" is in stock and within your price target!
 
-**💰 Current Price:** ${product.regular_price:.2f}  
+**💰 Current Price:** ${price:.2f}  
 **🎯 Your Target Price:** ${desired_price:.2f}  
 
-**💵 Below your target by:** ${(desired_price - product.regular_price):.2f} ({target_discount:.1f}%)
+**💵 Below your target by:** ${(desired_price - price):.2f} ({target_discount:.1f}%)
 
 🔗 [{product.product_url}]({product.product_url})"""
 
@@ -29,11 +42,16 @@ def below_max_price(product, desired_price: float):
 def in_stock(product):
     return f"""### "{product.product_name}" is back in stock!
 
-**💰 Current Price:** ${product.regular_price:.2f}
+**💰 Current Price:** {money(current_price(product))}
 
 🔗 [{product.product_url}]({product.product_url})"""
 
 
+# several alerts for the same product (EG: restock at multiple retailers) merged into one message
+def digest(bodies: list[str]):
+    return "\n\n---\n\n".join(bodies)
+
+
 if __name__ == "__main__":
     from .schema import Product
     # test all ntfy templates
@@ -54,3 +72,5 @@ if __name__ == "__main__":
     print(below_max_price(p, 300))
     print()
     print(in_stock(p))
+    print()
+    print(digest([in_stock(p), on_sale(p, 300.00)]))
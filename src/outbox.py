@@ -0,0 +1,243 @@
+# durable notification outbox (at-least-once delivery)
+# notifications are written to sqlite first, then a background sender posts them to ntfy, retrying
+# with exponential backoff. anything left over (crash, network down) is sent on the next startup
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from . import db
+from .metrics import get_metrics
+from .send_ntfy import post_ntfy
+
+NTFY_CONCURRENCY = int(os.getenv("NTFY_CONCURRENCY", 4))
+NTFY_MAX_ATTEMPTS = int(os.getenv("NTFY_MAX_ATTEMPTS", 8))
+NTFY_BACKOFF = 2.0  # base delay in seconds, doubled every attempt
+NTFY_MAX_BACKOFF = 3600
+NTFY_MAX_RETRY_AFTER = 3600  # cap on a single 429 Retry-After
+
+
+def idempotency_key(*parts) -> str:
+    return hashlib.blake2b("\x1f".join(str(p) for p in parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Outbox:
+    def __init__(self, path=db.DB_FILE):
+        self._conn = db.connect(path)
+        self._lock = threading.Lock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                topic TEXT NOT NULL,
+                title TEXT NOT NULL,
+                body TEXT NOT NULL,
+                icon TEXT,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                delivered_at REAL,
+                dead INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt_at) WHERE delivered_at IS NULL AND dead = 0")
+
+    def enqueue(self, key: str, topic: str, title: str, body: str, icon: str = None) -> bool:
+        """False if a message with this idempotency key was already queued"""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, topic, title, body, icon, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, topic, title, body, icon, now, now),
+            )
+            return cur.rowcount == 1
+
+    def due(self, limit: int = 50) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, topic, title, body, icon, attempts FROM outbox "
+                "WHERE delivered_at IS NULL AND dead = 0 AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+
+    def next_due_at(self) -> float:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE delivered_at IS NULL AND dead = 0"
+            ).fetchone()
+        return row[0]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE delivered_at IS NULL AND dead = 0").fetchone()[0]
+
+    def mark_delivered(self, row_id: int):
+        with self._lock:
+            self._conn.execute("UPDATE outbox SET delivered_at = ?, attempts = attempts + 1 WHERE id = ?", (time.time(), row_id))
+
+    def mark_failed(self, row_id: int, error: str, next_attempt_at: float = None):
+        """next_attempt_at None = give up on this message"""
+        with self._lock:
+            if next_attempt_at is None:
+                self._conn.execute(
+                    "UPDATE outbox SET attempts = attempts + 1, dead = 1, last_error = ? WHERE id = ?", (error, row_id)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (next_attempt_at, error, row_id),
+                )
+
+    def postpone(self, row_id: int, until: float):
+        """move a message back without counting an attempt"""
+        with self._lock:
+            self._conn.execute("UPDATE outbox SET next_attempt_at = MAX(next_attempt_at, ?) WHERE id = ?", (until, row_id))
+
+    def postpone_topic(self, topic: str, until: float):
+        """hold every undelivered message for topic until the given unix time"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET next_attempt_at = MAX(next_attempt_at, ?) WHERE topic = ? AND delivered_at IS NULL AND dead = 0",
+                (until, topic),
+            )
+
+    def prune(self, older_than: float):
+        """drop delivered / dead messages created before the given unix time"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM outbox WHERE (delivered_at IS NOT NULL OR dead = 1) AND created_at < ?", (older_than,)
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+class OutboxSender:
+    def __init__(self, outbox: Outbox, max_concurrency: int = NTFY_CONCURRENCY, max_attempts: int = NTFY_MAX_ATTEMPTS,
+                 logger: logging.Logger = None):
+        self.outbox = outbox
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread = None
+        self._paused: dict[str, float] = {}  # topic -> unix time its 429 Retry-After runs out
+        self._paused_lock = threading.Lock()
+
+    def start(self):
+        # first pass drains whatever previous runs left behind
+        self._thread = threading.Thread(target=self._run, name="ntfy-outbox", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _backoff(self, attempts: int) -> float:
+        return min(NTFY_BACKOFF * 2 ** attempts, NTFY_MAX_BACKOFF) * random.uniform(0.5, 1.5)
+
+    def _paused_until(self, topic: str) -> float:
+        with self._paused_lock:
+            until = self._paused.get(topic)
+            if until is not None and until <= time.time():
+                del self._paused[topic]
+                return None
+            return until
+
+    # a 429 holds back the whole topic, not just the message that got it
+    # (rows of the same batch that are already in the pool check _paused_until before posting)
+    def _pause(self, topic: str, until: float):
+        with self._paused_lock:
+            self._paused[topic] = max(until, self._paused.get(topic, 0.0))
+        self.outbox.postpone_topic(topic, until)
+
+    # one delivery attempt - retries are scheduled through the outbox, not slept on here
+    def _deliver(self, row):
+        row_id, topic, title, body, icon, attempts = row
+
+        if (until := self._paused_until(topic)) is not None:
+            self.outbox.postpone(row_id, until)
+            return
+
+        attempts += 1
+        metrics = get_metrics()
+
+        start = time.perf_counter()
+        try:
+            response = post_ntfy(body, None, None, icon, topic, title=title)
+        except requests.RequestException as e:
+            metrics.observe("ntfy_post_seconds", time.perf_counter() - start, outcome="error")
+            metrics.inc("ntfy_posts_total", outcome="error")
+            error, retry_at = str(e), time.time() + self._backoff(attempts)
+        else:
+            outcome = "ok" if response.ok else "http_error"
+            metrics.observe("ntfy_post_seconds", time.perf_counter() - start, outcome=outcome)
+            metrics.inc("ntfy_posts_total", outcome=outcome)
+
+            if response.ok:
+                self.outbox.mark_delivered(row_id)
+                return
+
+            error = f"HTTP {response.status_code}"
+            if response.status_code != 429 and response.status_code < 500:
+                self.logger.error(f"ntfy rejected '{title}': {error} {response.text.strip()}")
+                self.outbox.mark_failed(row_id, error)
+                return
+
+            retry_at = time.time() + self._backoff(attempts)
+            if response.status_code == 429:
+                try:
+                    retry_at = time.time() + min(float(response.headers.get("Retry-After")), NTFY_MAX_RETRY_AFTER)
+                except (TypeError, ValueError):
+                    pass  # missing or http date form, keep normal backoff
+                self._pause(topic, retry_at)
+
+        if attempts >= self.max_attempts:
+            self.logger.error(f"Giving up on ntfy message '{title}' after {attempts} attempt(s): {error}")
+            self.outbox.mark_failed(row_id, error)
+        else:
+            self.logger.warning(f"ntfy post for '{title}' failed (attempt {attempts}/{self.max_attempts}): {error}, retrying in {retry_at - time.time():.0f}s")
+            self.outbox.mark_failed(row_id, error, retry_at)
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ntfy") as pool:
+            while not self._stopping.is_set():
+                self._wake.clear()
+
+                try:
+                    rows = self.outbox.due()
+                    if rows:
+                        self.logger.info(f"Sending {len(rows)} ntfy message(s) from outbox")
+                        list(pool.map(self._deliver, rows))
+                        continue
+
+                    next_due = self.outbox.next_due_at()
+                except Exception as e:
+                    self.logger.error(f"Outbox sender error: {e}")
+                    next_due = time.time() + NTFY_BACKOFF
+
+                self._wake.wait(timeout=None if next_due is None else max(0.0, next_due - time.time()))
+
+    def drain(self, timeout: float) -> bool:
+        """wait until nothing is due right now, True if the outbox is empty"""
+        deadline = time.time() + timeout
+        while self.outbox.pending_count() and time.time() < deadline:
+            next_due = self.outbox.next_due_at()
+            if next_due is not None and next_due > deadline:
+                break  # only retries scheduled after the deadline are left
+            time.sleep(0.2)
+        return self.outbox.pending_count() == 0
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
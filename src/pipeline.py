@@ -0,0 +1,159 @@
+# what happens to fetched products, shared by the one shot sweep and the daemon:
+# compare with the last snapshot, queue notifications for transitions, record price history
+# everything is buffered in memory and persisted in one go by commit()
+import logging
+
+from .datasources.base import NOT_MODIFIED
+from .fetch_cache import payload_digest
+from .metrics import get_metrics
+from .notify_dispatcher import Notification, NotificationDispatcher
+from .ntfy_templates import current_price, on_sale, below_max_price, in_stock
+from .price_history import PriceHistory
+from .scheduler import Job
+from .state_store import StateStore, detect_transition
+from .watchlist import Watchlist, WatchItem
+
+
+# check product against user reqs for its watchlist item and render the noti body (None = no noti)
+# only called when detect_transition() found a change worth alerting on
+def render_notification(item: WatchItem, identifier, product, logger):
+    user_max_price = item.user_max_price
+
+    # check if data meets user reqs
+    if user_max_price is not None:
+        if (price := current_price(product)) is None:
+            logger.warning(f"[{identifier}] No price to compare with max ${user_max_price}, skipping")
+            return None
+
+        if product.on_sale and product.sale_price is not None and product.sale_price <= user_max_price:
+            logger.info(f"[{identifier}] Queued ON SALE notification")
+            return on_sale(product, user_max_price)
+
+        elif price <= user_max_price:
+            logger.info(f"[{identifier}] Queued BELOW MAX PRICE notification")
+            return below_max_price(product, user_max_price)
+
+        else:
+            logger.info(f"[{identifier}] Price ${price} exceeds max ${user_max_price}, skipping")
+            return None
+
+    else:
+        logger.info(f"[{identifier}] Queued IN STOCK notification")
+        return in_stock(product)
+
+
+def _meets(item: WatchItem, product) -> bool:
+    """product is something item would be alerted about"""
+    if not product.in_stock:
+        return False
+    return item.user_max_price is None or ((price := current_price(product)) is not None and price <= item.user_max_price)
+
+
+class ResultProcessor:
+    def __init__(self, watchlist: Watchlist, state_store: StateStore, history: PriceHistory,
+                 dispatcher: NotificationDispatcher, logger: logging.Logger = None):
+        self.watchlist = watchlist  # swapped out by the daemon when the watchlist file changes
+        self.state_store = state_store
+        self.history = history
+        self.dispatcher = dispatcher
+        self.logger = logger or logging.getLogger(__name__)
+
+        # last seen snapshots are read once up front and written back in batches by commit()
+        self.previous = state_store.load_all()
+        self.versions = state_store.load_versions()  # updated_at of the saved snapshots, identifies transitions
+        self.snapshots = {}
+        self.payloads = {}  # fetch cache entries of the snapshots, saved with them
+        self.observations = []  # (source, identifier, Product) rows for the price history
+
+    def handle(self, job: Job, products: dict) -> list[tuple]:
+        """
+        process one finished job, returns (key, previous, result) per identifier
+        result is a Product, NOT_MODIFIED or None (fetch failed)
+        """
+        outcomes = []
+        metrics = get_metrics()
+        payloads = getattr(products, "payloads", {})
+
+        for identifier in job.identifiers:
+            key = (job.src_name, identifier)
+            product = products.get(identifier)
+            previous = self.snapshots.get(key, self.previous.get(key))
+            outcomes.append((key, previous, product))
+
+            if product is NOT_MODIFIED:
+                metrics.inc("results_total", source=job.src_name, result="not_modified")
+                self.logger.info(f"[{identifier}] Unchanged since last check, skipping")
+                if previous is not None:  # still an observation, just the same values as last time
+                    self.observations.append((*key, previous))
+                continue
+
+            if product is None:
+                metrics.inc("results_total", source=job.src_name, result="failed")
+                self.logger.warning(f"[{identifier}] fetch_product returned None, skipping")
+                continue
+
+            self.logger.info(f"[{identifier}] Fetched: {product.product_name} | Retailer: {product.retailer_name}")
+            self.snapshots[key] = product
+            if identifier in payloads:
+                self.payloads[key] = payloads[identifier]
+            self.observations.append((*key, product))
+
+            if not (reason := detect_transition(previous, product)):
+                metrics.inc("results_total", source=job.src_name, result="unchanged")
+                self.logger.info(f"[{identifier}] No stock or price change (in stock: {product.in_stock}), skipping")
+                continue
+
+            metrics.inc("results_total", source=job.src_name, result="changed")
+            self.logger.info(f"[{identifier}] Transition: {reason}")
+            transition = f"{self.versions.get(key)}:{payload_digest(previous.encode()) if previous else ''}"
+            self._notify(key, product, self.watchlist.watchers(key), transition)
+
+        return outcomes
+
+    def _notify(self, key, product, items: list[WatchItem], transition: str):
+        source, identifier = key
+        metrics = get_metrics()
+        for item in items:
+            with metrics.timer("render_seconds", source=source):
+                body = render_notification(item, identifier, product, self.logger)
+            if body:
+                metrics.inc("notifications_total", source=source)
+                self.dispatcher.add(Notification(
+                    topic=item.ntfy_topic,
+                    group=item.id,  # one watchlist item = one product across retailers
+                    title=f"{product.retailer_name} Alert",
+                    body=body,
+                    icon=product.retailer_logo,
+                    product_name=product.product_name,
+                    transition=transition,
+                ))
+
+    def recheck(self, keys, old_watchlist: Watchlist):
+        """
+        alert on keys whose watchlist items changed (EG: max price raised above the current price) using the
+        last snapshot - the next poll usually comes back unchanged, so there is no transition to catch it.
+        an item is only alerted if the snapshot meets it but met nothing on the same topic before the edit
+        """
+        for key in keys:
+            if (product := self.snapshots.get(key, self.previous.get(key))) is None:
+                continue  # never fetched, the next poll is a first sighting anyway
+
+            met_before = {item.ntfy_topic for item in old_watchlist.watchers(key) if _meets(item, product)}
+            items = [item for item in self.watchlist.watchers(key)
+                     if _meets(item, product) and item.ntfy_topic not in met_before]
+            if items:
+                self.logger.info(f"[{key[1]}] Watchlist requirements changed, checking the last snapshot")
+                transition = f"watchlist:{self.versions.get(key)}:{payload_digest(product.encode())}"
+                self._notify(key, product, items, transition)
+
+    def commit(self):
+        """hand queued notifications to the outbox and persist snapshots + price history"""
+        self.dispatcher.flush()
+
+        saved_at = self.state_store.save_many(self.snapshots, self.payloads)
+        self.previous.update(self.snapshots)
+        self.versions.update(dict.fromkeys(self.snapshots, saved_at))
+        self.snapshots, self.payloads = {}, {}
+
+        self.history.append_many(self.observations)
+        self.observations = []
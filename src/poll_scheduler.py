@@ -0,0 +1,147 @@
+# adaptive per (source, identifier) polling for daemon mode
+# every key has its own next due time kept in a heap. keys that just changed (or sit near the user's
+# max price) are polled at the fastest rate, stable keys back off exponentially, and every interval
+# gets some jitter so polls dont line up into bursts. keys of sources with a bulk lookup are the exception:
+# their due times are rounded up to a shared POLL_BATCH_WINDOW grid so they come due together and go out as
+# a few batch requests instead of one request per key
+import heapq
+import itertools
+import math
+import os
+import random
+import time
+from dataclasses import dataclass
+
+from .datasources.base import NOT_MODIFIED
+
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", 60))  # seconds, used right after a change
+POLL_BASE_INTERVAL = float(os.getenv("POLL_BASE_INTERVAL", 300))  # first poll interval for new keys
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", 3600))  # ceiling for stable keys
+POLL_BACKOFF = 1.5  # interval multiplier per unchanged poll
+POLL_JITTER = 0.1  # +/- fraction of the interval
+NEAR_PRICE_RATIO = 1.1  # within 10% above the user's max price counts as "hot"
+POLL_BATCH_WINDOW = float(os.getenv("POLL_BATCH_WINDOW", 30))  # seconds, grid that batched sources are due on
+
+
+@dataclass
+class PollState:
+    interval: float
+    next_due: float
+
+
+class AdaptivePollScheduler:
+    def __init__(self, min_interval: float = POLL_MIN_INTERVAL, base_interval: float = POLL_BASE_INTERVAL,
+                 max_interval: float = POLL_MAX_INTERVAL, backoff: float = POLL_BACKOFF, jitter: float = POLL_JITTER,
+                 batch_window: float = POLL_BATCH_WINDOW):
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.batch_window = batch_window
+        self.batched: set[str] = set()  # source names whose keys are aligned to the batch grid, see align()
+
+        self._states: dict[tuple, PollState] = {}
+        self._heap: list[tuple[float, int, tuple]] = []
+        self._seq = itertools.count()  # tie breaker so keys are never compared
+        self._in_flight: set = set()  # popped by pop_due(), waiting for record()
+
+    def __contains__(self, key):
+        return key in self._states
+
+    def __len__(self):
+        return len(self._states)
+
+    def keys(self):
+        return list(self._states)
+
+    def _push(self, key, state: PollState):
+        heapq.heappush(self._heap, (state.next_due, next(self._seq), key))
+
+    def _jittered(self, interval: float) -> float:
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _aligned(self, key, due: float) -> float:
+        """due rounded up to the next batch window if key's source is batched"""
+        if key[0] not in self.batched or self.batch_window <= 0:
+            return due
+        return math.ceil(due / self.batch_window) * self.batch_window
+
+    def align(self, sources):
+        """from now on keys of these sources come due on the shared batch grid"""
+        self.batched.update(sources)
+
+    def add(self, key, due: float = None):
+        """start polling key - due now unless told otherwise, spread out by jitter"""
+        if key in self._states:
+            return
+        now = time.time()
+        state = PollState(self.base_interval, due if due is not None else
+                          self._aligned(key, now + random.uniform(0, self.jitter * self.base_interval)))
+        self._states[key] = state
+        self._push(key, state)
+
+    def remove(self, key):
+        # heap entries of removed keys are skipped lazily in pop_due()
+        self._states.pop(key, None)
+        self._in_flight.discard(key)
+
+    def reschedule(self, key, due: float = None):
+        """poll key again at due (now by default), keys being polled right now are left alone"""
+        state = self._states.get(key)
+        if state is None or key in self._in_flight:
+            return
+        state.next_due = due if due is not None else time.time()
+        self._push(key, state)
+
+    def pop_due(self, now: float = None) -> list:
+        """keys whose next poll is due, they are out of the heap until record() puts them back"""
+        now = now if now is not None else time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            next_due, _, key = heapq.heappop(self._heap)
+            state = self._states.get(key)
+            if state is None or state.next_due != next_due:
+                continue  # removed or rescheduled since this entry was pushed
+            due.append(key)
+            self._in_flight.add(key)
+        return due
+
+    def next_due_at(self) -> float:
+        while self._heap:
+            next_due, _, key = self._heap[0]
+            state = self._states.get(key)
+            if state is not None and state.next_due == next_due:
+                return next_due
+            heapq.heappop(self._heap)  # stale entry
+        return None
+
+    def record(self, key, previous, result, user_max_price: float = None):
+        """reschedule key after a poll. result is a Product, NOT_MODIFIED or None (failed)"""
+        state = self._states.get(key)
+        if state is None:
+            return  # stopped watching while the poll was in flight
+        self._in_flight.discard(key)
+
+        if result is None:
+            interval = state.interval * 2  # failures back off the same as stable keys, just faster
+        elif result is NOT_MODIFIED:
+            interval = state.interval * self.backoff
+        elif previous is None or (
+            result.in_stock != previous.in_stock
+            or result.on_sale != previous.on_sale
+            or result.sale_price != previous.sale_price
+        ):
+            interval = self.min_interval
+        else:
+            interval = state.interval * self.backoff
+
+        # price close to (or under) what the user wants to pay - keep a close eye on it
+        current = previous if result is NOT_MODIFIED else result
+        if user_max_price is not None and current is not None and current.sale_price is not None:
+            if current.sale_price <= user_max_price * NEAR_PRICE_RATIO:
+                interval = min(interval, self.min_interval * 2)
+
+        state.interval = min(max(interval, self.min_interval), self.max_interval)
+        state.next_due = self._aligned(key, time.time() + self._jittered(state.interval))
+        self._push(key, state)
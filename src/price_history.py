@@ -0,0 +1,145 @@
+# append only price history, one directory per (source, identifier) with one binary file per column
+#   ts.q        int64   unix time (seconds)
+#   sale.d      float64 sale price (nan if unknown)
+#   regular.d   float64 regular price (nan if unknown)
+#   stock.B     uint8   in stock flag
+# a row costs 25 bytes and appends never rewrite existing data, which suits sd card storage
+# timestamps never go backwards (appends are clamped to the last stored one, EG: after a pi without a
+# hardware clock boots with an old time), so time range queries are a bisect on the ts column
+import hashlib
+import math
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+
+from .db import STATE_DIR
+
+HISTORY_DIR = STATE_DIR / "history"
+
+COLUMNS = {  # file name -> array typecode
+    "ts.q": "q",
+    "sale.d": "d",
+    "regular.d": "d",
+    "stock.B": "B",
+}
+
+
+@dataclass
+class Series:
+    ts: array
+    sale_price: array
+    regular_price: array
+    in_stock: array
+
+    def __len__(self):
+        return len(self.ts)
+
+
+def _price(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+class PriceHistory:
+    def __init__(self, root: Path = HISTORY_DIR):
+        self.root = Path(root)
+
+    # identifiers can be urls, so series dirs are named by hash with the raw identifier saved alongside
+    def _series_dir(self, source: str, identifier: str) -> Path:
+        key = hashlib.blake2b(str(identifier).encode("utf-8"), digest_size=10).hexdigest()
+        return self.root / source / key
+
+    # an interrupted append can leave some columns one row longer than others
+    # cut them back to the shortest one so later rows stay aligned
+    @staticmethod
+    def _repair(path: Path):
+        sizes = {}
+        for name, typecode in COLUMNS.items():
+            file = path / name
+            sizes[name] = (file.stat().st_size if file.exists() else 0) // array(typecode).itemsize
+
+        rows = min(sizes.values())
+        for name, typecode in COLUMNS.items():
+            if sizes[name] != rows:
+                with open(path / name, "r+b") as f:
+                    f.truncate(rows * array(typecode).itemsize)
+
+    @staticmethod
+    def _last_ts(path: Path) -> int:
+        itemsize = array("q").itemsize
+        if not (path / "ts.q").exists():
+            return None
+        with open(path / "ts.q", "rb") as f:
+            f.seek(0, 2)
+            if f.tell() < itemsize:
+                return None
+            f.seek(-itemsize, 2)
+            return array("q", f.read(itemsize))[0]
+
+    def append_many(self, observations, ts: int = None):
+        """observations: iterable of (source, identifier, Product)"""
+        ts = int(ts if ts is not None else time.time())
+
+        for source, identifier, product in observations:
+            path = self._series_dir(source, identifier)
+            if not path.exists():
+                path.mkdir(parents=True)
+                (path / "identifier").write_text(str(identifier), encoding="utf-8")
+
+            self._repair(path)
+            last = self._last_ts(path)
+
+            row = {
+                "ts.q": ts if last is None else max(ts, last),  # the clock stepped back, keep ts sorted
+                "sale.d": _price(product.sale_price),
+                "regular.d": _price(product.regular_price),
+                "stock.B": int(bool(product.in_stock)),
+            }
+            for name, typecode in COLUMNS.items():
+                with open(path / name, "ab") as f:
+                    f.write(array(typecode, [row[name]]).tobytes())
+
+    def append(self, source: str, identifier: str, product, ts: int = None):
+        self.append_many([(source, identifier, product)], ts)
+
+    def series(self, source: str, identifier: str, start: int = None, end: int = None) -> Series:
+        """All observations with start <= ts <= end (either bound optional)"""
+        path = self._series_dir(source, identifier)
+
+        columns = {}
+        for name, typecode in COLUMNS.items():
+            col = array(typecode)
+            file = path / name
+            if file.exists():
+                col.frombytes(file.read_bytes())
+            columns[name] = col
+
+        # ignore a half written last row
+        n = min(len(col) for col in columns.values())
+
+        ts = columns["ts.q"]
+        lo = bisect_left(ts, start, 0, n) if start is not None else 0
+        hi = bisect_right(ts, end, 0, n) if end is not None else n
+
+        return Series(
+            ts=ts[lo:hi],
+            sale_price=columns["sale.d"][lo:hi],
+            regular_price=columns["regular.d"][lo:hi],
+            in_stock=columns["stock.B"][lo:hi],
+        )
+
+    def lowest_price(self, source: str, identifier: str, since: int = None, in_stock_only: bool = False) -> float:
+        """Lowest sale price since the given unix time (all time if None), or None without data"""
+        s = self.series(source, identifier, start=since)
+        prices = [
+            p for p, stocked in zip(s.sale_price, s.in_stock)
+            if not math.isnan(p) and (stocked or not in_stock_only)
+        ]
+        return min(prices) if prices else None
+
+    def lowest_price_in_days(self, source: str, identifier: str, days: float, **kwargs) -> float:
+        return self.lowest_price(source, identifier, since=int(time.time() - days * 86400), **kwargs)
+
+    def all_time_low(self, source: str, identifier: str, **kwargs) -> float:
+        return self.lowest_price(source, identifier, **kwargs)
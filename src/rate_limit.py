@@ -0,0 +1,138 @@
+# per source token buckets, shared by every worker (processes, threads and async tasks) through sqlite
+# a source gets `rate_limit` requests per second on average with bursts of up to `burst` (DataSource class
+# attributes, <NAME>_RPS / <NAME>_BURST override them, 0 = unlimited)
+#  * acquire() reserves a token and sleeps until it is due, so waiting workers are served in arrival order
+#    and the bucket is only touched once per request
+#  * pause() empties the bucket until a Retry-After has passed, for every worker at once. workers that were
+#    already waiting queue up again behind the pause instead of all going the moment it ends
+# the bucket is stored in state/notifier.db, so back to back cron runs share it too
+import asyncio
+import os
+import threading
+import time
+
+from . import db
+from .metrics import get_metrics
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT", "1") != "0"
+
+
+def limits(name: str, rate: float, burst: int) -> tuple[float, int]:
+    """(requests per second, burst) for source name, <NAME>_RPS / <NAME>_BURST win over the defaults"""
+    rate = float(os.getenv(f"{name.upper()}_RPS", rate or 0))
+    burst = int(os.getenv(f"{name.upper()}_BURST", burst or 1))
+    return rate, max(1, burst)
+
+
+class TokenBucket:
+    def __init__(self, name: str, rate: float, burst: int, path=db.DB_FILE):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._conn = db.connect(path)
+        self._lock = threading.Lock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limit (
+                source TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                paused_until REAL NOT NULL,
+                paused_at REAL NOT NULL
+            )
+        """)
+
+    def _update(self, change) -> tuple[float, float]:
+        """runs change(tokens, updated_at, paused_until, paused_at, now) -> (new row, wait) in one write
+        transaction, returns (now, wait)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")  # serialises every process on this source's row
+            try:
+                now = time.time()
+                row = self._conn.execute("SELECT tokens, updated_at, paused_until, paused_at FROM rate_limit "
+                                         "WHERE source = ?", (self.name,)).fetchone()
+                tokens, updated_at, paused_until, paused_at = row if row else (float(self.burst), now, 0.0, 0.0)
+
+                if now > updated_at:  # refill for the time since the last update (updated_at is in the future while paused)
+                    tokens, updated_at = min(float(self.burst), tokens + (now - updated_at) * self.rate), now
+
+                row, wait = change(tokens, updated_at, paused_until, paused_at, now)
+                self._conn.execute("INSERT OR REPLACE INTO rate_limit VALUES (?, ?, ?, ?, ?)", (self.name, *row))
+                self._conn.execute("COMMIT")
+                return now, wait
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _reserve(self) -> tuple[float, float]:
+        """take a token, returns (reserved at, seconds until it may be used)"""
+        def change(tokens, updated_at, paused_until, paused_at, now):
+            tokens -= 1
+            wait = max(0.0, updated_at - now) + (-tokens / self.rate if tokens < 0 else 0.0)
+            return (tokens, updated_at, paused_until, paused_at), wait
+
+        return self._update(change)
+
+    def _paused_since(self, reserved_at: float) -> bool:
+        """True if a pause came in after a reservation made at reserved_at, which is then void"""
+        with self._lock:
+            row = self._conn.execute("SELECT paused_at FROM rate_limit WHERE source = ?", (self.name,)).fetchone()
+        return row is not None and row[0] > reserved_at
+
+    def pause(self, seconds: float):
+        """no new requests for seconds (EG: a 429 with Retry-After), then start again from an empty bucket"""
+        def change(tokens, updated_at, paused_until, paused_at, now):
+            until = max(paused_until, now + seconds)
+            # reservations waiting right now are dropped, their workers reserve again once they wake up
+            return (0.0, max(updated_at, until), until, now), 0.0
+
+        self._update(change)
+        get_metrics().inc("rate_limit_pauses_total", source=self.name)
+
+    def _waited(self, seconds: float):
+        if seconds > 0:
+            get_metrics().observe("rate_limit_wait_seconds", seconds, source=self.name)
+
+    def acquire(self):
+        """block until this source may send another request"""
+        start = time.perf_counter()
+        reserved_at, wait = self._reserve()
+        while wait > 0:
+            time.sleep(wait)
+            if not self._paused_since(reserved_at):  # a Retry-After may have come in while we slept
+                break
+            reserved_at, wait = self._reserve()
+        self._waited(time.perf_counter() - start)
+
+    async def aacquire(self):
+        """acquire() for the event loop, waits dont block other tasks"""
+        # the sqlite transaction can sit on the busy timeout while other workers write, so it runs off the loop
+        start = time.perf_counter()
+        reserved_at, wait = await asyncio.to_thread(self._reserve)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            if not await asyncio.to_thread(self._paused_since, reserved_at):
+                break
+            reserved_at, wait = await asyncio.to_thread(self._reserve)
+        self._waited(time.perf_counter() - start)
+
+
+_buckets: dict[str, TokenBucket] = {}
+_buckets_pid: int = None
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, rate: float = 0, burst: int = 1) -> TokenBucket:
+    """name's bucket, None if the source is not rate limited"""
+    global _buckets, _buckets_pid
+
+    rate, burst = limits(name, rate, burst)
+    if not RATE_LIMIT_ENABLED or rate <= 0:
+        return None
+
+    # sqlite connections must not cross a fork, so each process opens its own (the bucket itself is shared)
+    with _buckets_lock:
+        if _buckets_pid != os.getpid():
+            _buckets, _buckets_pid = {}, os.getpid()
+        if name not in _buckets:
+            _buckets[name] = TokenBucket(name, rate, burst)
+        return _buckets[name]
@@ -0,0 +1,346 @@
+# one retry policy for every datasource (see DataSource.call_with_retry)
+#  * exponential backoff with jitter, Retry-After is honoured when the response has one
+#  * retry_if / retry_on decide which results and exceptions are worth another attempt (429 / 5xx, timeouts,
+#    challenge pages, missing page data...), anything else is returned / raised straight away
+#  * a per source retry budget: every first attempt earns RETRY_BUDGET_RATIO of a retry, so when a source
+#    starts failing across the board retries stop multiplying the load instead of tripling it
+#  * a circuit breaker: after BREAKER_THRESHOLD fetches in a row that failed even after retrying, the source
+#    is skipped (CircuitOpenError) for BREAKER_COOLDOWN seconds, then a single trial call decides whether to
+#    close it again. a retailer that is down costs one quick skip per identifier instead of retries + browser launches
+# budget and breaker are stored in state/notifier.db like the rate limit buckets, so every worker process (spawn
+# mode starts one per identifier) and back to back cron runs count against the same ones. a call that works
+# first time only reads them, deposits are buffered until the next write, anything else is one transaction
+import asyncio
+import atexit
+import logging
+import os
+import random
+import threading
+import time
+
+from . import db
+from .metrics import get_metrics
+
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", 3))  # attempts per call, including the first
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 1))  # seconds before the first retry, doubled each time
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 30))  # cap for backoff and Retry-After
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", 0.2))  # retries earned per first attempt
+RETRY_BUDGET_MIN = 10  # retries that are always available, so small sweeps can retry freely
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", 5))  # failed calls in a row that open the circuit
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", 300))  # seconds the circuit stays open
+BREAKER_TRIAL_TIMEOUT = float(os.getenv("BREAKER_TRIAL_TIMEOUT", 120))  # seconds until an unfinished trial is given up
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+# retry_if predicates - result -> reason to retry, or None if the result should be returned as is
+def retry_http(response) -> str:
+    """429 and 5xx responses"""
+    status = response.status_code
+    if status == 429 or status >= 500:
+        return f"HTTP {status}"
+    return None
+
+
+def retry_after(result) -> float:
+    """seconds from a Retry-After header (delay seconds form only), None if there isnt one"""
+    headers = getattr(result, "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryState:
+    """
+    a source's retry budget + circuit breaker rows in state/notifier.db, shared by every worker process like the
+    token buckets. both live behind one connection so a fetch settles them in a single write transaction
+    """
+
+    def __init__(self, name: str, path=db.DB_FILE):
+        self.name = name
+        self._conn = db.connect(path)
+        self._lock = threading.Lock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS retry_budget (
+                source TEXT PRIMARY KEY,
+                balance REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # opened_at = 0 while closed. trial_until = 0 unless a half open trial call is in flight somewhere,
+        # it expires so a worker that died mid trial cant keep the source skipped forever
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS circuit_breaker (
+                source TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL,
+                opened_at REAL NOT NULL,
+                trial_until REAL NOT NULL
+            )
+        """)
+
+    def execute(self, sql: str, *params):
+        return self._conn.execute(sql, (self.name, *params))
+
+    def read(self, sql: str):
+        """one row outside a transaction, for checks that usually mean there is nothing to write"""
+        with self._lock:
+            return self.execute(sql).fetchone()
+
+    def update(self, change):
+        """runs change(now) in one write transaction, returns what it returns"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")  # serialises every process on this source's rows
+            try:
+                result = change(time.time())
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+# budget and breaker only decide, their methods taking `now` run inside RetryState.update()
+class RetryBudget:
+    def __init__(self, state: RetryState, ratio: float = RETRY_BUDGET_RATIO, minimum: int = RETRY_BUDGET_MIN):
+        self.state = state
+        self.ratio = ratio
+        self.minimum = minimum
+        # deposits are only counted here and go to the db with the next write (see RetryPolicy._write), so a
+        # fetch that succeeds first time doesnt need a write transaction of its own
+        self.pending = 0.0
+        self._lock = threading.Lock()
+
+    def _balance(self) -> float:
+        row = self.state.execute("SELECT balance FROM retry_budget WHERE source = ?").fetchone()
+        return row[0] if row else float(self.minimum)
+
+    def _store(self, balance: float, now: float):
+        self.state.execute("INSERT OR REPLACE INTO retry_budget VALUES (?, ?, ?)", balance, now)
+
+    def deposit(self):
+        """called once per first attempt"""
+        with self._lock:
+            self.pending += self.ratio
+
+    def flush(self, now: float):
+        with self._lock:
+            pending, self.pending = self.pending, 0.0
+        if pending:
+            self._store(min(self._balance() + pending, self.minimum + 100 * self.ratio), now)
+
+    def withdraw(self, now: float) -> bool:
+        """take one retry, False when the budget is spent"""
+        if (balance := self._balance()) < 1:
+            return False
+        self._store(balance - 1, now)
+        return True
+
+
+class CircuitBreaker:
+    def __init__(self, state: RetryState, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN,
+                 trial_timeout: float = BREAKER_TRIAL_TIMEOUT):
+        self.state = state
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.trial_timeout = trial_timeout
+
+    def _row(self) -> tuple[int, float, float]:
+        row = self.state.execute("SELECT failures, opened_at, trial_until FROM circuit_breaker "
+                                 "WHERE source = ?").fetchone()
+        return row if row else (0, 0.0, 0.0)
+
+    def _store(self, failures: int, opened_at: float, trial_until: float):
+        self.state.execute("INSERT OR REPLACE INTO circuit_breaker VALUES (?, ?, ?, ?)",
+                           failures, opened_at, trial_until)
+
+    def closed(self) -> bool:
+        row = self.state.read("SELECT opened_at FROM circuit_breaker WHERE source = ?")
+        return row is None or not row[0]
+
+    def clean(self) -> bool:
+        """closed without failures on record, a successful call then has nothing to write"""
+        return self.state.read("SELECT failures, opened_at FROM circuit_breaker WHERE source = ?") in (None, (0, 0.0))
+
+    def trial_pending(self) -> bool:
+        row = self.state.read("SELECT trial_until FROM circuit_breaker WHERE source = ?")
+        return row is not None and bool(row[0])
+
+    def allow(self, now: float) -> bool:
+        failures, opened_at, trial_until = self._row()
+        if not opened_at:
+            return True
+        if now - opened_at < self.cooldown or trial_until > now:
+            return False
+        self._store(failures, opened_at, now + self.trial_timeout)  # half open: let exactly one call through
+        return True
+
+    def release(self, now: float):
+        """end a trial call without a verdict"""
+        failures, opened_at, _ = self._row()
+        self._store(failures, opened_at, 0.0)
+
+    def record(self, ok: bool, now: float) -> bool:
+        """returns True if this call opened the circuit"""
+        failures, opened_at, _ = self._row()
+        if ok:
+            self._store(0, 0.0, 0.0)
+            return False
+
+        failures += 1
+        if opened_at or failures >= self.threshold:
+            self._store(failures, now, 0.0)  # a failed trial keeps it open for another cooldown
+            return not opened_at
+        self._store(failures, 0.0, 0.0)
+        return False
+
+
+class RetryPolicy:
+    def __init__(self, name: str, attempts: int = RETRY_ATTEMPTS, base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY, state: RetryState = None):
+        self.name = name
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.state = state or RetryState(name)
+        self.budget = RetryBudget(self.state)
+        self.breaker = CircuitBreaker(self.state)
+        atexit.register(self._flush_deposits)  # spawn mode children make a single call, dont lose its deposit
+
+    def delay(self, attempt: int, result=None) -> float:
+        """wait before retry number attempt (1 based) - Retry-After if given, else backoff with equal jitter"""
+        if (seconds := retry_after(result)) is not None:
+            return min(seconds, self.max_delay)
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def _check(self, retry_if, result, error, retry_on) -> str:
+        if error is not None:
+            return f"{type(error).__name__}: {error}" if isinstance(error, retry_on) else None
+        return retry_if(result) if retry_if is not None else None
+
+    def _write(self, change):
+        """change(now) in one write transaction, together with the budget deposits buffered since the last one"""
+        def run(now):
+            self.budget.flush(now)
+            return change(now)
+
+        return self.state.update(run)
+
+    def _flush_deposits(self):
+        if self.budget.pending:
+            self._write(lambda now: None)
+
+    def _begin(self):
+        # a closed breaker is a plain read, the budget deposit waits for the next write. so a call that works
+        # first time costs no write transaction here at all
+        if not self.breaker.closed() and not self._write(self.breaker.allow):
+            raise CircuitOpenError(f"circuit open for {self.name}, skipped")
+        self.budget.deposit()
+        if self.budget.pending >= 1:  # a whole retry's worth, let other workers spend it
+            self._flush_deposits()
+
+    def _release(self):
+        if self.breaker.trial_pending():
+            self._write(self.breaker.release)
+
+    def _retry(self, attempt: int, reason: str, result, label, logger) -> float:
+        """delay before the next attempt, None if this was the last one"""
+        if attempt >= self.attempts:
+            return None
+        if not self._write(self.budget.withdraw):
+            logger.warning(f"[{label}] Retry budget for {self.name} spent, giving up after: {reason}")
+            return None
+
+        delay = self.delay(attempt, result)
+        get_metrics().inc("retries_total", source=self.name)
+        logger.info(f"[{label}] {reason}, retrying in {delay:.1f}s (attempt {attempt}/{self.attempts})")
+        return delay
+
+    def _finish(self, failed: bool, logger):
+        if not failed and self.breaker.clean():
+            return  # the common case, nothing to write
+        if self._write(lambda now: self.breaker.record(not failed, now)):
+            get_metrics().inc("circuit_opened_total", source=self.name)
+            logger.warning(f"{self.name} failed {self.breaker.threshold} time(s) in a row, "
+                           f"skipping it for {self.breaker.cooldown:.0f}s")
+
+    def call(self, fn, *args, retry_if=None, retry_on: tuple = (), logger: logging.Logger = None):
+        """
+        fn(*args) with retries. returns the last result once it is good or retries run out,
+        re-raises the last exception. raises CircuitOpenError without calling fn while the circuit is open
+        """
+        logger = logger or logging.getLogger(__name__)
+        label = args[0] if args else self.name
+        self._begin()
+
+        for attempt in range(1, self.attempts + 1):
+            result, error = None, None
+            try:
+                result = fn(*args)
+            except retry_on as e:
+                error = e
+            except BaseException:
+                self._release()  # not a failure we retry, so not one the breaker counts either
+                raise
+
+            if (reason := self._check(retry_if, result, error, retry_on)) is None:
+                self._finish(False, logger)
+                return result
+            if (delay := self._retry(attempt, reason, result, label, logger)) is None:
+                break
+            time.sleep(delay)
+
+        self._finish(True, logger)
+        if error is not None:
+            raise error
+        return result
+
+    async def acall(self, fn, *args, retry_if=None, retry_on: tuple = (), logger: logging.Logger = None):
+        """call() for coroutine functions, backoff waits and the budget / breaker sqlite writes dont block the loop"""
+        logger = logger or logging.getLogger(__name__)
+        label = args[0] if args else self.name
+        await asyncio.to_thread(self._begin)
+
+        for attempt in range(1, self.attempts + 1):
+            result, error = None, None
+            try:
+                result = await fn(*args)
+            except retry_on as e:
+                error = e
+            except BaseException:
+                # not a failure we retry, so not one the breaker counts either
+                await asyncio.to_thread(self._release)
+                raise
+
+            if (reason := self._check(retry_if, result, error, retry_on)) is None:
+                await asyncio.to_thread(self._finish, False, logger)
+                return result
+            if (delay := await asyncio.to_thread(self._retry, attempt, reason, result, label, logger)) is None:
+                break
+            await asyncio.sleep(delay)
+
+        await asyncio.to_thread(self._finish, True, logger)
+        if error is not None:
+            raise error
+        return result
+
+
+_policies: dict[str, RetryPolicy] = {}
+_policies_pid: int = None
+_policies_lock = threading.Lock()
+
+
+def get_retry_policy(name: str, attempts: int = None) -> RetryPolicy:
+    # one policy per source per process, each with its own sqlite connections (the budget + breaker rows are shared)
+    global _policies, _policies_pid
+    with _policies_lock:
+        if _policies_pid != os.getpid():
+            _policies, _policies_pid = {}, os.getpid()
+        if name not in _policies:
+            _policies[name] = RetryPolicy(name, attempts if attempts is not None else RETRY_ATTEMPTS)
+        return _policies[name]
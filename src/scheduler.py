@@ -0,0 +1,161 @@
+# global work queue for a sweep
+# every (source, identifier) pair from every watchlist item goes into one queue which is drained
+# by a bounded set of workers, with a separate concurrency cap per source
+import logging
+import multiprocessing
+import threading
+from collections import Counter, deque
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Job:
+    src_name: str
+    identifiers: tuple[str, ...]  # more than one for sources that can fetch in batches
+
+    @property
+    def name(self) -> str:
+        if len(self.identifiers) == 1:
+            return f"{self.src_name}-{self.identifiers[0]}"
+        return f"{self.src_name}-batch({len(self.identifiers)})"
+
+
+# group (source, identifier) pairs into jobs - one per identifier, or chunks for batch capable sources
+# duplicate pairs (same identifier watched by multiple items) are only fetched once
+def plan_jobs(pairs, batch_sizes: dict[str, int]) -> list[Job]:
+    by_source: dict[str, list[str]] = {}
+    for src_name, identifier in pairs:
+        ids = by_source.setdefault(src_name, [])
+        if identifier not in ids:
+            ids.append(identifier)
+
+    jobs = []
+    for src_name, ids in by_source.items():
+        size = max(1, batch_sizes.get(src_name, 1))
+        for i in range(0, len(ids), size):
+            jobs.append(Job(src_name, tuple(ids[i:i + size])))
+
+    return jobs
+
+
+# child process entry point - runs the job and ships the result back over a pipe
+def _spawn_target(conn, fn, args):
+    try:
+        conn.send((True, fn(*args)))
+    except BaseException as e:
+        conn.send((False, e))
+    finally:
+        conn.close()
+
+
+class SpawnExecutor(Executor):
+    """
+    Executor that starts a brand new process for every submitted call
+    No bound on its own - the sweep scheduler decides how many calls are in flight
+    """
+
+    def __init__(self):
+        self._threads: list[threading.Thread] = []
+        # spawned, not forked: a forked child leaves through os._exit, so atexit cleanups (browser pool,
+        # node sidecar, Xvfb) would never run and every child would leak its browsers / display
+        self._ctx = multiprocessing.get_context("spawn")
+
+    def submit(self, fn, /, *args, name: str = None):
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        parent_conn, child_conn = self._ctx.Pipe(duplex=False)
+        p = self._ctx.Process(
+            target=_spawn_target,
+            args=(child_conn, fn, args),
+            name=name,
+        )
+        p.start()
+        child_conn.close()  # only the child holds the write end now, so EOF means it died
+
+        t = threading.Thread(target=self._watch, args=(future, p, parent_conn), daemon=True)
+        t.start()
+        self._threads.append(t)
+
+        return future
+
+    @staticmethod
+    def _watch(future: Future, process: multiprocessing.Process, conn):
+        # read before join, otherwise a large result can block the child on a full pipe
+        try:
+            ok, value = conn.recv()
+        except EOFError:
+            ok, value = False, None
+        finally:
+            conn.close()
+
+        process.join()
+
+        if ok:
+            future.set_result(value)
+        elif value is not None:
+            future.set_exception(value)
+        else:
+            future.set_exception(RuntimeError(f"Process '{process.name}' (PID {process.pid}) exited with code {process.exitcode}"))
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        if wait:
+            for t in self._threads:
+                t.join()
+        self._threads.clear()
+
+
+class SweepScheduler:
+    def __init__(self, limits: dict[str, int], default_limit: int, max_workers: int, logger: logging.Logger = None):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.max_workers = max_workers
+        self.logger = logger or logging.getLogger(__name__)
+
+    def limit_for(self, src_name: str) -> int:
+        return self.limits.get(src_name, self.default_limit)
+
+    def run(self, jobs, submit, on_result):
+        """
+        submit(job) -> Future starts the job on some executor
+        on_result(job, result) is called in this thread as soon as each job finishes
+        """
+        pending = deque(jobs)
+        running: dict[Future, Job] = {}
+        active = Counter()
+
+        self.logger.info(f"Sweep queued {len(pending)} job(s), max {self.max_workers} worker(s)")
+
+        while pending or running:
+            # start as many queued jobs as the global and per source limits allow
+            # saturated sources go back to the end of the queue so they dont block other sources
+            for _ in range(len(pending)):
+                if len(running) >= self.max_workers:
+                    break
+
+                job = pending.popleft()
+                if active[job.src_name] >= self.limit_for(job.src_name):
+                    pending.append(job)
+                    continue
+
+                running[submit(job)] = job
+                active[job.src_name] += 1
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                job = running.pop(future)
+                active[job.src_name] -= 1
+
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.logger.error(f"Job {job.name} failed: {e}")
+                    continue
+
+                # one bad result must not cost the rest of the sweep
+                try:
+                    on_result(job, result)
+                except Exception as e:
+                    self.logger.error(f"Handling result of job {job.name} failed: {type(e).__name__}: {e}")
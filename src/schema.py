@@ -1,8 +1,16 @@
-from dataclasses import dataclass
+import math
+import struct
+from dataclasses import dataclass, field
+
+# binary layout: version, flags, sale price, regular price, byte length of each string field, then the utf-8 strings
+_HEADER = struct.Struct("<BBdd5I")
+_VERSION = 1
+_IN_STOCK, _ON_SALE, _NO_SALE_PRICE, _NO_REGULAR_PRICE = 1, 2, 4, 8
 
 
 # class for explicit shape
-@dataclass
+# slotted + frozen so instances are small and safe to share, savings are worked out once on creation
+@dataclass(frozen=True, slots=True)
 class Product:
     identifier: str  # EG: sku, asin code. etc.
     product_name: str
@@ -14,17 +22,74 @@ class Product:
     retailer_name: str
     retailer_logo: str  # retailer logo url
 
-    @property
-    def dollar_savings(self) -> float:
-        if not self.on_sale:
-            return 0.0
-        return self.regular_price - self.sale_price
+    dollar_savings: float = field(init=False, repr=False, compare=False)
+    percent_savings: float = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        dollar_savings = percent_savings = 0.0
+        if self.on_sale and self.sale_price is not None and self.regular_price is not None:
+            dollar_savings = self.regular_price - self.sale_price
+            if self.regular_price != 0:
+                percent_savings = round(dollar_savings / self.regular_price * 100, 1)
+
+        object.__setattr__(self, "dollar_savings", dollar_savings)
+        object.__setattr__(self, "percent_savings", percent_savings)
+
+    # pickle only the constructor args, derived fields are rebuilt on load
+    def __reduce__(self):
+        return self.__class__, self.fields()
+
+    def fields(self) -> tuple:
+        """constructor args in order"""
+        return (self.identifier, self.product_name, self.in_stock, self.on_sale, self.sale_price,
+                self.regular_price, self.product_url, self.retailer_name, self.retailer_logo)
+
+    def to_dict(self) -> dict:
+        return dict(zip(FIELDS, self.fields()))
+
+    def encode(self) -> bytes:
+        strings = [(s or "").encode("utf-8") for s in (
+            self.identifier, self.product_name, self.product_url, self.retailer_name, self.retailer_logo
+        )]
+        flags = (
+            (_IN_STOCK if self.in_stock else 0)
+            | (_ON_SALE if self.on_sale else 0)
+            | (_NO_SALE_PRICE if self.sale_price is None else 0)
+            | (_NO_REGULAR_PRICE if self.regular_price is None else 0)
+        )
+        header = _HEADER.pack(
+            _VERSION, flags,
+            math.nan if self.sale_price is None else self.sale_price,
+            math.nan if self.regular_price is None else self.regular_price,
+            *(len(s) for s in strings),
+        )
+        return header + b"".join(strings)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "Product":
+        version, flags, sale_price, regular_price, *lengths = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported Product encoding version {version}")
+
+        data = bytes(data)  # sqlite hands back bytes already, this only copies memoryviews
+        strings = []
+        offset = _HEADER.size
+        for length in lengths:
+            strings.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+        identifier, product_name, product_url, retailer_name, retailer_logo = strings
+
+        return cls(
+            identifier, product_name,
+            bool(flags & _IN_STOCK), bool(flags & _ON_SALE),
+            None if flags & _NO_SALE_PRICE else sale_price,
+            None if flags & _NO_REGULAR_PRICE else regular_price,
+            product_url, retailer_name, retailer_logo,
+        )
+
 
-    @property
-    def percent_savings(self) -> float:
-        if not self.on_sale or self.regular_price == 0:
-            return 0.0
-        return round(self.dollar_savings / self.regular_price * 100, 1)
+FIELDS = ("identifier", "product_name", "in_stock", "on_sale", "sale_price",
+          "regular_price", "product_url", "retailer_name", "retailer_logo")  # constructor args, in order
 
 
 if __name__ == "__main__":
@@ -43,3 +108,4 @@ if __name__ == "__main__":
 
     print(p.dollar_savings)
     print(p.percent_savings)
+    print(Product.decode(p.encode()) == p)
@@ -1,16 +1,22 @@
-import requests
 from dotenv import load_dotenv
 import os
 
+from . import http_client
+from .endpoints import base_url, rebase
+
 load_dotenv()
 
+# topics are full urls, NTFY_BASE_URL moves them all onto a stand in
+NTFY_BASE_URL = base_url("NTFY")
+
 
-def post_ntfy(body, product_url, retailer_name, retailer_logo_url, ntfy_topic):
-    requests.post(
-        ntfy_topic,
-        data=body,
+# returns the response so callers can check status / retry
+def post_ntfy(body, product_url, retailer_name, retailer_logo_url, ntfy_topic, title=None):
+    return http_client.post(
+        rebase(ntfy_topic, NTFY_BASE_URL),
+        data=body.encode("utf-8"),
         headers={
-            "Title": f"{retailer_name} Alert",
+            "Title": title or f"{retailer_name} Alert",
             "Priority": "default",
             "Tags": "loudspeaker",
             "Icon": retailer_logo_url,
@@ -21,7 +27,7 @@ def post_ntfy(body, product_url, retailer_name, retailer_logo_url, ntfy_topic):
 
 
 def ntfy_delete(topic: str, sequence_id: str):  # feature still in development
-    return requests.delete(f"https://ntfy.sh/{topic}/{sequence_id}")
+    return http_client.delete(f"{NTFY_BASE_URL or 'https://ntfy.sh'}/{topic}/{sequence_id}")
 
 
 if __name__ == "__main__":
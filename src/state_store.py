@@ -0,0 +1,76 @@
+# last seen Product snapshot per (source, identifier), so notifications only fire when something changes
+# read once at the start of a sweep and written back in one transaction at the end
+import json
+import time
+
+from . import db, fetch_cache
+from .schema import FIELDS, Product
+
+
+def _decode(snapshot) -> Product:
+    if isinstance(snapshot, bytes):
+        return Product.decode(snapshot)
+    data = json.loads(snapshot)  # snapshot written before the binary encoding
+    return Product(*(data[name] for name in FIELDS))
+
+
+class StateStore:
+    def __init__(self, path=db.DB_FILE):
+        self._conn = db.connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS product_state (
+                source TEXT NOT NULL,
+                identifier TEXT NOT NULL,
+                snapshot BLOB NOT NULL,  -- Product.encode(), older rows are json text
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (source, identifier)
+            )
+        """)
+        fetch_cache.create_table(self._conn)
+
+    def load_all(self) -> dict[tuple[str, str], Product]:
+        rows = self._conn.execute("SELECT source, identifier, snapshot FROM product_state").fetchall()
+        return {(source, identifier): _decode(snapshot) for source, identifier, snapshot in rows}
+
+    def load_versions(self) -> dict[tuple[str, str], float]:
+        """when each snapshot was last saved"""
+        rows = self._conn.execute("SELECT source, identifier, updated_at FROM product_state").fetchall()
+        return {(source, identifier): updated_at for source, identifier, updated_at in rows}
+
+    def save_many(self, snapshots: dict[tuple[str, str], Product], payloads: dict = None) -> float:
+        """
+        payloads: (source, identifier) -> (digest, etag, last_modified) of the responses the snapshots came from
+        written in the same transaction, so a payload is never marked as seen without its snapshot
+        returns the updated_at the rows were saved with
+        """
+        now = time.time()
+        if not snapshots and not payloads:
+            return now
+
+        with self._conn:  # one transaction for the whole sweep
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO product_state VALUES (?, ?, ?, ?)",
+                [(source, str(identifier), product.encode(), now) for (source, identifier), product in snapshots.items()],
+            )
+            if payloads:
+                fetch_cache.store_many(self._conn, payloads, now)
+        return now
+
+    def close(self):
+        self._conn.close()
+
+
+# what changed between the last snapshot and the current product, or None if nothing worth a notification
+def detect_transition(previous: Product, current: Product) -> str:
+    if not current.in_stock:
+        return None
+    if previous is None:
+        return "first seen in stock"
+    if not previous.in_stock:
+        return "back in stock"
+    if current.on_sale and not previous.on_sale:
+        return "sale started"
+    if current.sale_price is not None and previous.sale_price is not None and current.sale_price < previous.sale_price:
+        return f"price dropped from ${previous.sale_price:.2f}"
+    return None
@@ -0,0 +1,260 @@
+# products to track can live in a watchlist file (toml, yaml or json) instead of the built in list in main.py
+# the file is validated and compiled into a Watchlist, which indexes every item by (source, identifier),
+# source and ntfy topic. the daemon watches the file's mtime and on change diffs the old and new watchlists
+# so only identifiers that were added, dropped or edited get rescheduled
+import hashlib
+import json
+import logging
+import os
+import tomllib
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .db import BASE_DIR
+
+WATCHLIST_FILES = ("watchlist.toml", "watchlist.yaml", "watchlist.yml", "watchlist.json")  # looked up in this order
+ITEM_KEYS = {"name", "identifiers", "user_max_price", "ntfy_topic"}
+
+
+class WatchlistError(ValueError):
+    pass
+
+
+def default_watchlist_file() -> Path:
+    if path := os.getenv("WATCHLIST_FILE"):
+        return Path(path)
+
+    for name in WATCHLIST_FILES:
+        if (BASE_DIR / name).exists():
+            return BASE_DIR / name
+
+    return BASE_DIR / WATCHLIST_FILES[0]
+
+
+@dataclass(frozen=True)
+class WatchItem:
+    id: str  # stable across reloads and reorders, notifications for one item are coalesced under it
+    identifiers: tuple[tuple[str, str], ...]  # (source, identifier) pairs
+    user_max_price: float | None
+    ntfy_topic: str
+    name: str | None = None
+
+
+@dataclass
+class WatchlistDiff:
+    added: set = field(default_factory=set)  # (source, identifier) keys nobody watched before
+    removed: set = field(default_factory=set)  # keys nobody watches anymore
+    changed: set = field(default_factory=set)  # keys still watched, but by different / edited items
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+class Watchlist:
+    def __init__(self, items: list[WatchItem] = ()):
+        self.items: dict[str, WatchItem] = {}
+        self.by_key: dict[tuple[str, str], list[WatchItem]] = {}
+        self.by_source: dict[str, list[str]] = {}
+        self.by_topic: dict[str, list[WatchItem]] = {}
+
+        for item in items:
+            self.items[item.id] = item
+            self.by_topic.setdefault(item.ntfy_topic, []).append(item)
+
+            for key in item.identifiers:
+                if key not in self.by_key:
+                    self.by_source.setdefault(key[0], []).append(key[1])
+                self.by_key.setdefault(key, []).append(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+    def sources(self) -> set[str]:
+        return set(self.by_source)
+
+    def keys(self, sources=None) -> list[tuple[str, str]]:
+        """every watched (source, identifier), optionally only for the given sources"""
+        return [key for key in self.by_key if sources is None or key[0] in sources]
+
+    def watchers(self, key) -> list[WatchItem]:
+        return self.by_key.get(key, [])
+
+    def user_max_price(self, key) -> float | None:
+        """tightest max price of all items watching key"""
+        prices = [item.user_max_price for item in self.watchers(key) if item.user_max_price is not None]
+        return min(prices) if prices else None
+
+    def diff(self, old: "Watchlist") -> WatchlistDiff:
+        """what changed going from old to this watchlist, per (source, identifier)"""
+        diff = WatchlistDiff(
+            added=self.by_key.keys() - old.by_key.keys(),
+            removed=old.by_key.keys() - self.by_key.keys(),
+        )
+
+        # a key only counts as changed if what its items want from it changed,
+        # not when another identifier was added to / removed from one of them
+        for key in self.by_key.keys() & old.by_key.keys():
+            if _requirements(self.by_key[key]) != _requirements(old.by_key[key]):
+                diff.changed.add(key)
+
+        return diff
+
+
+# what the items watching one key want from it. item ids are left out on purpose: an unnamed item's id hashes
+# all its identifiers, so it changes whenever an identifier is added to / removed from the item
+def _requirements(items: list[WatchItem]):
+    return sorted((item.user_max_price or 0.0, item.ntfy_topic) for item in items)
+
+
+def _item_id(identifiers, topic) -> str:
+    raw = "\x1f".join([topic, *(f"{source}:{identifier}" for source, identifier in sorted(identifiers))])
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _validate_item(raw, where: str, default_topic: str, known_sources, errors: list[str]) -> WatchItem:
+    if not isinstance(raw, dict):
+        errors.append(f"{where}: expected a table / mapping, got {type(raw).__name__}")
+        return None
+
+    if unknown := raw.keys() - ITEM_KEYS:
+        errors.append(f"{where}: unknown key(s) {', '.join(sorted(unknown))}")
+
+    name = raw.get("name")
+    if name is not None and not isinstance(name, str):
+        errors.append(f"{where}.name: expected a string")
+
+    identifiers = raw.get("identifiers")
+    pairs = []
+    if not isinstance(identifiers, dict) or not identifiers:
+        errors.append(f"{where}.identifiers: expected a non empty mapping of source -> identifier")
+    else:
+        for source, identifier in identifiers.items():
+            if known_sources is not None and source not in known_sources:
+                errors.append(f"{where}.identifiers: unknown source '{source}' (known: {', '.join(sorted(known_sources))})")
+            elif isinstance(identifier, int) and not isinstance(identifier, bool):
+                pairs.append((source, str(identifier)))  # numeric skus in json / yaml / toml
+            elif isinstance(identifier, str) and identifier.strip():
+                pairs.append((source, identifier.strip()))
+            else:
+                errors.append(f"{where}.identifiers.{source}: expected a non empty string")
+
+    price = raw.get("user_max_price")
+    if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float)) or price <= 0):
+        errors.append(f"{where}.user_max_price: expected a positive number or null")
+
+    # items without a topic go to the default one from .env
+    topic = raw.get("ntfy_topic") or default_topic
+    if not isinstance(topic, str) or not topic.startswith(("http://", "https://")):
+        errors.append(f"{where}.ntfy_topic: expected a full ntfy url (no default, NTFY_TOPIC_URL is not set)"
+                      if topic is None else f"{where}.ntfy_topic: expected a full ntfy url, got {topic!r}")
+
+    if len(pairs) != len(identifiers or ()) or errors:
+        return None
+
+    return WatchItem(
+        id=name or _item_id(pairs, topic),
+        identifiers=tuple(sorted(pairs)),
+        user_max_price=float(price) if price is not None else None,
+        ntfy_topic=topic,
+        name=name,
+    )
+
+
+def compile_watchlist(raw, known_sources=None) -> Watchlist:
+    """
+    validate raw watchlist data (a list of items, or a mapping with a 'products' list) and index it
+    raises WatchlistError listing every problem found
+    """
+    if isinstance(raw, dict) and set(raw) == {"products"}:
+        raw = raw["products"]
+    if not isinstance(raw, list):
+        raise WatchlistError("watchlist must be a list of products (or a 'products' list / [[products]] tables)")
+
+    default_topic = os.getenv("NTFY_TOPIC_URL") or None
+    errors = []
+    items = []
+    for i, raw_item in enumerate(raw):
+        item_errors = []
+        item = _validate_item(raw_item, f"products[{i}]", default_topic, known_sources, item_errors)
+        errors.extend(item_errors)
+        if item is not None:
+            items.append(item)
+
+    seen = {}
+    for item in items:
+        if item.id in seen:
+            errors.append(f"duplicate product {'name' if item.name else 'entry'} '{item.name or item.id}'")
+        seen[item.id] = item
+
+    if errors:
+        raise WatchlistError("invalid watchlist:\n  " + "\n  ".join(errors))
+
+    return Watchlist(items)
+
+
+def read_watchlist(path: Path):
+    """raw data from a .toml, .yaml / .yml or .json file"""
+    path = Path(path)
+    suffix = path.suffix.lower()
+
+    if suffix == ".toml":
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+
+    if suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise WatchlistError(f"{path.name}: PyYAML is needed for yaml watchlists (pip install pyyaml)") from None
+
+        with open(path, encoding="utf-8") as f:
+            try:
+                return yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise WatchlistError(f"{path.name}: {e}") from None
+
+    if suffix == ".json":
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    raise WatchlistError(f"{path.name}: unsupported watchlist format, use .toml, .yaml or .json")
+
+
+class WatchlistFile:
+    def __init__(self, path: Path = None, fallback=None, known_sources=None, logger: logging.Logger = None):
+        """fallback: raw watchlist used while there is no file"""
+        self.path = Path(path) if path is not None else default_watchlist_file()
+        self.fallback = fallback or []
+        self.known_sources = known_sources
+        self.logger = logger or logging.getLogger(__name__)
+        self._mtime = None
+
+    def _stat(self):
+        try:
+            return self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> Watchlist:
+        """current watchlist - the fallback list when there is no file"""
+        self._mtime = self._stat()
+        if self._mtime is None:
+            return compile_watchlist(self.fallback, self.known_sources)
+
+        watchlist = compile_watchlist(read_watchlist(self.path), self.known_sources)
+        self.logger.info(f"Loaded {len(watchlist)} watchlist item(s) from {self.path}")
+        return watchlist
+
+    def reload_if_changed(self) -> Watchlist:
+        """new watchlist if the file changed since the last load, else None. a broken file keeps the old list"""
+        if self._stat() == self._mtime:
+            return None
+
+        try:
+            return self.load()
+        except (OSError, ValueError) as e:  # WatchlistError, json / toml / yaml errors are all ValueErrors
+            self.logger.error(f"Could not reload watchlist from {self.path}, keeping the current one: {e}")
+            return None
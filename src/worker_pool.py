@@ -0,0 +1,57 @@
+# long lived worker pool
+# each worker sets up its logger, imports the datasources it will need and builds the DataSource instances once,
+# then handles many identifiers over its life (instead of one fresh process per identifier)
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .log_handler import init_child_logger
+from .datasources.registry import SourceRegistry
+from .metrics import get_metrics
+
+DEFAULT_MAX_TASKS_PER_CHILD = 50  # recycle workers every N identifiers in case a datasource leaks
+
+_logger: logging.Logger = None
+
+
+# manifest: source name -> module path for every source this pool's jobs use
+def _init_worker(log_queue, manifest):
+    global _logger
+
+    pid = os.getpid()
+    _logger = init_child_logger(log_queue, f"bestbuy-notifier.worker.{pid}")
+
+    SourceRegistry.set_logger(_logger)
+
+    for src_name, module_name in manifest.items():
+        SourceRegistry.declare(src_name, module_name)
+    SourceRegistry.load(manifest)
+
+    _logger.info(f"[PID {pid}] Worker started with datasources: {list(SourceRegistry.all().keys())}")
+
+
+# task func - registry is already populated by _init_worker so this is only the fetch
+# returns (products, metrics recorded since the last task) so the parent can merge this worker's timings
+def fetch_identifiers(src_name: str, identifiers: tuple[str, ...]) -> tuple[dict, dict]:
+    pid = os.getpid()
+
+    if src_name not in SourceRegistry.all():
+        _logger.error(f"[PID {pid}] Datasource '{src_name}' is not registered in this worker")
+        return {}, get_metrics().snapshot(reset=True)
+
+    _logger.info(f"[PID {pid}] Processing: {src_name} | {', '.join(identifiers)}")
+
+    products = SourceRegistry.get(src_name).fetch_products(identifiers)
+    return products, get_metrics().snapshot(reset=True)
+
+
+def make_pool(log_queue, manifest: dict[str, str], max_workers: int, max_tasks_per_child: int = DEFAULT_MAX_TASKS_PER_CHILD) -> ProcessPoolExecutor:
+    # max_tasks_per_child cant be used with fork, so workers are always spawned
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(log_queue, dict(manifest)),
+        max_tasks_per_child=max_tasks_per_child or None,
+    )